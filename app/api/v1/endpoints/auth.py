@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core import deps
-from app.core.security import verify_password, get_password_hash
+from app.core.security import password_hasher
 from app.models.user import User as UserModel
 from app.schemas.user import UserCreate, User, UserLogin
 
@@ -21,20 +22,31 @@ router = APIRouter()
                          }
                      }
                  },
+                 503: {
+                     "description": "Too many password hashes in progress",
+                     "content": {
+                         "application/json": {
+                             "example": {
+                                 "detail": "Server is busy, please retry"
+                             }
+                         }
+                     }
+                 },
              }
              )
 async def register(
         *,
-        db: Session = Depends(deps.get_db),
+        db: AsyncSession = Depends(deps.get_db),
         user_in: UserCreate
 ):
     """
     Register a new user: Check if username/email exists, hash the password, and create a user.
     """
     # Check if the username or email already exists
-    existing_user = db.query(UserModel).filter(
+    result = await db.execute(select(UserModel).where(
         (UserModel.username == user_in.username) | (UserModel.email == user_in.email)
-    ).first()
+    ).limit(1))
+    existing_user = result.scalar_one_or_none()
 
     if existing_user:
         raise HTTPException(
@@ -42,8 +54,8 @@ async def register(
             detail="Username or email already exists"
         )
 
-    # Hash the password
-    hashed_password = get_password_hash(user_in.password)
+    # Hash the password on the password hasher pool, off the event loop
+    hashed_password = await password_hasher.hash(user_in.password)
 
     # Create a new user instance
     new_user = UserModel(
@@ -55,8 +67,8 @@ async def register(
 
     # Add the user to the database
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
@@ -67,17 +79,20 @@ async def register(
     401: {"description": "Invalid password",
           "content": {"application/json": {"example": {"detail": "Invalid password"}}}},
     404: {"description": "User not found", "content": {"application/json": {"example": {"detail": "User not found"}}}},
+    503: {"description": "Too many password checks in progress",
+          "content": {"application/json": {"example": {"detail": "Server is busy, please retry"}}}},
 })
 async def login(
         request: Request,
         response: Response,
         user_in: UserLogin,
-        db: Session = Depends(deps.get_db)
+        db: AsyncSession = Depends(deps.get_db)
 ):
     """
     Login a user using their username and password, set user_id in session.
     """
-    user = db.query(UserModel).filter(UserModel.username == user_in.username).first()
+    result = await db.execute(select(UserModel).where(UserModel.username == user_in.username))
+    user = result.scalar_one_or_none()
 
     if not user:
         raise HTTPException(
@@ -85,12 +100,18 @@ async def login(
             detail="User not found"
         )
 
-    if not verify_password(user_in.password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(user_in.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid password"
         )
 
+    # The hash was made with outdated parameters (e.g. a lower cost factor): store the rehashed password
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
     # Store the user ID in the session to track the logged-in user
     request.session["user_id"] = user.id
     response.status_code = status.HTTP_200_OK
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.api.v1.pagination import Page
 from app.core import deps
-from app.schemas.cluster import Cluster, ClusterCreate
-from app.models.user import User
+from app.schemas.cluster import Cluster, ClusterCreate, ClusterListItem
+from app.core.principal import Principal
 from app.models.cluster import Cluster as ClusterModel  # Import the Cluster model
 
 router = APIRouter()
@@ -14,21 +16,21 @@ router = APIRouter()
 })
 async def create_cluster(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     cluster_in: ClusterCreate,
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     """
     Create a new cluster associated with the current user.
     """
     # Check if the user has an active organization
-    if not current_user.org_member:
+    if current_user.organization_id is None:
         raise HTTPException(
             status_code=400,
             detail="User is not part of any organization"
         )
 
-    current_user_org_id = current_user.org_member.organization_id
+    current_user_org_id = current_user.organization_id
 
     # Create a new Cluster instance with the provided resources and limits
     cluster = ClusterModel(
@@ -39,36 +41,46 @@ async def create_cluster(
         cpu_available=cluster_in.cpu_limit,  # Initially, all resources are available
         ram_available=cluster_in.ram_limit,
         gpu_available=cluster_in.gpu_limit,
+        fair_share=cluster_in.fair_share,
         organization_id=current_user_org_id,  # Assign the current user's organization ID
     )
 
     db.add(cluster)
-    db.commit()
-    db.refresh(cluster)  # Refresh the cluster to get the ID and other database-generated fields
+    await db.commit()
+    await db.refresh(cluster)  # Refresh the cluster to get the ID and other database-generated fields
 
     return cluster
 
 
-@router.get("/", response_model=List[Cluster], responses={
-    200: {"description": "List of clusters for the user's organization", "content": {"application/json": {"example": [{"id": 1, "name": "Cluster1", "cpu_limit": 4, "ram_limit": 16, "gpu_limit": 1, "organization_id": 1}]}}},
+@router.get("/", response_model=List[ClusterListItem], response_model_exclude_unset=True, responses={
+    200: {"description": "Page of clusters for the user's organization. A `Link` header points to the next page, if any.", "content": {"application/json": {"example": [{"id": 1, "name": "Cluster1", "cpu_limit": 4, "ram_limit": 16, "gpu_limit": 1, "organization_id": 1}]}}},
     400: {"description": "User is not part of any organization", "content": {"application/json": {"example": {"detail": "User is not part of any organization"}}}}
 })
 async def list_clusters(
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user)
+    request: Request,
+    response: Response,
+    page: Page = Depends(),
+    name_prefix: Optional[str] = Query(None, description="Only clusters whose name starts with this prefix"),
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     """
-    List all clusters associated with the current user's organization.
+    List the clusters associated with the current user's organization, one page at a time, by increasing ID.
     """
     # Check if the user has an active organization
-    if not current_user.org_member:
+    if current_user.organization_id is None:
         raise HTTPException(
             status_code=400,
             detail="User is not part of any organization"
         )
 
-    # Retrieve clusters for the user's organization
-    clusters = db.query(ClusterModel).filter(ClusterModel.organization_id == current_user.org_member.organization_id).all()
+    # Retrieve a page of clusters for the user's organization
+    query = page.select_columns(ClusterModel, ClusterListItem).where(
+        ClusterModel.organization_id == current_user.organization_id
+    )
+    if name_prefix:
+        query = query.where(ClusterModel.name.startswith(name_prefix, autoescape=True))
+    clusters = page.rows(request, response, (await db.execute(query)).mappings().all())
 
     # if not clusters:
     #     raise HTTPException(
@@ -1,14 +1,22 @@
-from typing import List
+from typing import Iterable, List, Optional, Set
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from app.api.v1.export import ExportFormat, stream_rows
+from app.api.v1.pagination import Page, parse_fields
 from app.core import deps
+from app.core.config import settings
+from app.core.principal import Principal
+from app.core.units import in_decimal
 from app.models.cluster import Cluster
 from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus, valid_state_transitions
-from app.models.user import User
-from app.schedulers.scheduler_interface import Scheduler
-from app.schemas.deployment import Deployment, DeploymentCreate, DeploymentStatusUpdate
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.dependency_graph import DependencyCycle, topological_order
+from app.schemas.deployment import (Deployment, DeploymentBatchCreate, DeploymentBatchResult, DeploymentCreate,
+                                    DeploymentListItem, DeploymentStatusUpdate)
 
 # Connect to Redis
 # redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
@@ -17,55 +25,263 @@ from app.schemas.deployment import Deployment, DeploymentCreate, DeploymentStatu
 router = APIRouter()
 
 
+class DeploymentFilters:
+    """
+    Filters shared by the deployment listing and export, applied by the database.
+    """
+
+    def __init__(
+            self,
+            deployment_status: Optional[DeploymentStatus] = Query(None, alias="status"),
+            cluster_id: Optional[int] = None,
+            min_priority: Optional[int] = None,
+            max_priority: Optional[int] = None,
+            name_prefix: Optional[str] = Query(None, description="Only deployments whose name starts with this prefix"),
+    ):
+        self.deployment_status = deployment_status
+        self.cluster_id = cluster_id
+        self.min_priority = min_priority
+        self.max_priority = max_priority
+        self.name_prefix = name_prefix
+
+    def apply(self, query: Select, organization_id: int) -> Select:
+        query = query.join(Cluster).where(Cluster.organization_id == organization_id)
+        if self.deployment_status is not None:
+            query = query.where(DeploymentModel.status == self.deployment_status)
+        if self.cluster_id is not None:
+            query = query.where(DeploymentModel.cluster_id == self.cluster_id)
+        if self.min_priority is not None:
+            query = query.where(DeploymentModel.priority >= self.min_priority)
+        if self.max_priority is not None:
+            query = query.where(DeploymentModel.priority <= self.max_priority)
+        if self.name_prefix:
+            query = query.where(DeploymentModel.name.startswith(self.name_prefix, autoescape=True))
+        return query
+
+
+async def _existing_deployment_ids(db: AsyncSession, deployment_ids: Iterable[int]) -> Set[int]:
+    deployment_ids = set(deployment_ids)
+    if not deployment_ids:
+        return set()
+    return set(await db.scalars(select(DeploymentModel.id).where(DeploymentModel.id.in_(deployment_ids))))
+
+
 @router.post("/", response_model=Deployment, responses={
     200: {"description": "Deployment created successfully", "content": {"application/json": {"example": {"id": 1, "name": "Deployment1", "docker_image": "my_image", "cpu_required": 2, "ram_required": 4, "gpu_required": 1, "priority": 1, "status": "running", "cluster_id": 1}}}},
-    404: {"description": "Cluster not found", "content": {"application/json": {"example": {"detail": "Cluster not found"}}}},
+    400: {"description": "No cluster of the organization can hold the deployment", "content": {"application/json": {"example": {"detail": "No cluster of the organization is large enough for the deployment"}}}},
+    401: {"description": "Not authenticated, when the cluster is chosen from the user's organization", "content": {"application/json": {"example": {"detail": "Not authenticated"}}}},
+    404: {"description": "Cluster or dependency not found", "content": {"application/json": {"example": {"detail": "Cluster not found"}}}},
 })
 async def create_deployment(
         *,
-        db: Session = Depends(deps.get_db),
+        db: AsyncSession = Depends(deps.get_db),
         deployment_in: DeploymentCreate,
-        scheduler: Scheduler = Depends(deps.get_scheduler)
-
+        scheduler: AsyncScheduler = Depends(deps.get_scheduler),
+        current_user: Optional[Principal] = Depends(deps.get_optional_user)
 ):
     """
     Create a deployment and add it to a cluster if resources are available.
     If not, queue the deployment for scheduling later, with preemption for high-priority deployments.
+    A deployment with dependencies (`depends_on`) stays pending until all of them have completed.
+
+    Without `cluster_id`, the deployment is placed on a cluster of the authenticated user's organization
+    chosen by the configured placement strategy (best fit by default). If no cluster has room right now, it
+    is queued on the least loaded cluster large enough for it.
+
+    Deployments record the authenticated user who submitted them, if any, which the fair_share scheduling
+    policy uses to share clusters between users.
+
+    When scheduling is dispatched in the background (opt-in with `SCHEDULER_DISPATCH`), the deployment is
+    returned as pending and started, queued or left to preempt others shortly after the response.
     """
-    # Check if the cluster exists
-    cluster = db.query(Cluster).filter(Cluster.id == deployment_in.cluster_id).first()
-    if not cluster:
+    user_id = current_user.id if current_user is not None else None
+    cluster = None
+    if deployment_in.cluster_id is not None:
+        # Check if the cluster exists
+        cluster = await db.get(Cluster, deployment_in.cluster_id)
+        if not cluster:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Cluster not found"
+            )
+
+    # A new deployment cannot be a dependency yet, so its dependencies cannot form a cycle
+    missing = set(deployment_in.depends_on) - await _existing_deployment_ids(db, deployment_in.depends_on)
+    if missing:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Cluster not found"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Dependencies not found: {', '.join(map(str, sorted(missing)))}"
         )
 
+    if cluster is None:
+        # Placement needs to know whose clusters to choose from
+        if current_user is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+        if not current_user.organization_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="User is not part of any organization"
+            )
+        deployment = await scheduler.schedule_in_organization(db, current_user.organization_id, deployment_in,
+                                                              user_id=user_id)
+        if deployment is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No cluster of the organization is large enough for the deployment"
+            )
+        return deployment
+
     # Use the scheduler to handle deployment
-    deployment = scheduler.schedule(db, cluster, deployment_in)
+    deployment = await scheduler.schedule(db, cluster, deployment_in, user_id=user_id)
     return deployment
 
 
-@router.get("/", response_model=List[Deployment], responses={
-    200: {"description": "List of deployments for the user's organization", "content": {"application/json": {"example": [{"id": 1, "name": "Deployment1", "docker_image": "my_image", "cpu_required": 2, "ram_required": 4, "gpu_required": 1, "priority": 1, "status": "running", "cluster_id": 1}]}}},
+@router.post("/batch", response_model=List[DeploymentBatchResult], responses={
+    200: {"description": "Result of each deployment of the batch, in submission order", "content": {"application/json": {"example": [{"index": 0, "deployment_id": 1, "status": "running", "reason": None}, {"index": 1, "deployment_id": 2, "status": "pending", "reason": "Waiting for resources"}, {"index": 2, "deployment_id": None, "status": None, "reason": "Cluster not found"}]}}},
+    400: {"description": "Invalid or cyclic dependencies between deployments of the batch", "content": {"application/json": {"example": {"detail": "Dependency cycle between deployments at positions 1, 2"}}}},
+})
+async def create_deployments_batch(
+        *,
+        db: AsyncSession = Depends(deps.get_db),
+        deployments_in: List[DeploymentBatchCreate] = Body(..., min_length=1,
+                                                           max_length=settings.DEPLOYMENT_BATCH_MAX_SIZE),
+        scheduler: AsyncScheduler = Depends(deps.get_scheduler),
+        current_user: Optional[Principal] = Depends(deps.get_optional_user)
+):
+    """
+    Create many deployments at once. Deployments are grouped by cluster, placed in a single pass over each
+    cluster queue and persisted in a single transaction. Deployments targeting an unknown cluster are rejected
+    without affecting the rest of the batch.
+
+    Deployments may depend on existing deployments (`depends_on`) and on other deployments of the batch
+    (`depends_on_index`), e.g. to submit a whole pipeline at once. Deployments depending on a rejected one are
+    rejected too. The batch is refused if its dependencies form a cycle.
+    """
+    edges = [(position, index) for index, deployment_in in enumerate(deployments_in)
+             for position in deployment_in.depends_on_index]
+    invalid = sorted({index for position, index in edges if not 0 <= position < len(deployments_in)})
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid dependency positions for deployments at positions {', '.join(map(str, invalid))}"
+        )
+    try:
+        order = topological_order(len(deployments_in), edges)
+    except DependencyCycle as cycle:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Dependency cycle between deployments at positions {', '.join(map(str, cycle.nodes))}"
+        )
+
+    # Look up every cluster and every existing dependency of the batch with a single query each
+    cluster_ids = {deployment_in.cluster_id for deployment_in in deployments_in}
+    clusters = {cluster.id: cluster for cluster in await db.scalars(select(Cluster).where(Cluster.id.in_(cluster_ids)))}
+    existing_ids = await _existing_deployment_ids(
+        db, {depends_on_id for deployment_in in deployments_in for depends_on_id in deployment_in.depends_on}
+    )
+
+    # Dependencies come first in topological order, so rejections cascade to their dependents in one pass
+    rejected = {}
+    for index in order:
+        deployment_in = deployments_in[index]
+        if deployment_in.cluster_id not in clusters:
+            rejected[index] = "Cluster not found"
+        elif not existing_ids.issuperset(deployment_in.depends_on):
+            rejected[index] = "Dependency not found"
+        elif any(position in rejected for position in deployment_in.depends_on_index):
+            rejected[index] = "Dependency rejected"
+
+    accepted = [index for index in range(len(deployments_in)) if index not in rejected]
+    accepted_positions = {index: position for position, index in enumerate(accepted)}
+    batch_dependencies = {
+        accepted_positions[index]: [accepted_positions[position] for position in deployments_in[index].depends_on_index]
+        for index in accepted if deployments_in[index].depends_on_index
+    }
+    placements = await scheduler.schedule_batch(
+        db, clusters, [deployments_in[index] for index in accepted], batch_dependencies,
+        user_id=current_user.id if current_user is not None else None
+    ) if accepted else []
+
+    results = [DeploymentBatchResult(index=index, reason=reason) for index, reason in rejected.items()]
+    for index, (deployment_id, deployment_status) in zip(accepted, placements):
+        deployment_in = deployments_in[index]
+        if deployment_status == DeploymentStatus.RUNNING:
+            reason = None
+        elif deployment_in.depends_on or deployment_in.depends_on_index:
+            reason = "Waiting for dependencies or resources"
+        else:
+            reason = "Waiting for resources"
+        results.append(DeploymentBatchResult(
+            index=index,
+            deployment_id=deployment_id,
+            status=deployment_status,
+            reason=reason,
+        ))
+    results.sort(key=lambda result: result.index)
+    return results
+
+
+@router.get("/", response_model=List[DeploymentListItem], response_model_exclude_unset=True, responses={
+    200: {"description": "Page of deployments for the user's organization. A `Link` header points to the next page, if any.", "content": {"application/json": {"example": [{"id": 1, "name": "Deployment1", "docker_image": "my_image", "cpu_required": 2, "ram_required": 4, "gpu_required": 1, "priority": 1, "status": "running", "cluster_id": 1}]}}},
     400: {"description": "User is not part of any organization", "content": {"application/json": {"example": {"detail": "User is not part of any organization"}}}},
 })
 async def list_deployments(
-        db: Session = Depends(deps.get_db),
-        current_user: User = Depends(deps.get_current_user)
+        request: Request,
+        response: Response,
+        page: Page = Depends(),
+        filters: DeploymentFilters = Depends(),
+        db: AsyncSession = Depends(deps.get_db),
+        current_user: Principal = Depends(deps.get_current_user)
 ):
     """
-    List all deployments for the current user's organization.
+    List the deployments of the current user's organization, one page at a time, by increasing ID.
+    Filters are applied by the database, so the cost of a page does not depend on the size of the history.
     """
-    if not current_user.org_member:
+    if current_user.organization_id is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User is not part of any organization"
         )
 
-    deployments = db.query(DeploymentModel).join(Cluster).filter(
-        Cluster.organization_id == current_user.org_member.organization_id
-    ).all()
+    query = filters.apply(page.select_columns(DeploymentModel, DeploymentListItem), current_user.organization_id)
+    return page.rows(request, response, (await db.execute(query)).mappings().all())
 
-    return deployments
+
+@router.get("/export", response_class=StreamingResponse, responses={
+    200: {"description": "Every deployment of the user's organization matching the filters, by increasing ID, as NDJSON (one JSON object per line) or CSV. Compressed with gzip if the client accepts it.", "content": {"application/x-ndjson": {"example": '{"id":1,"name":"Deployment1","docker_image":"my_image","cpu_required":2.0,"ram_required":4.0,"gpu_required":1.0,"priority":1,"cluster_id":1,"status":"running"}\n'}, "text/csv": {}}},
+    400: {"description": "User is not part of any organization", "content": {"application/json": {"example": {"detail": "User is not part of any organization"}}}},
+})
+async def export_deployments(
+        request: Request,
+        export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to export, all by default"),
+        filters: DeploymentFilters = Depends(),
+        session_factory: async_sessionmaker = Depends(deps.get_session_factory),
+        current_user: Principal = Depends(deps.get_current_user)
+):
+    """
+    Export the deployments of the current user's organization in a single response, for reporting jobs.
+    Rows are read through a server-side cursor and written out as they arrive, so neither the server nor
+    the database materializes the whole result.
+    """
+    if current_user.organization_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User is not part of any organization"
+        )
+
+    requested = parse_fields(fields, DeploymentListItem)
+    # Rows are streamed as they are, so resource units are converted to decimal amounts by the query
+    columns = [in_decimal(getattr(DeploymentModel, field)) for field in requested]
+    query = filters.apply(select(*columns), current_user.organization_id).order_by(DeploymentModel.id)
+
+    async def rows():
+        # The body is sent after the request's dependencies may have closed their session, so the cursor gets
+        # its own, closed once the last row is read
+        async with session_factory() as db:
+            result = await db.stream(query.execution_options(yield_per=settings.EXPORT_YIELD_PER))
+            async for row in result.mappings():
+                yield row
+
+    return stream_rows(request, rows(), requested, export_format, filename="deployments")
 
 
 @router.patch("/{deployment_id}/status", response_model=Deployment, responses={
@@ -76,14 +292,14 @@ async def update_deployment_status(
     *,
     deployment_id: int,
     status_update: DeploymentStatusUpdate,
-    db: Session = Depends(deps.get_db),
-    scheduler: Scheduler = Depends(deps.get_scheduler),
+    db: AsyncSession = Depends(deps.get_db),
+    scheduler: AsyncScheduler = Depends(deps.get_scheduler),
 ):
     """
     Update the status of a deployment and deallocate resources if necessary.
     """
     # Fetch the deployment
-    deployment = db.query(DeploymentModel).filter(DeploymentModel.id == deployment_id).first()
+    deployment = await db.get(DeploymentModel, deployment_id)
     if not deployment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Deployment not found"
@@ -95,10 +311,7 @@ async def update_deployment_status(
             detail=f"Invalid status transition from {deployment.status} to {status_update.status}",
         )
 
-    scheduler.process_deployment_stopped_running(db, deployment, status_update)
-
-    # Update the deployment status
-    deployment.status = status_update.status
-    db.commit()
+    # The scheduler releases resources, updates the status and drains the cluster queue
+    deployment = await scheduler.update_deployment_status(db, deployment, status_update)
 
     return deployment
\ No newline at end of file
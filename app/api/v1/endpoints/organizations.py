@@ -1,7 +1,9 @@
 # app/api/v1/endpoints/organizations.py
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core import deps
+from app.core.principal import Principal, principal_cache
 from app.schemas.organization import Organization, OrganizationCreate
 from app.models.user import User
 from app.models.organization import Organization as OrganizationModel
@@ -10,14 +12,15 @@ from app.models.organization_member import OrganizationMember
 router = APIRouter()
 
 
-def check_if_user_is_already_a_member(current_user, db):
-    existing_member = db.query(OrganizationMember).filter(OrganizationMember.user_id == current_user.id).first()
+async def check_if_user_is_already_a_member(current_user, db):
+    existing_member = await db.scalar(
+        select(OrganizationMember).where(OrganizationMember.user_id == current_user.id).limit(1))
     if existing_member:
-        existing_org = db.query(OrganizationModel).filter(
-            OrganizationModel.id == existing_member.organization_id).first()
-        admin_member = db.query(OrganizationMember).filter(OrganizationMember.organization_id == existing_org.id,
-                                                           OrganizationMember.role == "admin").first()
-        admin_user = db.query(User).filter(User.id == admin_member.user_id).first()
+        existing_org = await db.scalar(
+            select(OrganizationModel).where(OrganizationModel.id == existing_member.organization_id))
+        admin_member = await db.scalar(select(OrganizationMember).where(
+            OrganizationMember.organization_id == existing_org.id, OrganizationMember.role == "admin").limit(1))
+        admin_user = await db.scalar(select(User).where(User.id == admin_member.user_id))
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"You are already part of an organization: {existing_org.name}, Admin: {admin_user.username}"
@@ -32,12 +35,12 @@ def check_if_user_is_already_a_member(current_user, db):
 })
 async def create_organization(
         *,
-        db: Session = Depends(deps.get_db),
+        db: AsyncSession = Depends(deps.get_db),
         organization_in: OrganizationCreate,
-        current_user: User = Depends(deps.get_current_user)
+        current_user: Principal = Depends(deps.get_current_user)
 ):
     # Check if the user is already part of an organization
-    check_if_user_is_already_a_member(current_user, db)
+    await check_if_user_is_already_a_member(current_user, db)
 
     # Generate invite code
     invite_code = OrganizationModel.generate_invite_code()
@@ -45,13 +48,15 @@ async def create_organization(
     # Create the organization
     organization = OrganizationModel(name=organization_in.name, invite_code=invite_code)
     db.add(organization)
-    db.commit()
+    await db.commit()
     # db.refresh(organization)
 
     # Add the current user as the first member/admin
     organization_member = OrganizationMember(user_id=current_user.id, organization_id=organization.id, role="admin")
     db.add(organization_member)
-    db.commit()
+    await db.commit()
+    # Drop the cached user again now that the membership is committed, in case a concurrent request reloaded it
+    principal_cache.invalidate(current_user.id)
     # db.refresh(organization_member)
     # db.refresh(organization)
     # db.refresh(current_user)
@@ -75,18 +80,18 @@ async def create_organization(
 })
 async def join_organization(
         *,
-        db: Session = Depends(deps.get_db),
+        db: AsyncSession = Depends(deps.get_db),
         invite_code: str,
-        current_user: User = Depends(deps.get_current_user)
+        current_user: Principal = Depends(deps.get_current_user)
 ):
     """
     Implement logic for joining an organization using an invite code.
     """
     # Check if the user is already part of any organization
-    check_if_user_is_already_a_member(current_user, db)
+    await check_if_user_is_already_a_member(current_user, db)
 
     # Fetch the organization associated with the invite code
-    organization = db.query(OrganizationModel).filter(OrganizationModel.invite_code == invite_code).first()
+    organization = await db.scalar(select(OrganizationModel).where(OrganizationModel.invite_code == invite_code))
 
     if not organization:
         raise HTTPException(
@@ -97,7 +102,8 @@ async def join_organization(
     # Add the user to the organization
     organization_member = OrganizationMember(user_id=current_user.id, organization_id=organization.id, role="member")
     db.add(organization_member)
-    db.commit()
+    await db.commit()
+    principal_cache.invalidate(current_user.id)
     # db.refresh(organization_member)
     # db.refresh(organization)
     # db.refresh(current_user)
@@ -0,0 +1,95 @@
+import csv
+import enum
+import io
+import json
+import zlib
+from typing import AsyncIterator, List
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+# Rows are buffered into chunks of about this size, instead of sending one tiny chunk per row
+CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def accepts_gzip(request: Request) -> bool:
+    """
+    Whether the client accepts a gzip encoded response, following the `Accept-Encoding` header.
+    """
+    qualities = {}
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, parameters = coding.partition(";")
+        quality = 1.0
+        parameter, _, value = parameters.partition("=")
+        if parameter.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def stream_rows(request: Request, rows: AsyncIterator, fields: List[str], export_format: ExportFormat,
+                filename: str) -> StreamingResponse:
+    """
+    Stream database rows as NDJSON or CSV, gzip compressed if the client accepts it.
+    Rows are encoded as they are fetched, so memory use does not depend on the number of rows.
+    """
+    body = _encode(rows, fields, export_format)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"',
+        "Vary": "Accept-Encoding",
+    }
+    if accepts_gzip(request):
+        body = _gzip(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=MEDIA_TYPES[export_format], headers=headers)
+
+
+def _value(value):
+    return value.value if isinstance(value, enum.Enum) else value
+
+
+async def _encode(rows: AsyncIterator, fields: List[str], export_format: ExportFormat) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    if export_format == ExportFormat.csv:
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+
+        def write(row):
+            writer.writerow([_value(row[field]) for field in fields])
+    else:
+        def write(row):
+            buffer.write(json.dumps({field: _value(row[field]) for field in fields}, separators=(",", ":")))
+            buffer.write("\n")
+
+    async for row in rows:
+        write(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,70 @@
+from typing import Dict, List, Optional, Sequence, Type
+
+from fastapi import HTTPException, Query, Request, Response, status
+from pydantic import BaseModel
+from sqlalchemy import Select, select
+
+from app.core.config import settings
+
+
+def parse_fields(fields: Optional[str], item_schema: Type[BaseModel]) -> List[str]:
+    """
+    Parse a comma-separated `fields` parameter against the fields of `item_schema` (all of them if not set).
+    """
+    allowed = list(item_schema.model_fields)
+    if fields is None:
+        return allowed
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(allowed)}"
+        )
+    return requested
+
+
+class Page:
+    """
+    Keyset pagination parameters: rows are returned by increasing ID, starting after `after_id`.
+    Unlike offsets, the cost of a page does not grow with the number of rows before it.
+    """
+
+    def __init__(
+            self,
+            after_id: Optional[int] = Query(None, ge=0, description="Return rows with an ID greater than this one"),
+            limit: int = Query(settings.LIST_DEFAULT_LIMIT, ge=1, le=settings.LIST_MAX_LIMIT,
+                               description="Maximum number of rows to return"),
+            fields: Optional[str] = Query(None, description="Comma-separated fields to return, all by default"),
+    ):
+        self.after_id = after_id
+        self.limit = limit
+        self.fields = fields
+        self.requested_fields: List[str] = []
+
+    def select_columns(self, model, item_schema: Type[BaseModel]) -> Select:
+        """
+        Select the requested columns of `model` (the ID is always selected, to build the next cursor).
+        Plain rows are fetched instead of ORM objects, which avoids the identity map for large pages.
+        """
+        requested = parse_fields(self.fields, item_schema)
+        self.requested_fields = requested
+        columns = [model.id] + [getattr(model, field) for field in requested if field != "id"]
+        query = select(*columns).order_by(model.id).limit(self.limit + 1)
+        if self.after_id is not None:
+            query = query.where(model.id > self.after_id)
+        return query
+
+    def rows(self, request: Request, response: Response, result_rows: Sequence) -> List[Dict]:
+        """
+        Turn the fetched rows into the page, and link to the next page if there is one.
+        One row more than the limit is fetched to know whether a next page exists.
+        """
+        rows = [dict(row) for row in result_rows[:self.limit]]
+        if len(result_rows) > self.limit:
+            next_url = request.url.include_query_params(after_id=rows[-1]["id"], limit=self.limit)
+            response.headers["Link"] = f'<{next_url}>; rel="next"'
+        if "id" not in self.requested_fields:
+            for row in rows:
+                del row["id"]
+        return rows
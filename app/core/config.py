@@ -16,7 +16,49 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "TODO_CHANGE_THIS_SECRET_KEY"  # TODO: Change in production
     SESSION_COOKIE_NAME: str = "session"
     SESSION_MAX_AGE: int = 1800  # 30 minutes in seconds
+
+    # Authenticated users cached by get_current_user: number of entries and seconds before they are reloaded
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: float = 60.0
+
+    # Password hashing: bcrypt cost factor, threads hashing in parallel and calls allowed to wait for one
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
     
+    # Scheduler configuration
+    # "priority" (strict priority), "backfill" or "fair_share" (DRF between users on clusters flagged fair_share)
+    SCHEDULER_POLICY: str = "priority"
+    # "local" (single node), "postgres_advisory", "postgres_row" or "optimistic" (several workers sharing the database)
+    SCHEDULER_LOCK_BACKEND: str = "local"
+    # Cluster chosen for deployments that do not name one: "best_fit", "worst_fit" or "drf" (balances dominant shares)
+    PLACEMENT_STRATEGY: str = "best_fit"
+    # Logged deployment events per cluster between snapshots of its state; bounds the log replayed at startup
+    SCHEDULER_SNAPSHOT_INTERVAL: int = 1000
+    # Seconds between passes of the capacity reconciler over the clusters changed since the previous pass (0 disables)
+    CAPACITY_RECONCILE_INTERVAL: float = 30.0
+    # Where decisions on single deployments run: "inline" (in the request) or in per-cluster background
+    # dispatchers fed by "memory" (queues of this process) or "redis" (durable queues at DISPATCH_REDIS_URL)
+    SCHEDULER_DISPATCH: str = "inline"
+    DISPATCH_REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Seconds a coalesced queue drain waits before starting, for the drains requested meanwhile (e.g. by other
+    # completions on the cluster) to share its pass
+    SCHEDULER_DRAIN_DEBOUNCE: float = 0.0
+    DEPLOYMENT_BATCH_MAX_SIZE: int = 10000
+
+    # Page sizes of the cluster and deployment listings
+    LIST_DEFAULT_LIMIT: int = 100
+    LIST_MAX_LIMIT: int = 1000
+    # Rows fetched per round trip by the streaming exports
+    EXPORT_YIELD_PER: int = 1000
+
+    # Connections of the asyncio engine used by the API, per worker
+    DATABASE_POOL_SIZE: int = 20
+    DATABASE_MAX_OVERFLOW: int = 20
+
+    # Global rate limit per client address
+    RATE_LIMIT_DEFAULT: str = "100/minute"
+
     # Database URL
     DATABASE_URL: str = os.getenv(
         "DATABASE_URL",
@@ -1,32 +1,40 @@
-from typing import Generator, Optional
+from typing import AsyncGenerator, Optional
 from fastapi import Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import joinedload
+from app.core.principal import Principal, principal_cache
 from app.models.user import User
-from app.db.session import SessionLocal
-from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.db.session import AsyncSessionLocal
+from app.schedulers.async_scheduler import AsyncScheduler
 
 
-def get_db() -> Generator:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def get_session_factory() -> async_sessionmaker:
+    """
+    Factory of sessions that outlive the request's dependencies, e.g. for responses streamed after it returned.
+    """
+    return AsyncSessionLocal
 
 
 async def get_current_user(
         request: Request,
-        db: Session = Depends(get_db)
-) -> Optional[User]:
+        db: AsyncSession = Depends(get_db)
+) -> Principal:
     """
     Get the current user from the session. If the user is not authenticated, raise an HTTPException.
+    Users are cached, so most requests do not query the database at all.
 
     Args:
     - request: The FastAPI request object, which contains the session information.
-    - db: Database session dependency, used to query the user model.
+    - db: Database session dependency, used to query the user model on a cache miss.
 
     Returns:
-    - Optional[User]: The current user if authenticated, otherwise raises an HTTPException.
+    - Principal: The current user and their membership if authenticated, otherwise raises an HTTPException.
     """
     # Retrieve the user ID from the session (assuming session stores user_id)
     user_id = request.session.get("user_id")
@@ -38,8 +46,13 @@ async def get_current_user(
             detail="Not authenticated"
         )
 
-    # Query the user from the database
-    user = db.query(User).filter(User.id == user_id).first()
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    # Query the user from the database, with the membership the endpoints check, in a single round trip
+    result = await db.execute(select(User).options(joinedload(User.org_member)).where(User.id == user_id))
+    user = result.unique().scalar_one_or_none()
 
     # If the user does not exist, raise unauthorized error
     if not user:
@@ -48,10 +61,23 @@ async def get_current_user(
             detail="User not found"
         )
 
-    return user
+    principal = Principal.from_model(user)
+    principal_cache.put(principal)
+    return principal
+
+
+async def get_optional_user(
+        request: Request,
+        db: AsyncSession = Depends(get_db)
+) -> Optional[Principal]:
+    """
+    Get the current user from the session like `get_current_user`, or None if the request is not authenticated.
+    """
+    if not request.session.get("user_id"):
+        return None
+    return await get_current_user(request, db)
 
 
-def get_scheduler():
-    # Create the scheduler instance
-    scheduler_instance = AdvancedScheduler()
-    return scheduler_instance
+def get_scheduler(request: Request) -> AsyncScheduler:
+    # The scheduler is a process-wide singleton created in the application lifespan
+    return request.app.state.scheduler
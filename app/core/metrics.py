@@ -0,0 +1,181 @@
+"""
+Prometheus metrics of the scheduler, exposed on /metrics.
+
+The scheduler records on its hot path through label children bound once per operation and per cluster
+(module constants and `for_cluster`), so an observation is a dict lookup and a histogram update, without
+building label tuples or timer objects on every call. Queue depths and utilization are not recorded at all:
+`ClusterStateCollector` reads them from the in-memory cluster states when /metrics is scraped.
+"""
+import threading
+import time
+from functools import wraps
+from typing import TYPE_CHECKING, Dict, Iterator
+
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+if TYPE_CHECKING:
+    from app.schedulers.cluster_state import ClusterStateStore
+
+# Scheduling decisions take from tens of microseconds (in memory) to tens of milliseconds (database round trips)
+_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CLUSTER_VERSION_CONFLICTS = Counter(
+    "scheduler_cluster_version_conflicts_total",
+    "Scheduling decisions rejected because the cluster changed concurrently (optimistic lock backend)",
+    ["cluster_id"],
+)
+CLUSTER_VERSION_RETRIES = Counter(
+    "scheduler_cluster_version_retries_total",
+    "Scheduling decisions retried after a cluster version conflict (optimistic lock backend)",
+    ["cluster_id"],
+)
+DECISION_LATENCY = Histogram(
+    "scheduler_decision_seconds",
+    "Time taken by scheduler operations, including lock waits and commits",
+    ["operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+LOCK_WAIT = Histogram(
+    "scheduler_lock_wait_seconds",
+    "Time spent waiting for the lock of a cluster: by the API for the lock of its process, and by scheduling "
+    "decisions for the lock shared between workers, if any",
+    ["cluster_id"],
+    buckets=_LATENCY_BUCKETS,
+)
+LOCK_HOLD = Histogram(
+    "scheduler_lock_hold_seconds",
+    "Time the lock of a cluster was held: by the API for the lock of its process, and by scheduling decisions "
+    "for the lock shared between workers, if any",
+    ["cluster_id"],
+    buckets=_LATENCY_BUCKETS,
+)
+COMMIT_LATENCY = Histogram(
+    "scheduler_commit_seconds",
+    "Time taken to commit a scheduling decision",
+    buckets=_LATENCY_BUCKETS,
+)
+CAPACITY_CORRECTIONS = Counter(
+    "scheduler_capacity_corrections_total",
+    "Times the reconciler corrected the available capacity of a cluster that drifted from its running deployments",
+    ["cluster_id"],
+)
+CAPACITY_DRIFT = Histogram(
+    "scheduler_capacity_drift",
+    "Difference between the available capacity of a cluster and its limit minus its running deployments, "
+    "when corrected, in millicores, MiB or thousandths of a GPU",
+    ["resource"],
+    buckets=(1, 10, 100, 1000, 10000, 100000, 1000000),
+)
+RECONCILE_LATENCY = Histogram(
+    "scheduler_reconcile_seconds",
+    "Time taken by a capacity reconciliation pass over the clusters changed since the previous one",
+    buckets=_LATENCY_BUCKETS,
+)
+QUEUE_DRAINS_COALESCED = Counter(
+    "scheduler_queue_drains_coalesced_total",
+    "Queue drains requested while another drain of the same cluster was about to start, and served by it",
+)
+PREEMPTIONS = Counter(
+    "scheduler_preemptions_total",
+    "Running deployments sent back to the queue of their cluster to make room for others",
+    ["cluster_id"],
+)
+
+SCHEDULE_LATENCY = DECISION_LATENCY.labels(operation="schedule")
+ADMIT_LATENCY = DECISION_LATENCY.labels(operation="admit")
+SCHEDULE_BATCH_LATENCY = DECISION_LATENCY.labels(operation="schedule_batch")
+PLACE_LATENCY = DECISION_LATENCY.labels(operation="place")
+PREEMPTION_LATENCY = DECISION_LATENCY.labels(operation="preemption")
+PROCESS_QUEUE_LATENCY = DECISION_LATENCY.labels(operation="process_cluster_queue")
+STATUS_UPDATE_LATENCY = DECISION_LATENCY.labels(operation="update_deployment_status")
+CPU_DRIFT, RAM_DRIFT, GPU_DRIFT = (CAPACITY_DRIFT.labels(resource=resource) for resource in ("cpu", "ram", "gpu"))
+
+
+def observe_latency(histogram):
+    """
+    Decorator recording the duration of each call of the function in the given (bound) histogram.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class ClusterMetrics:
+    """
+    Label children of the per-cluster metrics, bound once per cluster.
+    """
+    __slots__ = ("version_conflicts", "version_retries", "lock_wait", "lock_hold", "preemptions",
+                 "capacity_corrections")
+
+    def __init__(self, cluster_id: int):
+        label = str(cluster_id)
+        self.version_conflicts = CLUSTER_VERSION_CONFLICTS.labels(cluster_id=label)
+        self.version_retries = CLUSTER_VERSION_RETRIES.labels(cluster_id=label)
+        self.lock_wait = LOCK_WAIT.labels(cluster_id=label)
+        self.lock_hold = LOCK_HOLD.labels(cluster_id=label)
+        self.preemptions = PREEMPTIONS.labels(cluster_id=label)
+        self.capacity_corrections = CAPACITY_CORRECTIONS.labels(cluster_id=label)
+
+
+_cluster_metrics: Dict[int, ClusterMetrics] = {}
+_cluster_metrics_lock = threading.Lock()
+
+
+def for_cluster(cluster_id: int) -> ClusterMetrics:
+    """
+    Return the metrics of a cluster, binding them on first use.
+    """
+    cluster_metrics = _cluster_metrics.get(cluster_id)
+    if cluster_metrics is None:
+        with _cluster_metrics_lock:
+            cluster_metrics = _cluster_metrics.get(cluster_id)
+            if cluster_metrics is None:
+                cluster_metrics = _cluster_metrics[cluster_id] = ClusterMetrics(cluster_id)
+    return cluster_metrics
+
+
+class ClusterStateCollector(Collector):
+    """
+    Queue depth and utilization of each cluster, read from the scheduler's in-memory states at scrape time.
+    """
+
+    def __init__(self, cluster_states: "ClusterStateStore"):
+        self.cluster_states = cluster_states
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        queue_depth = GaugeMetricFamily(
+            "scheduler_queue_depth", "Deployments waiting in the queue of each cluster", labels=["cluster_id"]
+        )
+        utilization = GaugeMetricFamily(
+            "scheduler_cluster_utilization", "Fraction of each resource of a cluster held by running deployments",
+            labels=["cluster_id", "resource"],
+        )
+        for state in self.cluster_states.states():
+            label = str(state.id)
+            queue_depth.add_metric([label], len(state.pending))
+            for resource, limit, available in (("cpu", state.cpu_limit, state.cpu_available),
+                                               ("ram", state.ram_limit, state.ram_available),
+                                               ("gpu", state.gpu_limit, state.gpu_available)):
+                if limit:
+                    utilization.add_metric([label, resource], 1 - available / limit)
+        yield queue_depth
+        yield utilization
+
+
+def register_cluster_states(cluster_states: "ClusterStateStore", registry=REGISTRY) -> ClusterStateCollector:
+    """
+    Export the queue depths and utilization of the given store. Unregister the returned collector with
+    `registry.unregister` when the store goes away.
+    """
+    collector = ClusterStateCollector(cluster_states)
+    registry.register(collector)
+    return collector
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.models.organization_member import OrganizationMember
+from app.models.user import User
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Compact view of the authenticated user, holding only what the endpoints check.
+    """
+    id: int
+    is_active: bool
+    organization_id: Optional[int] = None
+    role: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, user: User) -> "Principal":
+        member = user.org_member
+        return cls(
+            id=user.id,
+            is_active=user.is_active,
+            organization_id=member.organization_id if member else None,
+            role=member.role if member else None,
+        )
+
+
+class PrincipalCache:
+    """
+    TTL + LRU cache of principals keyed by user ID, so authenticated requests skip the user lookup.
+
+    Entries are dropped explicitly when the user or their membership changes (see the listeners below).
+    Changes made by other workers are only picked up when the entry expires, which bounds staleness by the TTL.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Principal]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_MAX_SIZE, settings.PRINCIPAL_CACHE_TTL)
+
+
+# Drop cached principals whenever a user (e.g. deactivated) or a membership (created, joined, removed) changes
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, user: User):
+    principal_cache.invalidate(user.id)
+
+
+@event.listens_for(OrganizationMember, "after_insert")
+@event.listens_for(OrganizationMember, "after_update")
+@event.listens_for(OrganizationMember, "after_delete")
+def _invalidate_member(mapper, connection, member: OrganizationMember):
+    principal_cache.invalidate(member.user_id)
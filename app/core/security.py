@@ -1,7 +1,14 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 
-# Create a CryptContext instance with bcrypt as the hashing scheme
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.config import settings
+
+# Create a CryptContext instance with bcrypt as the hashing scheme. Hashes made with other parameters
+# (e.g. a lower cost factor) are reported as needing an update and are rehashed on the next login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -18,6 +25,16 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and rehash it if the stored hash was made with outdated parameters.
+
+    Returns:
+    - Tuple[bool, Optional[str]]: Whether the password matches, and the new hash to store if it needs an update.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     """
     Hash a password using bcrypt.
@@ -29,3 +46,43 @@ def get_password_hash(password: str) -> str:
     - str: The hashed password.
     """
     return pwd_context.hash(password)
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when too many password hashes are already running or waiting.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt (hundreds of milliseconds of CPU per call) on a dedicated thread pool, off the event loop.
+
+    bcrypt releases the GIL, so the pool hashes in parallel while the event loop keeps serving other
+    requests. At most `workers + max_pending` calls are admitted at once; beyond that callers are
+    rejected immediately instead of piling up behind a login burst.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        self.max_in_flight = workers + max_pending
+        # Only updated from the event loop thread, so it needs no lock
+        self.in_flight = 0
+
+    async def _run(self, function, *args):
+        if self.in_flight >= self.max_in_flight:
+            raise PasswordHasherBusy()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_password, plain_password, hashed_password)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
@@ -0,0 +1,85 @@
+"""
+Fixed-point resource units.
+
+CPU, RAM and GPU amounts are stored and scheduled as integers: millicores, MiB and thousandths of a GPU. Sums
+and differences of integers are exact, so allocating and releasing a deployment always gives back exactly
+what it took, however many times it runs. The API keeps speaking decimal CPUs, GB of RAM and GPUs:
+`*Quantity` fields convert decimal inputs to units when a request is validated, and `*Units` fields render
+units as decimals in responses.
+"""
+from typing import Annotated, Any, Dict
+
+from pydantic import BeforeValidator, PlainSerializer, WithJsonSchema
+from sqlalchemy import Float, cast
+
+# Units per CPU, per GB of RAM and per GPU
+CPU_SCALE = 1000
+RAM_SCALE = 1024
+GPU_SCALE = 1000
+
+# Scale of each resource column of the models, by column name
+RESOURCE_SCALES: Dict[str, int] = {
+    f"{resource}_{kind}": scale
+    for resource, scale in (("cpu", CPU_SCALE), ("ram", RAM_SCALE), ("gpu", GPU_SCALE))
+    for kind in ("limit", "available", "required")
+}
+
+
+def to_units(amount: float, scale: int) -> int:
+    return round(amount * scale)
+
+
+def from_units(units: int, scale: int) -> float:
+    return units / scale
+
+
+def cpu_units(cpus: float) -> int:
+    return to_units(cpus, CPU_SCALE)
+
+
+def ram_units(gigabytes: float) -> int:
+    return to_units(gigabytes, RAM_SCALE)
+
+
+def gpu_units(gpus: float) -> int:
+    return to_units(gpus, GPU_SCALE)
+
+
+def in_decimal(column):
+    """
+    SQL expression of a resource column converted to decimal, labelled with the column's name, for queries
+    whose rows are returned as they are (e.g. exports).
+    """
+    scale = RESOURCE_SCALES.get(column.key)
+    if scale is None:
+        return column
+    return (cast(column, Float) / scale).label(column.key)
+
+
+def _parser(scale: int):
+    def parse(value: Any) -> Any:
+        if isinstance(value, bool):
+            return value
+        try:
+            return to_units(float(value), scale)
+        except (TypeError, ValueError, OverflowError):
+            # Left to the integer validation, which rejects it
+            return value
+    return parse
+
+
+def _serializer(scale: int) -> PlainSerializer:
+    return PlainSerializer(lambda units: from_units(units, scale), return_type=float, when_used="json")
+
+
+_DECIMAL_SCHEMA = WithJsonSchema({"type": "number"})
+
+# Decimal amounts in requests, validated into units
+CpuQuantity = Annotated[int, BeforeValidator(_parser(CPU_SCALE)), _serializer(CPU_SCALE), _DECIMAL_SCHEMA]
+RamQuantity = Annotated[int, BeforeValidator(_parser(RAM_SCALE)), _serializer(RAM_SCALE), _DECIMAL_SCHEMA]
+GpuQuantity = Annotated[int, BeforeValidator(_parser(GPU_SCALE)), _serializer(GPU_SCALE), _DECIMAL_SCHEMA]
+
+# Units read from the database, rendered as decimal amounts in responses
+CpuUnits = Annotated[int, _serializer(CPU_SCALE), _DECIMAL_SCHEMA]
+RamUnits = Annotated[int, _serializer(RAM_SCALE), _DECIMAL_SCHEMA]
+GpuUnits = Annotated[int, _serializer(GPU_SCALE), _DECIMAL_SCHEMA]
@@ -4,5 +4,9 @@ from app.db.base_class import Base
 # Import all models here for Alembic
 from app.models.user import User  # noqa
 from app.models.organization import Organization  # noqa
+from app.models.organization_member import OrganizationMember  # noqa
 from app.models.cluster import Cluster  # noqa
 from app.models.deployment import Deployment  # noqa
+from app.models.deployment_dependency import DeploymentDependency  # noqa
+from app.models.deployment_event import DeploymentEvent  # noqa
+from app.models.cluster_snapshot import ClusterSnapshot  # noqa
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import Integer, inspect
+from sqlalchemy.engine import Engine
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+
+# Revisions matching databases created with Base.metadata.create_all before migrations existed
+INITIAL_REVISION = "0001"
+CLUSTER_VERSION_REVISION = "0002"
+SCHEDULER_INDEXES_REVISION = "0003"
+DEPLOYMENT_DEPENDENCIES_REVISION = "0004"
+FAIR_SHARE_REVISION = "0005"
+EVENT_LOG_REVISION = "0006"
+RESOURCE_UNITS_REVISION = "0007"
+
+
+def upgrade_database(engine: Engine, revision: str = "head"):
+    """
+    Apply the schema migrations up to `revision`.
+
+    Databases created by `Base.metadata.create_all` before migrations were introduced have no
+    `alembic_version` table: they are stamped with the revision matching their schema first, so the
+    upgrade only applies what they are missing.
+    """
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        inspector = inspect(connection)
+        tables = inspector.get_table_names()
+        if "alembic_version" not in tables and "cluster" in tables:
+            command.stamp(config, _unversioned_schema_revision(inspector))
+        command.upgrade(config, revision)
+
+
+def _unversioned_schema_revision(inspector) -> str:
+    cluster_columns = {column["name"]: column for column in inspector.get_columns("cluster")}
+    if isinstance(cluster_columns["cpu_limit"]["type"], Integer):
+        return RESOURCE_UNITS_REVISION
+    if inspector.has_table("deploymentevent"):
+        return EVENT_LOG_REVISION
+    if "fair_share" in cluster_columns:
+        return FAIR_SHARE_REVISION
+    if inspector.has_table("deploymentdependency"):
+        return DEPLOYMENT_DEPENDENCIES_REVISION
+    deployment_indexes = {index["name"] for index in inspector.get_indexes("deployment")}
+    if "ix_deployment_cluster_id_status_priority" in deployment_indexes:
+        return SCHEDULER_INDEXES_REVISION
+    if "version" in cluster_columns:
+        return CLUSTER_VERSION_REVISION
+    return INITIAL_REVISION
@@ -0,0 +1,115 @@
+"""Initial schema, as created by Base.metadata.create_all before migrations were introduced
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('organization',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('invite_code', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('organization', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_organization_id'), ['id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_organization_invite_code'), ['invite_code'], unique=True)
+        batch_op.create_index(batch_op.f('ix_organization_name'), ['name'], unique=False)
+
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('username', sa.String(), nullable=True),
+    sa.Column('hashed_password', sa.String(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_user_id'), ['id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_user_username'), ['username'], unique=True)
+
+    op.create_table('cluster',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('cpu_limit', sa.Float(), nullable=True),
+    sa.Column('ram_limit', sa.Float(), nullable=True),
+    sa.Column('gpu_limit', sa.Float(), nullable=True),
+    sa.Column('cpu_available', sa.Float(), nullable=True),
+    sa.Column('ram_available', sa.Float(), nullable=True),
+    sa.Column('gpu_available', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['organization_id'], ['organization.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('cluster', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_cluster_id'), ['id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_cluster_name'), ['name'], unique=False)
+
+    op.create_table('organizationmember',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('organization_id', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['organization_id'], ['organization.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('organizationmember', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_organizationmember_id'), ['id'], unique=False)
+
+    op.create_table('deployment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('cluster_id', sa.Integer(), nullable=True),
+    sa.Column('docker_image', sa.String(), nullable=True),
+    sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'FAILED', 'COMPLETED', 'CANCELLED', name='deploymentstatus'), nullable=True),
+    sa.Column('priority', sa.Integer(), nullable=True),
+    sa.Column('cpu_required', sa.Float(), nullable=True),
+    sa.Column('ram_required', sa.Float(), nullable=True),
+    sa.Column('gpu_required', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['cluster_id'], ['cluster.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deployment', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_deployment_id'), ['id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_deployment_name'), ['name'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('deployment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_deployment_name'))
+        batch_op.drop_index(batch_op.f('ix_deployment_id'))
+
+    op.drop_table('deployment')
+    with op.batch_alter_table('organizationmember', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_organizationmember_id'))
+
+    op.drop_table('organizationmember')
+    with op.batch_alter_table('cluster', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cluster_name'))
+        batch_op.drop_index(batch_op.f('ix_cluster_id'))
+
+    op.drop_table('cluster')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_username'))
+        batch_op.drop_index(batch_op.f('ix_user_id'))
+        batch_op.drop_index(batch_op.f('ix_user_email'))
+
+    op.drop_table('user')
+    with op.batch_alter_table('organization', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_organization_name'))
+        batch_op.drop_index(batch_op.f('ix_organization_invite_code'))
+        batch_op.drop_index(batch_op.f('ix_organization_id'))
+
+    op.drop_table('organization')
@@ -0,0 +1,35 @@
+"""Index the scheduler hot queries and clusters by organization
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+ACTIVE_STATUSES = sa.text("status IN ('PENDING', 'RUNNING')")
+
+
+def upgrade():
+    with op.batch_alter_table('cluster', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_cluster_organization_id'), ['organization_id'], unique=False)
+
+    with op.batch_alter_table('deployment', schema=None) as batch_op:
+        batch_op.create_index('ix_deployment_cluster_id_status_priority',
+                              ['cluster_id', 'status', sa.text('priority DESC')], unique=False)
+        batch_op.create_index('ix_deployment_active_cluster_id_priority', ['cluster_id', sa.text('priority DESC')],
+                              unique=False, postgresql_where=ACTIVE_STATUSES, sqlite_where=ACTIVE_STATUSES)
+
+
+def downgrade():
+    with op.batch_alter_table('deployment', schema=None) as batch_op:
+        batch_op.drop_index('ix_deployment_active_cluster_id_priority')
+        batch_op.drop_index('ix_deployment_cluster_id_status_priority')
+
+    with op.batch_alter_table('cluster', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cluster_organization_id'))
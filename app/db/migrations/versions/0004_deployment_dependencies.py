@@ -0,0 +1,33 @@
+"""Add deployment dependencies
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deploymentdependency',
+    sa.Column('deployment_id', sa.Integer(), nullable=False),
+    sa.Column('depends_on_id', sa.Integer(), nullable=False),
+    sa.Column('satisfied', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.ForeignKeyConstraint(['depends_on_id'], ['deployment.id'], ),
+    sa.ForeignKeyConstraint(['deployment_id'], ['deployment.id'], ),
+    sa.PrimaryKeyConstraint('deployment_id', 'depends_on_id')
+    )
+    with op.batch_alter_table('deploymentdependency', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_deploymentdependency_depends_on_id'), ['depends_on_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deploymentdependency', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_deploymentdependency_depends_on_id'))
+
+    op.drop_table('deploymentdependency')
@@ -0,0 +1,31 @@
+"""Add the submitting user of deployments and the fair share flag of clusters
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cluster', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fair_share', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    with op.batch_alter_table('deployment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_deployment_user_id_user', 'user', ['user_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('deployment', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_deployment_user_id_user', type_='foreignkey')
+        batch_op.drop_column('user_id')
+
+    with op.batch_alter_table('cluster', schema=None) as batch_op:
+        batch_op.drop_column('fair_share')
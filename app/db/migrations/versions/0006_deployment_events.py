@@ -0,0 +1,59 @@
+"""Add the deployment event log and cluster snapshots
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+deployment_event_kind = sa.Enum('SUBMITTED', 'BLOCKED', 'QUEUED', 'STARTED', 'PREEMPTED', 'REQUEUED', 'COMPLETED',
+                                'FAILED', 'CANCELLED', name='deploymenteventkind')
+
+
+def upgrade():
+    op.create_table('deploymentevent',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cluster_id', sa.Integer(), nullable=False),
+    sa.Column('deployment_id', sa.Integer(), nullable=False),
+    sa.Column('kind', deployment_event_kind, nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['cluster_id'], ['cluster.id'], ),
+    sa.ForeignKeyConstraint(['deployment_id'], ['deployment.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deploymentevent', schema=None) as batch_op:
+        batch_op.create_index('ix_deploymentevent_cluster_id_id', ['cluster_id', 'id'], unique=False)
+
+    op.create_table('clustersnapshot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cluster_id', sa.Integer(), nullable=False),
+    sa.Column('last_event_id', sa.Integer(), nullable=False),
+    sa.Column('cpu_available', sa.Float(), nullable=False),
+    sa.Column('ram_available', sa.Float(), nullable=False),
+    sa.Column('gpu_available', sa.Float(), nullable=False),
+    sa.Column('running', sa.JSON(), nullable=False),
+    sa.Column('pending', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['cluster_id'], ['cluster.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('clustersnapshot', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_clustersnapshot_cluster_id'), ['cluster_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('clustersnapshot', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_clustersnapshot_cluster_id'))
+
+    op.drop_table('clustersnapshot')
+    with op.batch_alter_table('deploymentevent', schema=None) as batch_op:
+        batch_op.drop_index('ix_deploymentevent_cluster_id_id')
+
+    op.drop_table('deploymentevent')
+    deployment_event_kind.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,52 @@
+"""Store resource amounts as integer millicores, MiB and thousandths of a GPU
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+# Units per CPU, per GB of RAM and per GPU, as in app.core.units at the time of this revision
+SCALES = {'cpu': 1000, 'ram': 1024, 'gpu': 1000}
+
+RESOURCE_COLUMNS = {
+    'cluster': ['cpu_limit', 'ram_limit', 'gpu_limit', 'cpu_available', 'ram_available', 'gpu_available'],
+    'deployment': ['cpu_required', 'ram_required', 'gpu_required'],
+    'clustersnapshot': ['cpu_available', 'ram_available', 'gpu_available'],
+}
+
+
+def _scale(column):
+    return SCALES[column.split('_')[0]]
+
+
+def upgrade():
+    # Snapshots also hold the amounts of running and pending deployments; clusters without one are recovered
+    # from their deployments instead
+    op.execute('DELETE FROM clustersnapshot')
+    for table, columns in RESOURCE_COLUMNS.items():
+        op.execute(f"UPDATE {table} SET " + ", ".join(
+            f"{column} = round({column} * {_scale(column)})" for column in columns
+        ))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.Float(), type_=sa.Integer(),
+                                      postgresql_using=f'{column}::integer')
+
+
+def downgrade():
+    op.execute('DELETE FROM clustersnapshot')
+    for table, columns in RESOURCE_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.Integer(), type_=sa.Float(),
+                                      postgresql_using=f'{column}::double precision')
+        op.execute(f"UPDATE {table} SET " + ", ".join(
+            f"{column} = {column} / {float(_scale(column))}" for column in columns
+        ))
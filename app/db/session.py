@@ -1,6 +1,36 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
+# Asyncio drivers used by the API for each synchronous database URL scheme
+ASYNC_DRIVERS = {
+    "postgresql://": "postgresql+asyncpg://",
+    "postgresql+psycopg2://": "postgresql+asyncpg://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Return the URL of the same database using its asyncio driver.
+    """
+    for sync_scheme, async_scheme in ASYNC_DRIVERS.items():
+        if database_url.startswith(sync_scheme):
+            return async_scheme + database_url[len(sync_scheme):]
+    return database_url
+
+
+# Synchronous engine, used at startup and by scripts
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Asyncio engine used by the API endpoints, so database I/O does not block the event loop
+async_engine = create_async_engine(
+    get_async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+)
+# Objects are not expired on commit, since reloading them lazily is not possible with an AsyncSession
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
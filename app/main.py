@@ -1,15 +1,27 @@
+import asyncio
+from contextlib import suppress
+
 import psycopg2
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from prometheus_client import REGISTRY, make_asgi_app
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.util import get_remote_address
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.api.v1.api import api_router
+from app.core import metrics
 from app.core.config import settings
-from app.db.base import Base
-from app.db.session import engine
+from app.core.security import PasswordHasherBusy
+from app.db.migrate import upgrade_database
+from app.db.session import AsyncSessionLocal, engine, SessionLocal
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.dispatcher import DispatchingScheduler, create_dispatch_backend
+from app.schedulers.factory import create_scheduler
+from app.schedulers.locking import ClusterVersionConflict
+from app.schedulers.reconciler import reconcile_capacity_periodically
 
 
 # Function to create database if it doesn't exist
@@ -51,8 +63,41 @@ def create_database_if_not_exists():
 async def lifespan(app: FastAPI):
     # Startup logic
     create_database_if_not_exists()
-    Base.metadata.create_all(bind=engine)
+    upgrade_database(engine)
+
+    # A single scheduler owns the in-memory cluster state for the lifetime of the process
+    scheduler = create_scheduler(
+        settings.SCHEDULER_POLICY, settings.SCHEDULER_LOCK_BACKEND, settings.PLACEMENT_STRATEGY,
+        settings.SCHEDULER_SNAPSHOT_INTERVAL,
+    )
+    with SessionLocal() as db:
+        scheduler.hydrate(db)
+    if settings.SCHEDULER_DISPATCH == "inline":
+        app.state.scheduler = AsyncScheduler(scheduler, settings.SCHEDULER_DRAIN_DEBOUNCE)
+        # Coalesced queue drains run after the releases that trigger them, so a crash in between leaves them undone
+        async with AsyncSessionLocal() as db:
+            await app.state.scheduler.drain_queued_clusters(db)
+    else:
+        app.state.scheduler = DispatchingScheduler(
+            scheduler, create_dispatch_backend(settings.SCHEDULER_DISPATCH, settings.DISPATCH_REDIS_URL),
+            AsyncSessionLocal, settings.SCHEDULER_DRAIN_DEBOUNCE,
+        )
+        await app.state.scheduler.recover()
+    # Queue depths and utilization are read from the scheduler's in-memory state when /metrics is scraped
+    collector = metrics.register_cluster_states(scheduler.cluster_states)
+    reconciler = None
+    if settings.CAPACITY_RECONCILE_INTERVAL > 0:
+        reconciler = asyncio.create_task(reconcile_capacity_periodically(
+            app.state.scheduler, AsyncSessionLocal, settings.CAPACITY_RECONCILE_INTERVAL
+        ))
     yield
+    if reconciler is not None:
+        reconciler.cancel()
+        with suppress(asyncio.CancelledError):
+            await reconciler
+    if isinstance(app.state.scheduler, DispatchingScheduler):
+        await app.state.scheduler.close()
+    REGISTRY.unregister(collector)
 
 
 # Create the FastAPI app with lifespan
@@ -96,11 +141,28 @@ app.add_middleware(SlowAPIMiddleware)
 app.include_router(api_router, prefix="/api/v1")
 
 # Initialize the rate limiter with a global limit
-limiter = Limiter(key_func=get_remote_address, default_limits=["100/minute"])
+limiter = Limiter(key_func=get_remote_address, default_limits=[settings.RATE_LIMIT_DEFAULT])
 app.state.limiter = limiter
 app.add_exception_handler(429, _rate_limit_exceeded_handler)
 
 
+@app.exception_handler(ClusterVersionConflict)
+async def cluster_version_conflict_handler(request: Request, exc: ClusterVersionConflict):
+    # The cluster kept changing under the optimistic lock backend and the retries ran out
+    return JSONResponse(status_code=409, content={"detail": "Cluster is busy, please retry"})
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    # Too many logins or registrations are already waiting for bcrypt: fail fast instead of queueing
+    return JSONResponse(status_code=503, content={"detail": "Server is busy, please retry"},
+                        headers={"Retry-After": "1"})
+
+
+# Expose Prometheus metrics
+app.mount("/metrics", make_asgi_app())
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,21 +1,27 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, false
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 
 class Cluster(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    organization_id = Column(Integer, ForeignKey("organization.id"))
+    organization_id = Column(Integer, ForeignKey("organization.id"), index=True)
     
-    # Resource limits
-    cpu_limit = Column(Float)
-    ram_limit = Column(Float)
-    gpu_limit = Column(Float)
+    # Resource limits, in millicores, MiB and thousandths of a GPU (see app.core.units)
+    cpu_limit = Column(Integer)
+    ram_limit = Column(Integer)
+    gpu_limit = Column(Integer)
     
-    # Available resources
-    cpu_available = Column(Float)
-    ram_available = Column(Float)
-    gpu_available = Column(Float)
+    # Available resources, in the same units
+    cpu_available = Column(Integer)
+    ram_available = Column(Integer)
+    gpu_available = Column(Integer)
+
+    # Bumped on every committed scheduling decision by the optimistic lock backend (compare-and-swap)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Whether the fair_share scheduling policy shares the cluster between users with Dominant Resource Fairness
+    fair_share = Column(Boolean, nullable=False, default=False, server_default=false())
     
     # Relationships
     organization = relationship("Organization", back_populates="clusters")
@@ -0,0 +1,20 @@
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Integer, func
+
+from app.db.base_class import Base
+
+
+class ClusterSnapshot(Base):
+    """
+    In-memory scheduler state of a cluster once the events up to `last_event_id` were applied: its available
+    capacity and its running and pending deployments, the pending ones in dispatch order. Deployments are
+    stored as [id, priority, cpu, ram, gpu, owner_id] rows, so recovery does not have to read them back.
+    """
+    id = Column(Integer, primary_key=True)
+    cluster_id = Column(Integer, ForeignKey("cluster.id"), nullable=False, index=True)
+    last_event_id = Column(Integer, nullable=False)
+    cpu_available = Column(Integer, nullable=False)
+    ram_available = Column(Integer, nullable=False)
+    gpu_available = Column(Integer, nullable=False)
+    running = Column(JSON, nullable=False)
+    pending = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Index, bindparam
 from sqlalchemy.orm import relationship
 import enum
 from app.db.base_class import Base
@@ -20,18 +20,45 @@ valid_state_transitions = {
     DeploymentStatus.CANCELLED: [DeploymentStatus.PENDING]
 }
 
+# Deployments holding or waiting for cluster resources. The order matters: queries repeat the condition
+# of the partial index below verbatim, so that the query planner can use it.
+ACTIVE_STATUSES = [DeploymentStatus.PENDING, DeploymentStatus.RUNNING]
+
+
 class Deployment(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     cluster_id = Column(Integer, ForeignKey("cluster.id"))
+    # User who submitted the deployment, if authenticated; fair-share clusters share resources between users
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=True)
     docker_image = Column(String)
     status = Column(Enum(DeploymentStatus), default=DeploymentStatus.PENDING)
     priority = Column(Integer, default=0)
 
-    # Resource requirements
-    cpu_required = Column(Float)
-    ram_required = Column(Float)
-    gpu_required = Column(Float)
+    # Resource requirements, in millicores, MiB and thousandths of a GPU (see app.core.units)
+    cpu_required = Column(Integer)
+    ram_required = Column(Integer)
+    gpu_required = Column(Integer)
 
     # Relationships
     cluster = relationship("Cluster", back_populates="deployments")
+
+    __table_args__ = (
+        # Queue and capacity lookups of the scheduler: deployments of a cluster in a given status, by priority
+        Index("ix_deployment_cluster_id_status_priority", "cluster_id", "status", priority.desc()),
+        # Running and pending deployments are a small fraction of the history; this partial index keeps
+        # loading them at startup (and per cluster) proportional to the active set
+        Index(
+            "ix_deployment_active_cluster_id_priority", "cluster_id", priority.desc(),
+            postgresql_where=status.in_(ACTIVE_STATUSES),
+            sqlite_where=status.in_(ACTIVE_STATUSES),
+        ),
+    )
+
+
+def is_active():
+    """
+    Filter on running and pending deployments, with the statuses inlined in the SQL rather than bound as
+    parameters: planners only use a partial index when they can see that the query implies its condition.
+    """
+    return Deployment.status.in_(bindparam("active_statuses", ACTIVE_STATUSES, expanding=True, literal_execute=True))
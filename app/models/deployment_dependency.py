@@ -0,0 +1,27 @@
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, exists, false
+
+from app.db.base_class import Base
+from app.models.deployment import Deployment
+
+
+class DeploymentDependency(Base):
+    """
+    Edge of the deployment dependency graph: `deployment_id` may only start once `depends_on_id` has completed.
+
+    `satisfied` is set when the dependency completes (or if it had already completed when the edge was
+    created) and is never reset, so a deployment whose dependencies were all satisfied once stays eligible
+    even if one of them is run again later.
+    """
+    deployment_id = Column(Integer, ForeignKey("deployment.id"), primary_key=True)
+    depends_on_id = Column(Integer, ForeignKey("deployment.id"), primary_key=True, index=True)
+    satisfied = Column(Boolean, nullable=False, default=False, server_default=false())
+
+
+def is_blocked():
+    """
+    Filter on deployments that still wait for at least one of their dependencies to complete.
+    """
+    return exists().where(
+        DeploymentDependency.deployment_id == Deployment.id,
+        DeploymentDependency.satisfied.is_(False),
+    )
@@ -0,0 +1,40 @@
+import enum
+
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Index, Integer, func
+
+from app.db.base_class import Base
+
+
+class DeploymentEventKind(enum.Enum):
+    # Created and pushed on its cluster queue
+    SUBMITTED = "submitted"
+    # Taken out of the queue to wait for its dependencies (right after being submitted or requeued)
+    BLOCKED = "blocked"
+    # Its last dependency completed, so it joined the queue
+    QUEUED = "queued"
+    STARTED = "started"
+    # Sent back to the queue to make room for a more important deployment
+    PREEMPTED = "preempted"
+    # Sent back to the queue by the policy (backfill eviction) or by a status update
+    REQUEUED = "requeued"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class DeploymentEvent(Base):
+    """
+    Append-only log of the scheduling decisions on each deployment, written in the transaction that takes
+    them. The ID orders the log: replaying the events of a cluster after its latest `ClusterSnapshot`
+    rebuilds its in-memory state.
+    """
+    id = Column(Integer, primary_key=True)
+    cluster_id = Column(Integer, ForeignKey("cluster.id"), nullable=False)
+    deployment_id = Column(Integer, ForeignKey("deployment.id"), nullable=False)
+    kind = Column(Enum(DeploymentEventKind), nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # Tail of the log of a cluster after its latest snapshot
+        Index("ix_deploymentevent_cluster_id_id", "cluster_id", "id"),
+    )
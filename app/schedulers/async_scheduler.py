@@ -0,0 +1,255 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.locking import ClusterVersionConflict
+from app.schedulers.placement import PLACEMENT_ATTEMPTS
+from app.schedulers.scheduler_interface import Scheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+T = TypeVar("T")
+
+
+class AsyncScheduler:
+    """
+    Asyncio front-end of a Scheduler, used by the endpoints with an AsyncSession.
+
+    Decisions run through `AsyncSession.run_sync`, so the scheduler and its in-memory state stay synchronous
+    while database I/O yields to the event loop. Every run_sync call runs on the event loop thread, so the
+    scheduler's thread locks cannot tell concurrent requests apart: decisions on the same cluster are
+    serialized here with one asyncio lock per cluster, before entering the scheduler. For the same reason,
+    decisions that hit a cluster version conflict (optimistic lock backend) are retried here, backing off with
+    `asyncio.sleep` outside of the cluster locks, rather than by the scheduler, whose backoff would stall the
+    event loop and every request in progress.
+
+    Queue drains are coalesced per cluster: the drains requested before a pass started share that pass, and
+    those requested during a pass share the next one, so a storm of completions on a cluster drains its queue
+    a few times instead of once per completion. A status update alone on its cluster drains in the same
+    transaction as its release instead. `drain_debounce` delays each coalesced pass by that many seconds to
+    let more requests join it.
+    """
+
+    def __init__(self, scheduler: Scheduler, drain_debounce: float = 0.0):
+        self.scheduler = scheduler
+        self.drain_debounce = drain_debounce
+        self.cluster_locks: Dict[int, asyncio.Lock] = {}
+        # Next queue drain of each cluster, requested but not started yet
+        self._next_drains: Dict[int, asyncio.Future] = {}
+        # Status updates in progress on each cluster, including those waiting for its lock
+        self._status_updates: Dict[int, int] = {}
+
+    @asynccontextmanager
+    async def _lock(self, *cluster_ids: int) -> AsyncIterator[None]:
+        """
+        Hold the locks of the given clusters, timing how long each was waited for and held: these are the locks
+        concurrent requests of this process queue on.
+        """
+        cluster_ids = sorted(set(cluster_ids))
+        async with AsyncExitStack() as stack:
+            # Same order as the scheduler's own locks, so multi-cluster decisions cannot deadlock
+            for cluster_id in cluster_ids:
+                start = time.perf_counter()
+                await stack.enter_async_context(self.cluster_locks.setdefault(cluster_id, asyncio.Lock()))
+                metrics.for_cluster(cluster_id).lock_wait.observe(time.perf_counter() - start)
+            acquired = time.perf_counter()
+            try:
+                yield
+            finally:
+                held = time.perf_counter() - acquired
+                for cluster_id in cluster_ids:
+                    metrics.for_cluster(cluster_id).lock_hold.observe(held)
+
+    async def _retrying(self, db: AsyncSession, decide: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `decide()` until it does not raise ClusterVersionConflict, waiting between attempts as long as the
+        scheduler says, or until it gives up.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.scheduler.raising_conflicts(db.sync_session):
+                    return await decide()
+            except ClusterVersionConflict as conflict:
+                attempt += 1
+                delay = self.scheduler.retry_delay(attempt)
+                if delay is None:
+                    raise
+                metrics.for_cluster(conflict.cluster_id).version_retries.inc()
+                await asyncio.sleep(delay)
+
+    async def _decide(self, db: AsyncSession, cluster_ids: Set[int], decision: Callable[..., T], *args,
+                      **kwargs) -> T:
+        """
+        Run a scheduler decision under the locks of the given clusters, retrying it on conflicts.
+        """
+        async def locked() -> T:
+            async with self._lock(*cluster_ids):
+                return await db.run_sync(decision, *args, **kwargs)
+        return await self._retrying(db, locked)
+
+    async def schedule(self, db: AsyncSession, cluster: Cluster, deployment_in: DeploymentCreate,
+                       user_id: Optional[int] = None) -> DeploymentModel:
+        dependency_clusters = await db.run_sync(self.scheduler.dependency_clusters, deployment_in.depends_on)
+        return await self._decide(db, {cluster.id, *dependency_clusters}, self.scheduler.schedule, cluster,
+                                  deployment_in, user_id=user_id)
+
+    async def schedule_in_organization(self, db: AsyncSession, organization_id: int,
+                                       deployment_in: DeploymentCreate,
+                                       user_id: Optional[int] = None) -> Optional[DeploymentModel]:
+        # Same loop as Scheduler.schedule_in_organization: other requests may fill the chosen cluster while
+        # waiting for its lock, in which case the placement is checked again and retried
+        dependency_clusters = await db.run_sync(self.scheduler.dependency_clusters, deployment_in.depends_on)
+        for attempt in range(PLACEMENT_ATTEMPTS):
+            cluster_id, has_room = await db.run_sync(self.scheduler.choose_cluster, organization_id, deployment_in)
+            if cluster_id is None:
+                return None
+            deployment = await self._decide(db, {cluster_id, *dependency_clusters}, self.scheduler.place, cluster_id,
+                                            deployment_in, has_room and attempt + 1 < PLACEMENT_ATTEMPTS,
+                                            user_id=user_id)
+            if deployment is not None:
+                return deployment
+
+    async def schedule_batch(self, db: AsyncSession, clusters: Dict[int, Cluster],
+                             deployments_in: List[DeploymentCreate],
+                             batch_dependencies: Optional[Dict[int, List[int]]] = None,
+                             user_id: Optional[int] = None) -> List[Tuple[int, DeploymentStatus]]:
+        dependency_clusters = await db.run_sync(self.scheduler.dependency_clusters, {
+            depends_on_id for deployment_in in deployments_in for depends_on_id in deployment_in.depends_on
+        })
+        return await self._decide(db, {*clusters, *dependency_clusters}, self.scheduler.schedule_batch, clusters,
+                                  deployments_in, batch_dependencies, user_id=user_id)
+
+    async def admit(self, db: AsyncSession, deployment_id: int) -> Optional[DeploymentModel]:
+        cluster_ids = await db.run_sync(self.scheduler.admission_clusters, deployment_id)
+        if not cluster_ids:
+            return None
+        return await self._decide(db, cluster_ids, self.scheduler.admit, deployment_id)
+
+    async def drain_cluster_queue(self, db: AsyncSession, cluster_id: int):
+        """
+        Drain the queue of a cluster, sharing the pass with the other drains of the cluster requested before
+        it starts. Returns once a pass that started after the call has ended.
+        """
+        next_drain = self._next_drains.get(cluster_id)
+        if next_drain is not None:
+            metrics.QUEUE_DRAINS_COALESCED.inc()
+            await asyncio.wait([next_drain])
+            if not next_drain.cancelled():
+                return
+            # The pass failed before draining, or its request was cancelled: drain in this request instead
+            return await self.drain_cluster_queue(db, cluster_id)
+
+        next_drain = self._next_drains[cluster_id] = asyncio.get_running_loop().create_future()
+        try:
+            if self.drain_debounce > 0:
+                await asyncio.sleep(self.drain_debounce)
+            # Checked out before the lock, like any request waiting for it: requests queued on the lock with
+            # their connection could otherwise exhaust the pool while the pass waits for one under the lock
+            await db.connection()
+            started = False
+
+            async def drain():
+                nonlocal started
+                async with self._lock(cluster_id):
+                    # Drains requested from now on may come after what this pass reads, so they wait for the
+                    # next one. A retry reads even later, so it serves the same drains.
+                    if not started:
+                        self._drain_started(cluster_id)
+                        started = True
+                    await db.run_sync(self.scheduler.drain_cluster_queue, cluster_id)
+
+            await self._retrying(db, drain)
+        except BaseException:
+            if self._next_drains.get(cluster_id) is next_drain:
+                del self._next_drains[cluster_id]
+            next_drain.cancel()
+            raise
+        next_drain.set_result(None)
+
+    def _drain_started(self, cluster_id: int):
+        del self._next_drains[cluster_id]
+
+    async def drain_queued_clusters(self, db: AsyncSession):
+        """
+        Drain every queue that has deployments waiting, e.g. at startup in case a drain was lost in a crash.
+        """
+        for cluster_id in self.scheduler.queued_clusters():
+            await self.drain_cluster_queue(db, cluster_id)
+
+    async def reconcile_capacity(self, db: AsyncSession) -> List[int]:
+        """
+        Check the clusters changed since the previous pass with one query, then correct those that drifted,
+        each under its lock. Returns the corrected clusters. If the pass fails, the clusters it did not check
+        are left for the next one.
+        """
+        unchecked = self.scheduler.take_dirty_clusters()
+        if not unchecked:
+            return []
+        corrected = []
+        try:
+            unchecked = set(await db.run_sync(self.scheduler.drifted_clusters, unchecked))
+            for cluster_id in sorted(unchecked):
+                if await self._decide(db, {cluster_id}, self.scheduler.reconcile_cluster, cluster_id):
+                    corrected.append(cluster_id)
+                unchecked.discard(cluster_id)
+        except BaseException:
+            self.scheduler.mark_dirty_clusters(unchecked)
+            raise
+        return corrected
+
+    async def update_deployment_status(self, db: AsyncSession, deployment: DeploymentModel,
+                                       status_update: DeploymentStatusUpdate) -> DeploymentModel:
+        drains: Set[int] = set()
+        deployment = await self._update_deployment_status(db, deployment, status_update, drains)
+        # Drains deferred because other updates of the cluster were in progress, coalesced with theirs
+        for cluster_id in sorted(drains):
+            await self.drain_cluster_queue(db, cluster_id)
+        return deployment
+
+    def _defers_drains(self, cluster_id: int) -> bool:
+        """
+        Whether a status update on the cluster leaves the queue drains it triggers to `drain_cluster_queue`:
+        only if other updates of the cluster are in progress or a drain is about to start, which can then
+        serve them all. Called under the cluster lock.
+        """
+        return self._status_updates[cluster_id] > 1 or cluster_id in self._next_drains
+
+    async def _update_deployment_status(self, db: AsyncSession, deployment: DeploymentModel,
+                                        status_update: DeploymentStatusUpdate, drains: Set[int]) -> DeploymentModel:
+        """
+        Apply the transition under the locks it needs, adding the clusters whose drain it deferred to `drains`.
+        """
+        cluster_id = deployment.cluster_id
+        self._status_updates[cluster_id] = self._status_updates.get(cluster_id, 0) + 1
+
+        async def update() -> DeploymentModel:
+            # Completing a deployment may start deployments of other clusters that were waiting for it. Those
+            # can change until the lock of the deployment's cluster is held, so lock again if the set grew.
+            cluster_ids = await db.run_sync(self.scheduler.status_update_clusters, deployment, status_update)
+            while True:
+                async with self._lock(*cluster_ids):
+                    required = await db.run_sync(self.scheduler.status_update_clusters, deployment, status_update)
+                    if required <= cluster_ids:
+                        if not self._defers_drains(cluster_id):
+                            # Released and drained in one transaction
+                            return await db.run_sync(self.scheduler.update_deployment_status, deployment,
+                                                     status_update)
+                        with self.scheduler.deferring_queue_drains(db.sync_session) as deferred:
+                            updated = await db.run_sync(self.scheduler.update_deployment_status, deployment,
+                                                        status_update)
+                        drains.update(deferred)
+                        return updated
+                cluster_ids |= required
+
+        try:
+            return await self._retrying(db, update)
+        finally:
+            self._status_updates[cluster_id] -= 1
+            if not self._status_updates[cluster_id]:
+                del self._status_updates[cluster_id]
@@ -0,0 +1,114 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.cluster_state import ClusterState, DeploymentEntry
+from app.schedulers.locking import ClusterLockBackend
+from app.schedulers.preemption import select_victims
+from app.schedulers.priority_preemption_scheduler import DEFAULT_SNAPSHOT_INTERVAL, AdvancedScheduler
+
+
+class BackfillScheduler(AdvancedScheduler):
+    """
+    Priority scheduler with conservative backfilling.
+
+    When the head of a cluster queue does not fit, the strict policy stops and leaves the cluster idle.
+    This policy instead reserves the resources the head needs and lets lower priority deployments that
+    fit start in the meantime ("backfill"). Deployments have no runtime estimates, so the reservation is
+    enforced by eviction: backfilled deployments are requeued as soon as the resources they hold would
+    let the head start. The head therefore starts no later than it would under strict priority.
+    """
+
+    def __init__(self, lock_backend: Optional[ClusterLockBackend] = None, placement_strategy: str = "best_fit",
+                 max_backfill_candidates: int = 100, snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+        super().__init__(lock_backend, placement_strategy, snapshot_interval)
+        # Number of deployments behind the head considered for backfilling on each pass
+        self.max_backfill_candidates = max_backfill_candidates
+        # Deployments running ahead of their turn, per cluster, that may be evicted for the reserved head, with
+        # their position in the dispatch order of the queue when they started
+        self.backfilled: Dict[int, Dict[int, Tuple[int, int]]] = {}
+        # In-memory state of the cluster each backfilled map was built with
+        self._backfilled_states: Dict[int, ClusterState] = {}
+
+    def _backfilled(self, state: ClusterState) -> Dict[int, Tuple[int, int]]:
+        """
+        Backfilled deployments of a cluster. They live as long as the cluster's in-memory state, which a
+        failed transaction discards like the decisions that changed them; when the state is loaded again
+        (rollback, restart, distributed lock backend), they are derived from it. The order in which running
+        deployments were dispatched is not persisted, so those with a lower priority than the head, or the
+        same priority and a later submission, are taken as backfilled, and placed behind the queued ones.
+        """
+        if self._backfilled_states.get(state.id) is not state:
+            head = state.pending.peek()
+            self.backfilled[state.id] = {} if head is None else {
+                entry.id: state.pending.dispatch_key(entry)
+                for entry in sorted(state.running.values(), key=lambda entry: entry.id)
+                if (entry.priority, -entry.id) < (head.priority, -head.id)
+            }
+            self._backfilled_states[state.id] = state
+        return self.backfilled[state.id]
+
+    def _admit(self, db: Session, deployment: DeploymentModel, cluster: Cluster, state: ClusterState):
+        backfilled = self._backfilled(state)
+        super()._admit(db, deployment, cluster, state)
+
+        # A new deployment that started while a more important one waits is backfilling too
+        head = state.pending.peek()
+        if deployment.status == DeploymentStatus.RUNNING and head is not None:
+            key = state.pending.dispatch_key(state.running[deployment.id])
+            if key > state.pending.dispatch_key(head):
+                backfilled[deployment.id] = key
+
+    def _select_from_queue(self, state: ClusterState) -> Tuple[List[DeploymentEntry], List[DeploymentEntry]]:
+        backfilled = self._backfilled(state)
+        for stopped_id in [deployment_id for deployment_id in backfilled if deployment_id not in state.running]:
+            del backfilled[stopped_id]
+
+        started_entries: List[DeploymentEntry] = []
+        requeued_entries: List[DeploymentEntry] = []
+        while state.pending:
+            # Start everything that fits in strict priority order
+            started, _ = super()._select_from_queue(state)
+            started_entries.extend(started)
+
+            # The head is blocked: start it if evicting backfilled deployments frees enough resources
+            head = state.pending.peek()
+            if head is None:
+                break
+            victims = self._reclaim_for(head, state, backfilled)
+            if victims is None:
+                break
+            for victim in victims:
+                state.release(victim.id)
+                state.enqueue(victim)
+                del backfilled[victim.id]
+                requeued_entries.append(victim)
+            state.pending.pop()
+            state.allocate(head)
+            started_entries.append(head)
+
+        if not state.pending:
+            # Nothing is waiting any more, so no reservation has to be protected
+            backfilled.clear()
+            return started_entries, requeued_entries
+
+        # Backfill lower priority deployments into the resources the reserved head cannot use yet
+        for candidate in state.pending.in_order(limit=self.max_backfill_candidates + 1)[1:]:
+            if state.has_capacity_for(candidate):
+                backfilled[candidate.id] = state.pending.dispatch_key(candidate)
+                state.allocate(candidate)
+                started_entries.append(candidate)
+        return started_entries, requeued_entries
+
+    @staticmethod
+    def _reclaim_for(head: DeploymentEntry, state: ClusterState,
+                     backfilled: Dict[int, Tuple[int, int]]) -> Optional[List[DeploymentEntry]]:
+        """
+        Pick the cheapest set of backfilled deployments to evict so the head fits, among those dispatched
+        behind it in queue order. Returns None if evicting all of them would still not be enough.
+        """
+        head_key = state.pending.dispatch_key(head)
+        evictable = [state.running[deployment_id] for deployment_id, key in backfilled.items() if key > head_key]
+        return select_victims(head, state, evictable)
@@ -0,0 +1,95 @@
+import threading
+from typing import Dict, Iterable
+
+import numpy as np
+
+# Row of each resource in the capacity matrix
+CPU, RAM, GPU = 0, 1, 2
+
+
+class CapacityMatrix:
+    """
+    Capacity of every known cluster held in NumPy arrays, one column per cluster.
+
+    Fit checks and placement scores over many clusters then run as a few vector operations instead of three
+    comparisons per cluster in Python. Amounts are integer resource units (see app.core.units), so fit checks
+    are exact. Each resource ({cpu, ram, gpu}) is a contiguous row, so the
+    checks compare whole rows at once. Columns are assigned once per cluster ID and kept in sync by the
+    ClusterState bound to them, which writes its available capacity and the length of its pending queue
+    back on every change. The inverse of the limits (0 for a resource the cluster does not have) is kept
+    alongside, so normalizing by the limits is a multiplication.
+
+    Growing the arrays replaces them, so every write goes through the lock that guards the growth: a write
+    to the arrays being replaced would be lost.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self.limits = np.zeros((3, capacity), dtype=np.int64)
+        self.available = np.zeros((3, capacity), dtype=np.int64)
+        self.inverse_limits = np.zeros((3, capacity))
+        self.pending = np.zeros(capacity, dtype=np.int64)
+        self._columns: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def column(self, cluster_id: int) -> int:
+        """
+        Return the column of a cluster, assigning a new one (and growing the arrays) if it has none yet.
+        """
+        column = self._columns.get(cluster_id)
+        if column is not None:
+            return column
+        with self._lock:
+            column = self._columns.get(cluster_id)
+            if column is None:
+                column = len(self._columns)
+                if column == len(self.pending):
+                    self._grow()
+                self._columns[cluster_id] = column
+            return column
+
+    def columns(self, cluster_ids: Iterable[int]) -> np.ndarray:
+        """
+        Columns of the given clusters. Raises KeyError for a cluster without one.
+        """
+        return np.fromiter(map(self._columns.__getitem__, cluster_ids), dtype=np.intp)
+
+    def set(self, column: int, limits, available, pending: int):
+        with self._lock:
+            self.limits[:, column] = limits
+            self.available[:, column] = available
+            self.pending[column] = pending
+            limits = self.limits[:, column]
+            self.inverse_limits[:, column] = np.divide(1.0, limits, out=np.zeros(3), where=limits > 0)
+
+    def update(self, column: int, available, pending: int):
+        """
+        Write the available capacity and pending queue length of a cluster.
+        """
+        with self._lock:
+            self.available[:, column] = available
+            self.pending[column] = pending
+
+    def fit_mask(self, columns: np.ndarray, demand: np.ndarray) -> np.ndarray:
+        """
+        Whether each cluster has room right now for a deployment requiring `demand` ({cpu, ram, gpu}).
+        """
+        available = self.available.take(columns, axis=1)
+        return (available[CPU] >= demand[CPU]) & (available[RAM] >= demand[RAM]) & (available[GPU] >= demand[GPU])
+
+    def limit_mask(self, columns: np.ndarray, demand: np.ndarray) -> np.ndarray:
+        """
+        Whether each cluster is large enough to ever run the deployment.
+        """
+        limits = self.limits.take(columns, axis=1)
+        return (limits[CPU] >= demand[CPU]) & (limits[RAM] >= demand[RAM]) & (limits[GPU] >= demand[GPU])
+
+    def _grow(self):
+        capacity = 2 * len(self.pending)
+        for name in ("limits", "available", "inverse_limits", "pending"):
+            array = getattr(self, name)
+            grown = np.zeros(array.shape[:-1] + (capacity,), dtype=array.dtype)
+            grown[..., :array.shape[-1]] = array
+            setattr(self, name, grown)
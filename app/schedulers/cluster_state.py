@@ -0,0 +1,362 @@
+import threading
+from collections import Counter
+from dataclasses import astuple, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from app.models.cluster import Cluster
+from app.models.cluster_snapshot import ClusterSnapshot
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus, is_active
+from app.models.deployment_dependency import is_blocked
+from app.models.deployment_event import DeploymentEvent, DeploymentEventKind
+from app.schedulers.capacity_matrix import CapacityMatrix
+from app.schedulers.pending_queue import PendingQueue
+
+
+@dataclass
+class DeploymentEntry:
+    """
+    Compact in-memory view of a deployment, holding only what scheduling decisions need.
+    """
+    id: int
+    priority: int
+    cpu_required: int
+    ram_required: int
+    gpu_required: int
+    # User who submitted the deployment, used by fair-share queues
+    owner_id: Optional[int] = None
+
+    @classmethod
+    def from_model(cls, deployment: DeploymentModel) -> "DeploymentEntry":
+        return cls(
+            id=deployment.id,
+            priority=deployment.priority,
+            cpu_required=deployment.cpu_required,
+            ram_required=deployment.ram_required,
+            gpu_required=deployment.gpu_required,
+            owner_id=deployment.user_id,
+        )
+
+    def as_row(self) -> list:
+        """
+        JSON-serializable form stored in cluster snapshots; `DeploymentEntry(*row)` reads it back.
+        """
+        return list(astuple(self))
+
+
+# Events leaving a deployment running, waiting in its cluster queue, or neither
+_STARTING_EVENTS = {DeploymentEventKind.STARTED}
+_LEAVING_EVENTS = {DeploymentEventKind.BLOCKED, DeploymentEventKind.COMPLETED, DeploymentEventKind.FAILED,
+                   DeploymentEventKind.CANCELLED}
+
+
+@dataclass
+class ClusterState:
+    """
+    Authoritative in-memory view of a cluster's capacity and its running/pending deployments.
+    All mutations should be protected by the scheduler's cluster lock.
+    """
+    id: int
+    organization_id: int
+    cpu_limit: int
+    ram_limit: int
+    gpu_limit: int
+    cpu_available: int
+    ram_available: int
+    gpu_available: int
+    version: int = 0
+    running: Dict[int, DeploymentEntry] = field(default_factory=dict)
+    pending: PendingQueue = field(default_factory=PendingQueue)
+    # Column of the capacity matrix mirroring this cluster, kept in sync on every change
+    matrix: Optional[CapacityMatrix] = field(default=None, repr=False, compare=False)
+    column: int = field(default=-1, repr=False, compare=False)
+
+    @classmethod
+    def from_model(cls, cluster: Cluster, pending: Optional[PendingQueue] = None) -> "ClusterState":
+        return cls(
+            id=cluster.id,
+            organization_id=cluster.organization_id,
+            cpu_limit=cluster.cpu_limit,
+            ram_limit=cluster.ram_limit,
+            gpu_limit=cluster.gpu_limit,
+            cpu_available=cluster.cpu_available,
+            ram_available=cluster.ram_available,
+            gpu_available=cluster.gpu_available,
+            version=cluster.version or 0,
+            pending=pending if pending is not None else PendingQueue(),
+        )
+
+    @classmethod
+    def from_snapshot(cls, cluster: Cluster, snapshot: ClusterSnapshot,
+                      pending: Optional[PendingQueue] = None) -> "ClusterState":
+        state = cls.from_model(cluster, pending)
+        state.cpu_available = snapshot.cpu_available
+        state.ram_available = snapshot.ram_available
+        state.gpu_available = snapshot.gpu_available
+        for row in snapshot.running:
+            entry = DeploymentEntry(*row)
+            state.running[entry.id] = entry
+            state.pending.started(entry)
+        for row in snapshot.pending:
+            state.pending.push(DeploymentEntry(*row))
+        return state
+
+    def to_snapshot(self, last_event_id: int) -> ClusterSnapshot:
+        return ClusterSnapshot(
+            cluster_id=self.id,
+            last_event_id=last_event_id,
+            cpu_available=self.cpu_available,
+            ram_available=self.ram_available,
+            gpu_available=self.gpu_available,
+            running=[entry.as_row() for entry in self.running.values()],
+            pending=[entry.as_row() for entry in self.pending.in_order()],
+        )
+
+    def apply(self, kind: DeploymentEventKind, entry: DeploymentEntry):
+        """
+        Replay a logged event. Events only state where the deployment ended up, so applying one that already
+        holds (e.g. STARTED for a running deployment) leaves the state unchanged.
+        """
+        if kind in _STARTING_EVENTS:
+            if entry.id not in self.running:
+                self.allocate(entry)
+            return
+        if entry.id in self.running:
+            self.release(entry.id)
+        if kind in _LEAVING_EVENTS:
+            self.discard(entry.id)
+        elif entry.id not in self.pending:
+            self.enqueue(entry)
+
+    def has_capacity_for(self, entry) -> bool:
+        return (self.cpu_available >= entry.cpu_required
+                and self.ram_available >= entry.ram_required
+                and self.gpu_available >= entry.gpu_required)
+
+    def allocate(self, entry: DeploymentEntry):
+        """
+        Move a deployment to the running set and reserve its resources.
+        """
+        self.pending.remove(entry.id)
+        self.running[entry.id] = entry
+        self.cpu_available -= entry.cpu_required
+        self.ram_available -= entry.ram_required
+        self.gpu_available -= entry.gpu_required
+        self.pending.started(entry)
+        self._sync_matrix()
+
+    def release(self, deployment_id: int) -> DeploymentEntry:
+        """
+        Remove a deployment from the running set and give its resources back to the cluster.
+        """
+        entry = self.running.pop(deployment_id)
+        self.cpu_available += entry.cpu_required
+        self.ram_available += entry.ram_required
+        self.gpu_available += entry.gpu_required
+        self.pending.stopped(entry)
+        self._sync_matrix()
+        return entry
+
+    def enqueue(self, entry: DeploymentEntry):
+        self.pending.push(entry)
+        self._sync_matrix()
+
+    def discard(self, deployment_id: int):
+        """
+        Forget a deployment that is no longer running or pending, without touching capacity.
+        """
+        self.pending.remove(deployment_id)
+        self._sync_matrix()
+
+    def reset_capacity(self, cpu_available: int, ram_available: int, gpu_available: int):
+        """
+        Overwrite the available capacity, e.g. with the one recomputed from the running deployments.
+        """
+        self.cpu_available, self.ram_available, self.gpu_available = cpu_available, ram_available, gpu_available
+        self._sync_matrix()
+
+    def _sync_matrix(self):
+        matrix = self.matrix
+        if matrix is not None:
+            matrix.update(self.column, (self.cpu_available, self.ram_available, self.gpu_available), len(self.pending))
+
+    def copy_capacity_to(self, cluster: Cluster):
+        """
+        Write the authoritative available capacity onto the ORM cluster row.
+        """
+        cluster.cpu_available = self.cpu_available
+        cluster.ram_available = self.ram_available
+        cluster.gpu_available = self.gpu_available
+
+
+class ClusterStateStore:
+    """
+    Process-wide registry of ClusterState objects.
+
+    The store is hydrated once at startup and then kept in sync by the scheduler on every transition.
+    Clusters created after startup are loaded lazily the first time the scheduler sees them.
+    Every state is bound to a column of `matrix`, so placement can score many clusters at once.
+    """
+
+    def __init__(self, new_queue: Optional[Callable[[Cluster], PendingQueue]] = None):
+        # Builds the pending queue of a cluster, so policies can order some queues differently
+        self._new_queue = new_queue or (lambda cluster: PendingQueue())
+        self._states: Dict[int, ClusterState] = {}
+        self._lock = threading.Lock()
+        self.matrix = CapacityMatrix()
+
+    def __contains__(self, cluster_id: int) -> bool:
+        return cluster_id in self._states
+
+    def hydrate(self, db: Session):
+        """
+        Load every cluster with its running and pending deployments using two queries.
+        Pending deployments still waiting for their dependencies are left out of the queues.
+        """
+        states = {cluster.id: ClusterState.from_model(cluster, self._new_queue(cluster))
+                  for cluster in db.query(Cluster).all()}
+        active_deployments = db.query(DeploymentModel).filter(is_active(), ~is_blocked()).all()
+        self._add_deployments(states, active_deployments)
+
+        with self._lock:
+            for state in self._states.values():
+                state.matrix = None
+            for state in states.values():
+                self._bind(state)
+            self._states = states
+
+    def recover(self, db: Session) -> Dict[int, int]:
+        """
+        Rebuild every cluster from its latest snapshot and the events logged after it, so startup reads a
+        bounded tail of the log rather than every active deployment. Clusters without a snapshot are loaded
+        from their deployments as in `hydrate`. Returns the number of events replayed per cluster.
+        """
+        clusters = {cluster.id: cluster for cluster in db.query(Cluster).all()}
+        latest_ids = select(func.max(ClusterSnapshot.id)).group_by(ClusterSnapshot.cluster_id)
+        states = {
+            snapshot.cluster_id: ClusterState.from_snapshot(clusters[snapshot.cluster_id], snapshot,
+                                                            self._new_queue(clusters[snapshot.cluster_id]))
+            for snapshot in db.scalars(select(ClusterSnapshot).where(ClusterSnapshot.id.in_(latest_ids)))
+        }
+
+        tail = db.execute(
+            select(DeploymentEvent.cluster_id, DeploymentEvent.deployment_id, DeploymentEvent.kind)
+            .join(ClusterSnapshot, and_(ClusterSnapshot.cluster_id == DeploymentEvent.cluster_id,
+                                        DeploymentEvent.id > ClusterSnapshot.last_event_id))
+            .where(ClusterSnapshot.id.in_(latest_ids))
+            .order_by(DeploymentEvent.id)
+        ).all()
+        # Deployments submitted (or back from a terminal status) after the snapshot are read in one query
+        entries: Dict[int, DeploymentEntry] = {}
+        for state in states.values():
+            entries.update(state.running)
+            entries.update((entry.id, entry) for entry in state.pending.in_order())
+        missing_ids = {event.deployment_id for event in tail} - entries.keys()
+        if missing_ids:
+            entries.update((deployment.id, DeploymentEntry.from_model(deployment)) for deployment in
+                           db.query(DeploymentModel).filter(DeploymentModel.id.in_(missing_ids)))
+        for event in tail:
+            states[event.cluster_id].apply(event.kind, entries[event.deployment_id])
+
+        unsnapshotted = {cluster_id: ClusterState.from_model(cluster, self._new_queue(cluster))
+                         for cluster_id, cluster in clusters.items() if cluster_id not in states}
+        if unsnapshotted:
+            self._add_deployments(unsnapshotted, db.query(DeploymentModel).filter(
+                DeploymentModel.cluster_id.in_(unsnapshotted), is_active(), ~is_blocked()
+            ))
+            states.update(unsnapshotted)
+
+        with self._lock:
+            for state in self._states.values():
+                state.matrix = None
+            for state in states.values():
+                self._bind(state)
+            self._states = states
+        return dict(Counter(event.cluster_id for event in tail))
+
+    def get(self, db: Session, cluster_id: int) -> ClusterState:
+        """
+        Return the state of a cluster, loading it from the database if it is not known yet.
+        """
+        state = self._states.get(cluster_id)
+        if state is None:
+            state = self.load(db, cluster_id)
+        return state
+
+    def states(self) -> List[ClusterState]:
+        """
+        Snapshot of the known cluster states, e.g. for metrics.
+        """
+        with self._lock:
+            return list(self._states.values())
+
+    def columns(self, db: Session, cluster_ids: List[int]) -> np.ndarray:
+        """
+        Return the capacity matrix columns of the given clusters, in the same order, loading those not known yet.
+        """
+        try:
+            return self.matrix.columns(cluster_ids)
+        except KeyError:
+            for cluster_id in cluster_ids:
+                self.get(db, cluster_id)
+            return self.matrix.columns(cluster_ids)
+
+    def load(self, db: Session, cluster_id: int) -> ClusterState:
+        """
+        (Re)build the state of a single cluster from the database.
+        """
+        cluster = db.get(Cluster, cluster_id, populate_existing=True)
+        state = ClusterState.from_model(cluster, self._new_queue(cluster))
+        active_deployments = db.query(DeploymentModel).filter(
+            DeploymentModel.cluster_id == cluster_id,
+            is_active(),
+            ~is_blocked(),
+        ).all()
+        self._add_deployments({cluster_id: state}, active_deployments)
+
+        with self._lock:
+            previous = self._states.get(cluster_id)
+            if previous is not None:
+                previous.matrix = None
+            self._bind(state)
+            self._states[cluster_id] = state
+        return state
+
+    def put(self, state: ClusterState):
+        """
+        Register a state built without the database, e.g. by benchmarks and simulations.
+        """
+        with self._lock:
+            self._bind(state)
+            self._states[state.id] = state
+
+    def invalidate(self, cluster_id: int):
+        """
+        Drop the state of a cluster, e.g. after a failed transaction. It is reloaded on next use.
+        """
+        with self._lock:
+            state = self._states.pop(cluster_id, None)
+            if state is not None:
+                state.matrix = None
+
+    def _bind(self, state: ClusterState):
+        state.matrix, state.column = self.matrix, self.matrix.column(state.id)
+        self.matrix.set(state.column, (state.cpu_limit, state.ram_limit, state.gpu_limit),
+                        (state.cpu_available, state.ram_available, state.gpu_available), len(state.pending))
+
+    @staticmethod
+    def _add_deployments(states: Dict[int, ClusterState], deployments: Iterable[DeploymentModel]):
+        # Oldest first, so the FIFO order of the pending queues follows submission order
+        for deployment in sorted(deployments, key=lambda d: d.id):
+            state = states.get(deployment.cluster_id)
+            if state is None:
+                continue
+            entry = DeploymentEntry.from_model(deployment)
+            if deployment.status == DeploymentStatus.RUNNING:
+                state.running[entry.id] = entry
+                state.pending.started(entry)
+            else:
+                state.pending.push(entry)
@@ -0,0 +1,138 @@
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.models.deployment_dependency import DeploymentDependency
+
+
+class DependencyCycle(Exception):
+    """
+    Raised when dependencies submitted together would form a cycle, so none of them could ever start.
+    """
+
+    def __init__(self, nodes: List[int]):
+        super().__init__(f"Dependency cycle between {', '.join(map(str, nodes))}")
+        self.nodes = nodes
+
+
+def topological_order(node_count: int, edges: Iterable[Tuple[int, int]]) -> List[int]:
+    """
+    Order nodes 0..node_count-1 so that for every (before, after) edge `before` comes first (Kahn's algorithm).
+    Runs in O(nodes + edges). Raises DependencyCycle with the nodes left over if the edges contain a cycle.
+    """
+    successors: List[List[int]] = [[] for _ in range(node_count)]
+    in_degree = [0] * node_count
+    for before, after in edges:
+        successors[before].append(after)
+        in_degree[after] += 1
+
+    ready = deque(node for node in range(node_count) if in_degree[node] == 0)
+    order: List[int] = []
+    while ready:
+        node = ready.popleft()
+        order.append(node)
+        for successor in successors[node]:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                ready.append(successor)
+
+    if len(order) < node_count:
+        raise DependencyCycle([node for node in range(node_count) if in_degree[node] > 0])
+    return order
+
+
+class DependencyGraph:
+    """
+    In-memory index of the deployments waiting for their dependencies: Kahn's algorithm, run incrementally.
+
+    Each blocked deployment keeps the set of dependencies that have not completed yet (its in-degree), and each
+    of those dependencies the blocked deployments waiting on it. Completing a deployment only visits its direct
+    successors and returns those left with no dependency, so advancing a pipeline costs O(out-degree) per
+    completion instead of re-sorting the whole graph.
+
+    The graph mirrors the unsatisfied rows of DeploymentDependency for pending deployments. The scheduler
+    updates it after committing, while still holding the locks of the clusters involved.
+    """
+
+    def __init__(self):
+        # Blocked deployment ID -> IDs of the dependencies it still waits for
+        self._waiting_on: Dict[int, Set[int]] = {}
+        # Dependency ID -> IDs of the blocked deployments waiting for it
+        self._successors: Dict[int, Set[int]] = {}
+        # Blocked deployment ID -> its cluster ID
+        self._clusters: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, deployment_id: int) -> bool:
+        return deployment_id in self._waiting_on
+
+    def __len__(self) -> int:
+        return len(self._waiting_on)
+
+    def hydrate(self, db: Session):
+        """
+        Load the pending deployments that still wait for some of their dependencies with a single query.
+        """
+        edges = db.execute(
+            select(DeploymentDependency.deployment_id, DeploymentDependency.depends_on_id, DeploymentModel.cluster_id)
+            .join(DeploymentModel, DeploymentModel.id == DeploymentDependency.deployment_id)
+            .where(DeploymentDependency.satisfied.is_(False), DeploymentModel.status == DeploymentStatus.PENDING)
+        ).all()
+        with self._lock:
+            self._waiting_on.clear()
+            self._successors.clear()
+            self._clusters.clear()
+            for deployment_id, depends_on_id, cluster_id in edges:
+                self._add(deployment_id, cluster_id, [depends_on_id])
+
+    def block(self, deployment_id: int, cluster_id: int, dependencies: Iterable[int]):
+        """
+        Record that a pending deployment waits for the given dependencies to complete.
+        """
+        with self._lock:
+            self._add(deployment_id, cluster_id, dependencies)
+
+    def completed(self, deployment_id: int) -> List[int]:
+        """
+        Record that a deployment completed. Returns the deployments that no longer wait for anything.
+        """
+        ready: List[int] = []
+        with self._lock:
+            for successor_id in self._successors.pop(deployment_id, ()):
+                waiting_on = self._waiting_on[successor_id]
+                waiting_on.discard(deployment_id)
+                if not waiting_on:
+                    del self._waiting_on[successor_id]
+                    del self._clusters[successor_id]
+                    ready.append(successor_id)
+        ready.sort()
+        return ready
+
+    def discard(self, deployment_id: int):
+        """
+        Forget a blocked deployment, e.g. because it was cancelled.
+        """
+        with self._lock:
+            for depends_on_id in self._waiting_on.pop(deployment_id, ()):
+                successors = self._successors[depends_on_id]
+                successors.discard(deployment_id)
+                if not successors:
+                    del self._successors[depends_on_id]
+            self._clusters.pop(deployment_id, None)
+
+    def successor_clusters(self, deployment_id: int) -> Set[int]:
+        """
+        Clusters of the blocked deployments waiting for the given deployment.
+        """
+        with self._lock:
+            return {self._clusters[successor_id] for successor_id in self._successors.get(deployment_id, ())}
+
+    def _add(self, deployment_id: int, cluster_id: int, dependencies: Iterable[int]):
+        for depends_on_id in dependencies:
+            self._waiting_on.setdefault(deployment_id, set()).add(depends_on_id)
+            self._successors.setdefault(depends_on_id, set()).add(deployment_id)
+            self._clusters[deployment_id] = cluster_id
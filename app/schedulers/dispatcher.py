@@ -0,0 +1,305 @@
+"""
+Background dispatch of scheduling work, off the request path.
+
+With a `DispatchingScheduler`, submitting a deployment only inserts it as pending and commits it, and a status
+change only releases the deployment's resources; the request then queues a lightweight event on the cluster
+and returns. A dispatcher task per cluster consumes its events in order: it admits submitted deployments
+(start, preempt or queue) and drains the cluster queue after releases, under the same per-cluster locks as
+requests. Requests thus no longer wait for preemption searches or long queue drains, at the cost of
+returning submitted deployments as pending.
+
+Events are queued by a `DispatchBackend`: in the process's memory by default, or in Redis, where they are
+durable once Redis acknowledged them and survive restarts. Either way, what an event stands for is already
+committed when it is queued, so the work of events lost in a crash is found again in the database at startup
+(see `DispatchingScheduler.recover`).
+"""
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, List, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import metrics
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.scheduler_interface import Scheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+logger = logging.getLogger(__name__)
+
+# Kinds of dispatch events
+ADMIT = "admit"
+DRAIN = "drain"
+
+# Pops the oldest event of a cluster, and unregisters the cluster in the same step if it has none: with a
+# separate SREM, an event pushed in between would be left in a list no longer registered
+_REDIS_POP = """
+local event = redis.call('LPOP', KEYS[1])
+if not event then
+    redis.call('SREM', KEYS[2], ARGV[1])
+end
+return event
+"""
+
+
+@dataclass(frozen=True)
+class DispatchEvent:
+    """
+    Work left to the dispatcher of a cluster: admitting a submitted deployment, or draining the cluster queue.
+    """
+    kind: str
+    deployment_id: Optional[int] = None
+
+    def encode(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def decode(cls, data) -> "DispatchEvent":
+        return cls(**json.loads(data))
+
+
+class DispatchBackend(ABC):
+    """
+    FIFO queues of encoded dispatch events, one per cluster.
+    """
+
+    @abstractmethod
+    async def push(self, cluster_id: int, event: str):
+        pass
+
+    @abstractmethod
+    async def pop(self, cluster_id: int) -> Optional[str]:
+        """
+        Remove and return the oldest event of the cluster, or None if its queue is empty.
+        """
+        pass
+
+    @abstractmethod
+    async def clusters(self) -> List[int]:
+        """
+        Clusters that may have queued events, e.g. left over by a previous run.
+        """
+        pass
+
+    async def close(self):
+        pass
+
+
+class InMemoryDispatchBackend(DispatchBackend):
+    """
+    Queues in the memory of the process. Events still queued when it stops are lost.
+    """
+
+    def __init__(self):
+        self.queues: Dict[int, Deque[str]] = defaultdict(deque)
+
+    async def push(self, cluster_id: int, event: str):
+        self.queues[cluster_id].append(event)
+
+    async def pop(self, cluster_id: int) -> Optional[str]:
+        queue = self.queues.get(cluster_id)
+        if not queue:
+            self.queues.pop(cluster_id, None)
+            return None
+        return queue.popleft()
+
+    async def clusters(self) -> List[int]:
+        return sorted(cluster_id for cluster_id, queue in self.queues.items() if queue)
+
+
+class RedisDispatchBackend(DispatchBackend):
+    """
+    One Redis list per cluster, and a set of the clusters that may have queued events. An event is as durable
+    as Redis' persistence settings make it once the push returns, and survives restarts of the API. With
+    several workers sharing Redis, any of them may consume the events of a cluster; this only makes sense with
+    a distributed lock backend, like any multi-worker deployment.
+    """
+
+    def __init__(self, client, prefix: str = "dispatch"):
+        self.client = client
+        self.prefix = prefix
+        self.clusters_key = f"{prefix}:clusters"
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "dispatch") -> "RedisDispatchBackend":
+        # Imported here: redis is only required when this backend is configured
+        from redis import asyncio as aioredis
+        return cls(aioredis.from_url(url, decode_responses=True), prefix)
+
+    def _key(self, cluster_id: int) -> str:
+        return f"{self.prefix}:cluster:{cluster_id}"
+
+    async def push(self, cluster_id: int, event: str):
+        # Registered first, so a listed cluster is never missing from the set
+        await self.client.sadd(self.clusters_key, cluster_id)
+        await self.client.rpush(self._key(cluster_id), event)
+
+    async def pop(self, cluster_id: int) -> Optional[str]:
+        return await self.client.eval(_REDIS_POP, 2, self._key(cluster_id), self.clusters_key, cluster_id)
+
+    async def clusters(self) -> List[int]:
+        return sorted(int(cluster_id) for cluster_id in await self.client.smembers(self.clusters_key))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_dispatch_backend(name: str, redis_url: str) -> DispatchBackend:
+    """
+    Create the dispatch backend with the given name, "memory" or "redis".
+    """
+    if name == "memory":
+        return InMemoryDispatchBackend()
+    if name == "redis":
+        return RedisDispatchBackend.from_url(redis_url)
+    raise ValueError(f"Unknown dispatch backend '{name}', expected one of ['memory', 'redis']")
+
+
+class DispatchingScheduler(AsyncScheduler):
+    """
+    AsyncScheduler that leaves the decisions on single deployments to per-cluster dispatcher tasks.
+
+    `schedule` and `schedule_in_organization` submit the deployment and queue its admission; the deployment
+    is returned as pending. `update_deployment_status` applies the transition and releases resources in the
+    request, but defers the queue drains it triggers. Batches are still decided in the request, in one pass
+    per cluster.
+
+    A cluster's dispatcher task is started by the first event queued for it and stops once its queue is
+    empty, so idle clusters cost nothing. A cluster has at most one drain event queued at a time: the drains
+    requested until its pass starts are served by it.
+    """
+
+    def __init__(self, scheduler: Scheduler, backend: DispatchBackend,
+                 session_factory: "async_sessionmaker[AsyncSession]", drain_debounce: float = 0.0):
+        super().__init__(scheduler, drain_debounce)
+        self.backend = backend
+        self.session_factory = session_factory
+        self.dispatchers: Dict[int, asyncio.Task] = {}
+        # Clusters with a drain event queued whose pass has not started yet
+        self._queued_drains: Set[int] = set()
+        # Clusters whose dispatcher was told about new events since it last looked at its queue
+        self._woken: Set[int] = set()
+
+    async def schedule(self, db: AsyncSession, cluster: Cluster, deployment_in: DeploymentCreate,
+                       user_id: Optional[int] = None) -> DeploymentModel:
+        deployment = await db.run_sync(self.scheduler.submit, cluster, deployment_in, user_id=user_id)
+        await self.dispatch(cluster.id, DispatchEvent(ADMIT, deployment.id))
+        return deployment
+
+    async def schedule_in_organization(self, db: AsyncSession, organization_id: int,
+                                       deployment_in: DeploymentCreate,
+                                       user_id: Optional[int] = None) -> Optional[DeploymentModel]:
+        # The choice is a hint either way; the dispatcher queues the deployment if the cluster filled up since
+        cluster_id, _ = await db.run_sync(self.scheduler.choose_cluster, organization_id, deployment_in)
+        if cluster_id is None:
+            return None
+        return await self.schedule(db, await db.get(Cluster, cluster_id), deployment_in, user_id=user_id)
+
+    async def update_deployment_status(self, db: AsyncSession, deployment: DeploymentModel,
+                                       status_update: DeploymentStatusUpdate) -> DeploymentModel:
+        drains: Set[int] = set()
+        deployment = await self._update_deployment_status(db, deployment, status_update, drains)
+        for cluster_id in sorted(drains):
+            await self.request_drain(cluster_id)
+        return deployment
+
+    async def request_drain(self, cluster_id: int):
+        """
+        Queue a drain of the cluster queue, unless one is queued already and has not started yet.
+        """
+        if cluster_id in self._queued_drains:
+            metrics.QUEUE_DRAINS_COALESCED.inc()
+            return
+        self._queued_drains.add(cluster_id)
+        await self.dispatch(cluster_id, DispatchEvent(DRAIN))
+
+    def _defers_drains(self, cluster_id: int) -> bool:
+        return True
+
+    def _drain_started(self, cluster_id: int):
+        super()._drain_started(cluster_id)
+        self._queued_drains.discard(cluster_id)
+
+    async def dispatch(self, cluster_id: int, event: DispatchEvent):
+        """
+        Queue an event on a cluster and make sure its dispatcher is running.
+        """
+        await self.backend.push(cluster_id, event.encode())
+        self._wake(cluster_id)
+
+    def _wake(self, cluster_id: int):
+        if cluster_id in self.dispatchers:
+            self._woken.add(cluster_id)
+        else:
+            self.dispatchers[cluster_id] = asyncio.create_task(self._run_dispatcher(cluster_id))
+
+    async def _run_dispatcher(self, cluster_id: int):
+        try:
+            while True:
+                self._woken.discard(cluster_id)
+                data = await self.backend.pop(cluster_id)
+                if data is None:
+                    # An event queued while the queue was read wakes the dispatcher up, so it looks again
+                    if cluster_id in self._woken:
+                        continue
+                    return
+                try:
+                    await self._handle(cluster_id, DispatchEvent.decode(data))
+                except Exception:
+                    # What the event stood for is committed, so `recover` finds it again at the next startup
+                    logger.exception("Dispatching %s on cluster %s failed", data, cluster_id)
+        except Exception:
+            logger.exception("Dispatcher of cluster %s stopped", cluster_id)
+        finally:
+            del self.dispatchers[cluster_id]
+
+    async def _handle(self, cluster_id: int, event: DispatchEvent):
+        async with self.session_factory() as db:
+            if event.kind == ADMIT:
+                await self.admit(db, event.deployment_id)
+            elif event.kind == DRAIN:
+                try:
+                    await self.drain_cluster_queue(db, cluster_id)
+                except BaseException:
+                    # Failed before its pass started, possibly: let the next request queue another drain
+                    self._queued_drains.discard(cluster_id)
+                    raise
+            else:
+                logger.error("Ignoring unknown dispatch event %s", event)
+
+    async def recover(self):
+        """
+        Resume the work left over by a previous run, once the scheduler is hydrated: the events still queued
+        in the backend, the admission of submitted deployments whose event was lost, and the drain of every
+        queue that has deployments waiting, in case a deferred drain was lost.
+        """
+        for cluster_id in await self.backend.clusters():
+            self._wake(cluster_id)
+        async with self.session_factory() as db:
+            unadmitted = await db.run_sync(self.scheduler.unadmitted_deployments)
+        for cluster_id, deployment_ids in unadmitted.items():
+            for deployment_id in deployment_ids:
+                await self.dispatch(cluster_id, DispatchEvent(ADMIT, deployment_id))
+        for cluster_id in self.scheduler.queued_clusters():
+            await self.request_drain(cluster_id)
+
+    async def join(self):
+        """
+        Wait until every queued event has been dispatched.
+        """
+        while self.dispatchers:
+            await asyncio.gather(*self.dispatchers.values())
+
+    async def close(self):
+        """
+        Stop the dispatchers. Events they were handling are found again by `recover` at the next startup.
+        """
+        for task in self.dispatchers.values():
+            task.cancel()
+        await asyncio.gather(*self.dispatchers.values(), return_exceptions=True)
+        await self.backend.close()
@@ -0,0 +1,29 @@
+from typing import Dict, Type
+
+from app.schedulers.backfill_scheduler import BackfillScheduler
+from app.schedulers.fair_share_scheduler import FairShareScheduler
+from app.schedulers.locking import create_lock_backend
+from app.schedulers.priority_preemption_scheduler import DEFAULT_SNAPSHOT_INTERVAL, AdvancedScheduler
+from app.schedulers.scheduler_interface import Scheduler
+
+# Scheduling policies selectable through the SCHEDULER_POLICY setting
+SCHEDULER_POLICIES: Dict[str, Type[Scheduler]] = {
+    "priority": AdvancedScheduler,
+    "backfill": BackfillScheduler,
+    "fair_share": FairShareScheduler,
+}
+
+
+def create_scheduler(policy: str, lock_backend: str = "local", placement_strategy: str = "best_fit",
+                     snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL) -> Scheduler:
+    """
+    Create the scheduler implementing the given policy, serializing decisions with the given lock backend,
+    placing deployments without a cluster with the given placement strategy and snapshotting each cluster
+    every `snapshot_interval` logged events.
+    """
+    try:
+        scheduler_class = SCHEDULER_POLICIES[policy]
+    except KeyError:
+        raise ValueError(f"Unknown scheduler policy '{policy}', expected one of {sorted(SCHEDULER_POLICIES)}")
+    return scheduler_class(lock_backend=create_lock_backend(lock_backend), placement_strategy=placement_strategy,
+                           snapshot_interval=snapshot_interval)
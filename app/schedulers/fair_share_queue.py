@@ -0,0 +1,174 @@
+import heapq
+import itertools
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from app.schedulers.pending_queue import PendingQueue
+
+if TYPE_CHECKING:
+    from app.schedulers.cluster_state import DeploymentEntry
+
+
+class FairShareQueue:
+    """
+    Pending queue of a cluster shared with Dominant Resource Fairness (DRF) between the users submitting to it.
+
+    A user's dominant share is the largest fraction of the cluster's CPU, RAM or GPU held by their running
+    deployments. The queue dispatches from the user with the lowest dominant share, and within a user by
+    priority and then submission order, so a user with many (or many high priority) deployments cannot keep
+    the others from getting their share.
+
+    Shares are updated incrementally as deployments start and stop (see `started` and `stopped`), and users
+    are kept in a heap keyed by share whose outdated items are skipped lazily, like the removals of
+    PendingQueue. Every operation is O(log n). It implements the PendingQueue interface, so the scheduling
+    policies use it unchanged.
+    """
+
+    def __init__(self, cpu_limit: int, ram_limit: int, gpu_limit: int):
+        self._inverse_limits = tuple(1 / limit if limit else 0.0 for limit in (cpu_limit, ram_limit, gpu_limit))
+        # User ID (None for anonymous deployments) -> their pending deployments
+        self._queues: Dict[Optional[int], PendingQueue] = {}
+        # User ID -> CPU, RAM and GPU held by their running deployments on the cluster
+        self._usage: Dict[Optional[int], List[int]] = {}
+        # Heap of (dominant share, sequence, user ID); only the item matching `_keys` is live for a user
+        self._heap: List[Tuple[float, int, Optional[int]]] = []
+        self._keys: Dict[Optional[int], Tuple[float, int]] = {}
+        # Pending deployment ID -> its user ID
+        self._owners: Dict[int, Optional[int]] = {}
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def __bool__(self) -> bool:
+        return bool(self._owners)
+
+    def __contains__(self, deployment_id: int) -> bool:
+        return deployment_id in self._owners
+
+    def ids(self) -> Iterator[int]:
+        return iter(self._owners)
+
+    def dominant_share(self, owner_id: Optional[int], adding: Optional["DeploymentEntry"] = None) -> float:
+        """
+        Largest fraction of any resource of the cluster held by the user's running deployments, counting
+        `adding` as running too if given.
+        """
+        usage = self._usage.get(owner_id)
+        if adding is None:
+            return self._share(usage)
+        usage = usage or (0.0, 0.0, 0.0)
+        return self._share([usage[0] + adding.cpu_required, usage[1] + adding.ram_required,
+                            usage[2] + adding.gpu_required])
+
+    def push(self, entry: "DeploymentEntry"):
+        """
+        Add a deployment to its user's queue, replacing any previous item for the same deployment.
+        """
+        self.remove(entry.id)
+        queue = self._queues.get(entry.owner_id)
+        if queue is None:
+            queue = self._queues[entry.owner_id] = PendingQueue()
+        queue.push(entry)
+        self._owners[entry.id] = entry.owner_id
+        if entry.owner_id not in self._keys:
+            self._rekey(entry.owner_id)
+
+    def remove(self, deployment_id: int) -> Optional["DeploymentEntry"]:
+        """
+        Remove a deployment from the queue if present.
+        """
+        if deployment_id not in self._owners:
+            return None
+        owner_id = self._owners.pop(deployment_id)
+        queue = self._queues[owner_id]
+        entry = queue.remove(deployment_id)
+        if not queue:
+            del self._queues[owner_id]
+            self._keys.pop(owner_id, None)
+        return entry
+
+    def peek(self) -> Optional["DeploymentEntry"]:
+        """
+        Return the next deployment of the user with the lowest dominant share, without removing it.
+        """
+        item = self._lowest_share_item()
+        if item is None:
+            return None
+        return self._queues[item[2]].peek()
+
+    def pop(self) -> Optional["DeploymentEntry"]:
+        entry = self.peek()
+        if entry is not None:
+            self.remove(entry.id)
+        return entry
+
+    def in_order(self, limit: Optional[int] = None) -> List["DeploymentEntry"]:
+        """
+        Return pending deployments in the order they would be dispatched if each of them started in turn,
+        optionally only the first `limit` of them. This replays DRF on a copy of the shares.
+        """
+        usage = {owner_id: list(used) for owner_id, used in self._usage.items()}
+        cursors = {owner_id: iter(queue.in_order(limit)) for owner_id, queue in self._queues.items()}
+        heads = {owner_id: next(cursor) for owner_id, cursor in cursors.items()}
+        heap = [(self._share(usage.get(owner_id)), index, owner_id) for index, owner_id in enumerate(heads)]
+        heapq.heapify(heap)
+        sequence = itertools.count(len(heap))
+
+        ordered: List["DeploymentEntry"] = []
+        while heap and (limit is None or len(ordered) < limit):
+            _, _, owner_id = heapq.heappop(heap)
+            entry = heads.pop(owner_id)
+            ordered.append(entry)
+            used = usage.setdefault(owner_id, [0.0, 0.0, 0.0])
+            used[0] += entry.cpu_required
+            used[1] += entry.ram_required
+            used[2] += entry.gpu_required
+            following = next(cursors[owner_id], None)
+            if following is not None:
+                heads[owner_id] = following
+                heapq.heappush(heap, (self._share(used), next(sequence), owner_id))
+        return ordered
+
+    def started(self, entry: "DeploymentEntry"):
+        """
+        Account for a deployment of the cluster that started running.
+        """
+        self._account(entry, 1)
+
+    def stopped(self, entry: "DeploymentEntry"):
+        """
+        Account for a deployment of the cluster that stopped running.
+        """
+        self._account(entry, -1)
+
+    def _account(self, entry: "DeploymentEntry", sign: int):
+        usage = self._usage.get(entry.owner_id)
+        if usage is None:
+            usage = self._usage[entry.owner_id] = [0.0, 0.0, 0.0]
+        usage[0] += sign * entry.cpu_required
+        usage[1] += sign * entry.ram_required
+        usage[2] += sign * entry.gpu_required
+        if entry.owner_id in self._keys:
+            self._rekey(entry.owner_id)
+
+    def _share(self, usage: Optional[List[int]]) -> float:
+        if usage is None:
+            return 0.0
+        return max(used * inverse for used, inverse in zip(usage, self._inverse_limits))
+
+    def _rekey(self, owner_id: Optional[int]):
+        key = (self._share(self._usage.get(owner_id)), next(self._sequence))
+        self._keys[owner_id] = key
+        heapq.heappush(self._heap, (*key, owner_id))
+        if len(self._heap) > 2 * len(self._keys) + 16:
+            self._heap = [(*key, owner_id) for owner_id, key in self._keys.items()]
+            heapq.heapify(self._heap)
+
+    def _lowest_share_item(self) -> Optional[Tuple[float, int, Optional[int]]]:
+        heap = self._heap
+        while heap:
+            share, sequence, owner_id = heap[0]
+            if self._keys.get(owner_id) == (share, sequence):
+                return heap[0]
+            heapq.heappop(heap)
+        return None
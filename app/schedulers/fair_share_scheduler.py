@@ -0,0 +1,54 @@
+from typing import Dict, List, Optional
+
+from app.models.cluster import Cluster
+from app.schedulers.cluster_state import ClusterState, ClusterStateStore, DeploymentEntry
+from app.schedulers.fair_share_queue import FairShareQueue
+from app.schedulers.locking import ClusterLockBackend
+from app.schedulers.pending_queue import PendingQueue
+from app.schedulers.priority_preemption_scheduler import DEFAULT_SNAPSHOT_INTERVAL, AdvancedScheduler
+
+
+def _new_queue(cluster: Cluster) -> PendingQueue:
+    if cluster.fair_share:
+        return FairShareQueue(cluster.cpu_limit, cluster.ram_limit, cluster.gpu_limit)
+    return PendingQueue()
+
+
+class FairShareScheduler(AdvancedScheduler):
+    """
+    Priority scheduler that shares the clusters flagged with `fair_share` between the users submitting to
+    them, with Dominant Resource Fairness (DRF).
+
+    The queues of those clusters dispatch from the user holding the smallest dominant share (see
+    `FairShareQueue`), so one user flooding a cluster with deployments, even high priority ones, only
+    delays their own. Preemption still respects priority: a new deployment may evict the lower priority
+    deployments of its own user, and the deployments of no higher priority of users whose dominant share stays
+    above the submitter's once it runs. Other clusters keep the strict priority policy.
+    """
+
+    def __init__(self, lock_backend: Optional[ClusterLockBackend] = None, placement_strategy: str = "best_fit",
+                 snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+        super().__init__(lock_backend, placement_strategy, snapshot_interval)
+        self.cluster_states = ClusterStateStore(new_queue=_new_queue)
+
+    @staticmethod
+    def _preemption_candidates(state: ClusterState, entry: DeploymentEntry) -> List[DeploymentEntry]:
+        queue = state.pending
+        if not isinstance(queue, FairShareQueue):
+            return AdvancedScheduler._preemption_candidates(state, entry)
+        share = queue.dominant_share(entry.owner_id, adding=entry)
+        # Shares only change when deployments start or stop, so compute each user's once
+        above: Dict[Optional[int], bool] = {}
+        candidates: List[DeploymentEntry] = []
+        for running in state.running.values():
+            if running.owner_id == entry.owner_id:
+                if running.priority < entry.priority:
+                    candidates.append(running)
+                continue
+            if running.priority > entry.priority:
+                continue
+            if running.owner_id not in above:
+                above[running.owner_id] = queue.dominant_share(running.owner_id) > share
+            if above[running.owner_id]:
+                candidates.append(running)
+        return candidates
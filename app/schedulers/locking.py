@@ -0,0 +1,139 @@
+import random
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.models.cluster import Cluster
+
+
+class ClusterVersionConflict(Exception):
+    """
+    Raised when a cluster changed since its state was loaded, so a decision made on it must be retried.
+    """
+
+    def __init__(self, cluster_id: int):
+        super().__init__(f"Cluster {cluster_id} was modified concurrently")
+        self.cluster_id = cluster_id
+
+
+class ClusterLockBackend(ABC):
+    """
+    Strategy used by the scheduler to serialize decisions on the same cluster.
+    """
+
+    # Whether the lock is shared with other processes. If so, other workers may have changed the cluster
+    # since the in-memory state was loaded, and the scheduler reloads it once the lock is acquired.
+    distributed: bool = False
+    # Whether decisions run without a lock and are validated at commit time by a compare-and-swap on the
+    # cluster version. Conflicting decisions raise ClusterVersionConflict and are retried by the scheduler.
+    optimistic: bool = False
+
+    @abstractmethod
+    def lock(self, db: Session, cluster_id: int):
+        """
+        Return a context manager holding the lock of the cluster. Locks must be re-entrant.
+        """
+        pass
+
+
+class InProcessLockBackend(ClusterLockBackend):
+    """
+    Single-node backend: one re-entrant thread lock per cluster.
+    """
+
+    def __init__(self):
+        # This dictionary will map cluster IDs to locks for thread safety.
+        self.cluster_locks: Dict[int, threading.RLock] = {}
+
+    def _get_cluster_lock(self, cluster_id: int) -> threading.RLock:
+        """
+        Get or create a lock for the given cluster ID to ensure thread safety for the same cluster.
+        The lock is re-entrant because releasing resources drains the queue while still holding it.
+        """
+        lock = self.cluster_locks.get(cluster_id)
+        if lock is None:
+            # setdefault is atomic, so two threads racing here end up sharing the same lock.
+            lock = self.cluster_locks.setdefault(cluster_id, threading.RLock())
+        return lock
+
+    def lock(self, db: Session, cluster_id: int):
+        return self._get_cluster_lock(cluster_id)
+
+
+class PostgresAdvisoryLockBackend(ClusterLockBackend):
+    """
+    Multi-worker backend based on `pg_advisory_xact_lock(cluster_id)`.
+
+    The lock belongs to the current database transaction and is released by the commit (or rollback)
+    that ends the scheduling decision, so it protects the cluster across processes and pods.
+    """
+    distributed = True
+
+    @contextmanager
+    def lock(self, db: Session, cluster_id: int) -> Iterator[None]:
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": cluster_id})
+        yield
+
+
+class PostgresRowLockBackend(ClusterLockBackend):
+    """
+    Multi-worker backend locking the cluster row with `SELECT ... FOR UPDATE`.
+
+    Like the advisory lock it is released at the end of the transaction, but it also blocks concurrent
+    writers of the row that do not go through the scheduler.
+    """
+    distributed = True
+
+    @contextmanager
+    def lock(self, db: Session, cluster_id: int) -> Iterator[None]:
+        db.execute(select(Cluster.id).where(Cluster.id == cluster_id).with_for_update())
+        yield
+
+
+class OptimisticLockBackend(ClusterLockBackend):
+    """
+    Multi-worker backend without locks: the scheduler bumps the cluster version with
+    `UPDATE cluster SET version = version + 1 WHERE id = ? AND version = ?` before committing and
+    retries the whole decision if another worker got there first. Decisions on different clusters
+    never wait for each other, and decisions on the same cluster only pay for actual conflicts.
+    """
+    distributed = True
+    optimistic = True
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 0.005, max_delay: float = 0.2):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def lock(self, db: Session, cluster_id: int):
+        return nullcontext()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter, so workers that conflicted do not retry in lockstep.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+# Lock backends selectable through the SCHEDULER_LOCK_BACKEND setting
+LOCK_BACKENDS = {
+    "local": InProcessLockBackend,
+    "postgres_advisory": PostgresAdvisoryLockBackend,
+    "postgres_row": PostgresRowLockBackend,
+    "optimistic": OptimisticLockBackend,
+}
+
+
+def create_lock_backend(name: str) -> ClusterLockBackend:
+    """
+    Create the lock backend with the given name.
+    """
+    try:
+        backend_class = LOCK_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown scheduler lock backend '{name}', expected one of {sorted(LOCK_BACKENDS)}")
+    return backend_class()
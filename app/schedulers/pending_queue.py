@@ -0,0 +1,117 @@
+import heapq
+import itertools
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from app.schedulers.cluster_state import DeploymentEntry
+
+
+class PendingQueue:
+    """
+    Priority queue of pending deployments for a single cluster.
+
+    Deployments are ordered by priority (highest first) and then by a FIFO sequence number, so
+    deployments with the same priority start in submission order. Removals (cancellation, dispatch
+    of a deployment that is not at the head) are lazy: the heap item is left in place and skipped
+    when it reaches the top, which keeps every operation at O(log n).
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int, int]] = []
+        # Maps deployment ID to its (sequence, entry) for the live items of the heap
+        self._entries: Dict[int, Tuple[int, "DeploymentEntry"]] = {}
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def __contains__(self, deployment_id: int) -> bool:
+        return deployment_id in self._entries
+
+    def ids(self) -> Iterator[int]:
+        return iter(self._entries)
+
+    def push(self, entry: "DeploymentEntry"):
+        """
+        Add a deployment to the queue, replacing any previous item for the same deployment.
+        """
+        sequence = next(self._sequence)
+        self._entries[entry.id] = (sequence, entry)
+        heapq.heappush(self._heap, (-entry.priority, sequence, entry.id))
+
+    def remove(self, deployment_id: int) -> Optional["DeploymentEntry"]:
+        """
+        Remove a deployment from the queue if present. The heap item is discarded lazily.
+        """
+        item = self._entries.pop(deployment_id, None)
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._compact()
+        return item[1] if item else None
+
+    def peek(self) -> Optional["DeploymentEntry"]:
+        """
+        Return the highest priority deployment without removing it.
+        """
+        self._drop_stale_head()
+        if not self._heap:
+            return None
+        return self._entries[self._heap[0][2]][1]
+
+    def pop(self) -> Optional["DeploymentEntry"]:
+        """
+        Remove and return the highest priority deployment.
+        """
+        self._drop_stale_head()
+        if not self._heap:
+            return None
+        _, _, deployment_id = heapq.heappop(self._heap)
+        return self._entries.pop(deployment_id)[1]
+
+    def dispatch_key(self, entry: "DeploymentEntry") -> Tuple[int, int]:
+        """
+        Position of a deployment in dispatch order, smallest first: its own while it is queued, otherwise the
+        one it would take if it were pushed now.
+        """
+        item = self._entries.get(entry.id)
+        return -entry.priority, item[0] if item is not None else next(self._sequence)
+
+    def in_order(self, limit: Optional[int] = None) -> List["DeploymentEntry"]:
+        """
+        Return pending deployments in dispatch order, optionally only the first `limit` of them.
+        This is O(n log limit) and meant for policies that need to look past the head of the queue.
+        """
+        def dispatch_order(item):
+            return -item[1].priority, item[0]
+
+        if limit is None:
+            items = sorted(self._entries.values(), key=dispatch_order)
+        else:
+            items = heapq.nsmallest(limit, self._entries.values(), key=dispatch_order)
+        return [entry for _, entry in items]
+
+    def started(self, entry: "DeploymentEntry"):
+        """
+        Called when a deployment of the cluster starts running. Queues that order by usage override this.
+        """
+        pass
+
+    def stopped(self, entry: "DeploymentEntry"):
+        """
+        Called when a deployment of the cluster stops running.
+        """
+        pass
+
+    def _is_live(self, item: Tuple[int, int, int]) -> bool:
+        live = self._entries.get(item[2])
+        return live is not None and live[0] == item[1]
+
+    def _drop_stale_head(self):
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        self._heap = [item for item in self._heap if self._is_live(item)]
+        heapq.heapify(self._heap)
@@ -0,0 +1,136 @@
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.schedulers.capacity_matrix import CapacityMatrix
+from app.schedulers.cluster_state import ClusterState
+
+# Times a placement is attempted when the chosen cluster fills up before its lock is acquired
+PLACEMENT_ATTEMPTS = 3
+# Below this many candidate clusters, the scalar pass beats the fixed cost of the NumPy calls
+VECTORIZED_PLACEMENT_MIN_CLUSTERS = 64
+
+
+def best_fit_score(state: ClusterState, entry) -> float:
+    """
+    Prefer the cluster left with the least free capacity, which keeps large holes for large deployments.
+    """
+    score = 0.0
+    if state.cpu_limit:
+        score -= (state.cpu_available - entry.cpu_required) / state.cpu_limit
+    if state.ram_limit:
+        score -= (state.ram_available - entry.ram_required) / state.ram_limit
+    if state.gpu_limit:
+        score -= (state.gpu_available - entry.gpu_required) / state.gpu_limit
+    return score
+
+
+def worst_fit_score(state: ClusterState, entry) -> float:
+    """
+    Prefer the cluster left with the most free capacity, which spreads the load over the clusters.
+    """
+    return -best_fit_score(state, entry)
+
+
+def dominant_resource_score(state: ClusterState, entry) -> float:
+    """
+    Prefer the cluster whose most used resource would be the least used after placement, so that each
+    cluster's bottleneck resource (e.g. GPU for GPU-heavy deployments) is balanced across clusters.
+    """
+    cpu_share = 1 - (state.cpu_available - entry.cpu_required) / state.cpu_limit if state.cpu_limit else 0.0
+    ram_share = 1 - (state.ram_available - entry.ram_required) / state.ram_limit if state.ram_limit else 0.0
+    gpu_share = 1 - (state.gpu_available - entry.gpu_required) / state.gpu_limit if state.gpu_limit else 0.0
+    return -max(cpu_share, ram_share, gpu_share)
+
+
+def best_fit_scores(limits: np.ndarray, available: np.ndarray, inverse_limits: np.ndarray,
+                    demand: np.ndarray) -> np.ndarray:
+    return -((available - demand) * inverse_limits).sum(axis=0)
+
+
+def worst_fit_scores(limits: np.ndarray, available: np.ndarray, inverse_limits: np.ndarray,
+                     demand: np.ndarray) -> np.ndarray:
+    return ((available - demand) * inverse_limits).sum(axis=0)
+
+
+def dominant_resource_scores(limits: np.ndarray, available: np.ndarray, inverse_limits: np.ndarray,
+                             demand: np.ndarray) -> np.ndarray:
+    return -((limits - available + demand) * inverse_limits).max(axis=0)
+
+
+class PlacementStrategy(NamedTuple):
+    # Score of a single cluster, higher is better
+    score: Callable[[ClusterState, object], float]
+    # Scores of many clusters at once, from their columns of the capacity matrix (limits, available capacity
+    # and inverse limits) and the deployment's demand
+    scores: Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+
+
+# Placement strategies selectable through the PLACEMENT_STRATEGY setting
+PLACEMENT_STRATEGIES: Dict[str, PlacementStrategy] = {
+    "best_fit": PlacementStrategy(best_fit_score, best_fit_scores),
+    "worst_fit": PlacementStrategy(worst_fit_score, worst_fit_scores),
+    "drf": PlacementStrategy(dominant_resource_score, dominant_resource_scores),
+}
+
+
+def get_placement_strategy(name: str) -> PlacementStrategy:
+    """
+    Return the placement strategy with the given name.
+    """
+    try:
+        return PLACEMENT_STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown placement strategy '{name}', expected one of {sorted(PLACEMENT_STRATEGIES)}")
+
+
+def choose_cluster(states: Iterable[ClusterState], entry,
+                   strategy: PlacementStrategy) -> Tuple[Optional[ClusterState], bool]:
+    """
+    Pick a cluster for a deployment in a single pass over the candidate clusters.
+
+    Among the clusters with enough free capacity, the best scoring one wins (ties go to the first one).
+    If none has room right now, falls back to the cluster with the fewest pending deployments among those
+    whose limits can hold the deployment at all, where it queues (or preempts) like any other deployment.
+    Returns the chosen cluster, or None if no cluster is large enough, and whether it has room right now.
+    """
+    score = strategy.score
+    cpu, ram, gpu = entry.cpu_required, entry.ram_required, entry.gpu_required
+    best, best_score = None, float("-inf")
+    fallback, fallback_pending = None, None
+    for state in states:
+        if state.cpu_available >= cpu and state.ram_available >= ram and state.gpu_available >= gpu:
+            state_score = score(state, entry)
+            if state_score > best_score:
+                best, best_score = state, state_score
+        elif (best is None and state.cpu_limit >= cpu and state.ram_limit >= ram and state.gpu_limit >= gpu
+              and (fallback is None or len(state.pending) < fallback_pending)):
+            fallback, fallback_pending = state, len(state.pending)
+    if best is not None:
+        return best, True
+    return fallback, False
+
+
+def choose_cluster_vectorized(matrix: CapacityMatrix, columns: np.ndarray, entry,
+                              strategy: PlacementStrategy) -> Tuple[Optional[int], bool]:
+    """
+    Same choice as `choose_cluster` over the clusters at the given columns of the capacity matrix, with the
+    fit checks and scores computed in a few vector operations. Returns the position of the chosen cluster in
+    `columns`, or None, and whether it has room right now.
+    """
+    if not len(columns):
+        return None, False
+    demand = np.array((entry.cpu_required, entry.ram_required, entry.gpu_required))
+
+    fits = matrix.fit_mask(columns, demand)
+    if fits.any():
+        scores = strategy.scores(matrix.limits.take(columns, axis=1), matrix.available.take(columns, axis=1),
+                                 matrix.inverse_limits.take(columns, axis=1), demand[:, np.newaxis])
+        # argmax returns the first of equal scores, like the scalar pass
+        return int(np.argmax(np.where(fits, scores, -np.inf))), True
+
+    large_enough = matrix.limit_mask(columns, demand)
+    if not large_enough.any():
+        return None, False
+    pending = np.where(large_enough, matrix.pending.take(columns), np.iinfo(np.int64).max)
+    return int(np.argmin(pending)), False
@@ -0,0 +1,143 @@
+import heapq
+from typing import List, Optional, Sequence, Tuple
+
+from app.schedulers.cluster_state import ClusterState, DeploymentEntry
+
+# Candidates kept for the greedy pass, ranked by how much of the deficit they cover per unit of cost
+GREEDY_POOL_SIZE = 32
+# Candidates considered by the exhaustive search that refines the greedy solution
+EXACT_SEARCH_CANDIDATES = 6
+# Upper bound on the number of nodes visited by the exhaustive search
+EXACT_SEARCH_NODE_BUDGET = 128
+
+Resources = Tuple[int, int, int]
+
+
+def _resources(entry) -> Resources:
+    return entry.cpu_required, entry.ram_required, entry.gpu_required
+
+
+def eviction_cost(entry: DeploymentEntry, state: ClusterState) -> float:
+    """
+    Cost of evicting a running deployment: its priority weighted by the share of the cluster it loses.
+    Every eviction costs at least its priority weight, so fewer evictions are preferred.
+    """
+    limits = (state.cpu_limit, state.ram_limit, state.gpu_limit)
+    share = sum(amount / limit for amount, limit in zip(_resources(entry), limits) if limit)
+    return (entry.priority + 1) * (1.0 + share)
+
+
+def select_victims(required, state: ClusterState,
+                   candidates: Sequence[DeploymentEntry]) -> Optional[List[DeploymentEntry]]:
+    """
+    Pick a minimal-cost set of running deployments whose eviction lets `required` fit on the cluster.
+
+    Candidates are scored once by the share of the deficit (CPU, RAM and GPU) they cover per unit of
+    eviction cost and only the best GREEDY_POOL_SIZE are kept. A greedy pass over that pool picks the
+    most effective candidate until every dimension is covered and drops victims that turned out to be
+    redundant, then a bounded branch and bound over the top candidates tries to find a cheaper set.
+    Returns an empty list if no eviction is needed and None if evicting every candidate is not enough.
+    """
+    deficit = (max(required.cpu_required - state.cpu_available, 0.0),
+               max(required.ram_required - state.ram_available, 0.0),
+               max(required.gpu_required - state.gpu_available, 0.0))
+    if not any(deficit):
+        return []
+
+    # Single pass over the candidates: this runs on every preemption, for hundreds of running deployments
+    cpu_missing, ram_missing, gpu_missing = deficit
+    cpu_weight, ram_weight, gpu_weight = (1.0 / missing if missing > 0 else 0.0 for missing in deficit)
+    scored = []
+    for entry in candidates:
+        cpu, ram, gpu = entry.cpu_required, entry.ram_required, entry.gpu_required
+        coverage = (min(cpu, cpu_missing) * cpu_weight + min(ram, ram_missing) * ram_weight
+                    + min(gpu, gpu_missing) * gpu_weight)
+        # Only deployments holding some of the missing resources can help
+        if coverage > 0:
+            cost = eviction_cost(entry, state)
+            scored.append((coverage / cost, entry.id, (entry, (cpu, ram, gpu), cost)))
+    if not _covers(_total(item[2][1] for item in scored), deficit):
+        return None
+
+    ranked = [item[2] for item in heapq.nlargest(GREEDY_POOL_SIZE, scored)]
+    pool = ranked if _covers(_total(item[1] for item in ranked), deficit) else [item[2] for item in scored]
+
+    greedy = _greedy(deficit, pool)
+    best_cost = sum(item[2] for item in greedy)
+    exact = _branch_and_bound(deficit, ranked[:EXACT_SEARCH_CANDIDATES], best_cost)
+    return [item[0] for item in (exact if exact is not None else greedy)]
+
+
+def _total(resources) -> Resources:
+    cpu = ram = gpu = 0.0
+    for item_cpu, item_ram, item_gpu in resources:
+        cpu += item_cpu
+        ram += item_ram
+        gpu += item_gpu
+    return cpu, ram, gpu
+
+
+def _covers(freed: Resources, deficit: Resources) -> bool:
+    return freed[0] >= deficit[0] and freed[1] >= deficit[1] and freed[2] >= deficit[2]
+
+
+def _coverage(deficit: Resources, resources: Resources) -> float:
+    """
+    Fraction of the remaining deficit a deployment would cover, summed over the deficient dimensions.
+    """
+    coverage = 0.0
+    for amount, missing in zip(resources, deficit):
+        if missing > 0:
+            coverage += min(amount, missing) / missing
+    return coverage
+
+
+def _greedy(deficit: Resources, pool):
+    remaining = deficit
+    chosen = []
+    unused = list(pool)
+    while any(missing > 0 for missing in remaining):
+        best = max(unused, key=lambda item: _coverage(remaining, item[1]) / item[2])
+        unused.remove(best)
+        chosen.append(best)
+        remaining = tuple(missing - amount for missing, amount in zip(remaining, best[1]))
+
+    # Prune victims that are not needed once the others are evicted, most expensive first
+    for item in sorted(chosen, key=lambda item: -item[2]):
+        others = [other for other in chosen if other is not item]
+        if _covers(_total(other[1] for other in others), deficit):
+            chosen = others
+    return chosen
+
+
+def _branch_and_bound(deficit: Resources, candidates, best_cost: float):
+    """
+    Exhaustive include/exclude search bounded by the best known cost and a node budget.
+    Returns a cheaper victim set than `best_cost`, or None if none was found.
+    """
+    best = None
+    budget = EXACT_SEARCH_NODE_BUDGET
+    # Resources still obtainable from candidates at index i and beyond, to prune infeasible branches
+    suffix = [(0.0, 0.0, 0.0)] * (len(candidates) + 1)
+    for index in range(len(candidates) - 1, -1, -1):
+        suffix[index] = tuple(a + b for a, b in zip(suffix[index + 1], candidates[index][1]))
+
+    def search(index: int, remaining: Resources, cost: float, chosen: list):
+        nonlocal best, best_cost, budget
+        if budget <= 0 or cost >= best_cost:
+            return
+        budget -= 1
+        if remaining[0] <= 0 and remaining[1] <= 0 and remaining[2] <= 0:
+            best, best_cost = list(chosen), cost
+            return
+        if index == len(candidates) or not _covers(suffix[index], remaining):
+            return
+        item = candidates[index]
+        chosen.append(item)
+        search(index + 1, tuple(missing - amount for missing, amount in zip(remaining, item[1])),
+               cost + item[2], chosen)
+        chosen.pop()
+        search(index + 1, remaining, cost, chosen)
+
+    search(0, deficit, 0.0, [])
+    return best
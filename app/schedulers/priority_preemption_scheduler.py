@@ -1,172 +1,1033 @@
-import threading
-from typing import Dict
+import functools
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from sqlalchemy import and_, delete, func, insert, select, update
 from sqlalchemy.orm import Session
 
+from app.core import metrics
 from app.models.cluster import Cluster
+from app.models.cluster_snapshot import ClusterSnapshot
 from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.models.deployment_dependency import DeploymentDependency, is_blocked
+from app.models.deployment_event import DeploymentEvent, DeploymentEventKind
+from app.schedulers.cluster_state import ClusterState, ClusterStateStore, DeploymentEntry
+from app.schedulers.dependency_graph import DependencyGraph
+from app.schedulers.locking import ClusterLockBackend, ClusterVersionConflict, InProcessLockBackend
+from app.schedulers.placement import (VECTORIZED_PLACEMENT_MIN_CLUSTERS, choose_cluster, choose_cluster_vectorized,
+                                      get_placement_strategy)
+from app.schedulers.preemption import select_victims
 from app.schedulers.scheduler_interface import Scheduler
 from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
 
+# Keys of Session.info used to track nested scheduler transactions
+_TRANSACTION_DEPTH = "scheduler_transaction_depth"
+_TRANSACTION_CLUSTERS = "scheduler_transaction_clusters"
+_AFTER_COMMIT = "scheduler_after_commit"
+_EVENTS = "scheduler_events"
+_SNAPSHOTS = "scheduler_snapshots"
+# Key of Session.info collecting the clusters whose queue drains were left to the caller
+_DEFERRED_DRAINS = "scheduler_deferred_drains"
+# Keys of Session.info tracking nested operations retried on conflicts, and whether the caller retries them
+_RETRY_DEPTH = "scheduler_retry_depth"
+_RAISE_CONFLICTS = "scheduler_raise_conflicts"
 
-def cluster_has_sufficient_resources(cluster, deployment):
-    return (cluster.cpu_available >= deployment.cpu_required
-            and cluster.ram_available >= deployment.ram_required
-            and cluster.gpu_available >= deployment.gpu_required)
+# Events logged per cluster between two snapshots of its state, which bounds the log replayed at startup
+DEFAULT_SNAPSHOT_INTERVAL = 1000
+
+# Events logged when a status update moves a deployment to the given status
+_STATUS_EVENTS = {
+    DeploymentStatus.PENDING: DeploymentEventKind.REQUEUED,
+    DeploymentStatus.COMPLETED: DeploymentEventKind.COMPLETED,
+    DeploymentStatus.FAILED: DeploymentEventKind.FAILED,
+    DeploymentStatus.CANCELLED: DeploymentEventKind.CANCELLED,
+}
+
+
+def retry_on_conflict(method):
+    """
+    Re-run a scheduler operation from scratch when its commit hit a cluster version conflict.
+
+    Only the outermost operation retries: the conflict is detected when the unit of work commits, after
+    the session was rolled back, so a nested operation cannot be replayed on its own. Retries are
+    bounded by the lock backend and spaced with jittered exponential backoff.
+
+    Within `raising_conflicts`, the outermost operation raises the conflict instead, for the caller to back
+    off without blocking its thread. Operations it runs after it committed something retry right away then,
+    since it cannot be replayed either.
+    """
+    @functools.wraps(method)
+    def wrapper(self, db: Session, *args, **kwargs):
+        nested = db.info.get(_RETRY_DEPTH, 0)
+        db.info[_RETRY_DEPTH] = nested + 1
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return method(self, db, *args, **kwargs)
+                except ClusterVersionConflict as conflict:
+                    if db.info.get(_TRANSACTION_DEPTH, 0) > 0:
+                        raise
+                    cluster_metrics = metrics.for_cluster(conflict.cluster_id)
+                    cluster_metrics.version_conflicts.inc()
+                    raising = db.info.get(_RAISE_CONFLICTS, False)
+                    if raising and not nested:
+                        raise
+                    attempt += 1
+                    delay = self.retry_delay(attempt)
+                    if delay is None:
+                        raise
+                    cluster_metrics.version_retries.inc()
+                    if not raising:
+                        time.sleep(delay)
+        finally:
+            db.info[_RETRY_DEPTH] = nested
+    return wrapper
 
 
 def _deallocate_resources(
-        deployment: DeploymentModel, cluster: Cluster, db: Session
+        deployment: DeploymentModel, cluster: Cluster, state: ClusterState, db: Session
 ):
     """
     Internal method to deallocate resources for a deployment.
-    This method should be protected by a lock.
+    This method should be protected by a lock and run inside a scheduler transaction.
     """
-    cluster.cpu_available += deployment.cpu_required
-    cluster.ram_available += deployment.ram_required
-    cluster.gpu_available += deployment.gpu_required
-    db.commit()
+    state.release(deployment.id)
+    state.copy_capacity_to(cluster)
 
 
 def _allocate_resources(
-        deployment: DeploymentModel, cluster: Cluster, db: Session
+        deployment: DeploymentModel, cluster: Cluster, state: ClusterState, db: Session
 ):
     """
     Internal method to allocate resources for the deployment.
-    This method should be protected by a lock.
+    This method should be protected by a lock and run inside a scheduler transaction.
     """
     # Allocate resources
-    cluster.cpu_available -= deployment.cpu_required
-    cluster.ram_available -= deployment.ram_required
-    cluster.gpu_available -= deployment.gpu_required
-    db.commit()
+    state.allocate(DeploymentEntry.from_model(deployment))
+    state.copy_capacity_to(cluster)
+    _record_event(db, DeploymentEventKind.STARTED, cluster.id, deployment.id)
 
 
-def _handle_preemption(db: Session, deployment: DeploymentModel, cluster: Cluster):
+@metrics.observe_latency(metrics.PREEMPTION_LATENCY)
+def _handle_preemption(db: Session, deployment: DeploymentModel, cluster: Cluster, state: ClusterState,
+                       preemptable_entries: List[DeploymentEntry]):
     """
-    Handle preemption: If resources are not available, attempt to preempt lower-priority deployments.
+    Handle preemption: If resources are not available, attempt to preempt running deployments.
+    The cheapest set of the preemptable deployments that frees enough CPU, RAM and GPU is evicted.
     """
-    # Find the lower-priority deployments that are currently running
+    victims = select_victims(deployment, state, preemptable_entries)
+    if not victims:
+        return
+
+    # Deallocating resources of the lower-priority deployments, which go back to the queue
     preempted_deployments = db.query(DeploymentModel).filter(
-        DeploymentModel.cluster_id == deployment.cluster_id,
-        DeploymentModel.status == DeploymentStatus.RUNNING,
-        DeploymentModel.priority < deployment.priority
-    ).order_by(DeploymentModel.priority.asc()).all()
+        DeploymentModel.id.in_([victim.id for victim in victims])
+    ).all()
+    for preempted_deployment in preempted_deployments:
+        _deallocate_resources(preempted_deployment, cluster, state, db)
+        preempted_deployment.status = DeploymentStatus.PENDING
+        state.enqueue(DeploymentEntry.from_model(preempted_deployment))
+        _record_event(db, DeploymentEventKind.PREEMPTED, cluster.id, preempted_deployment.id)
+    _count_preemptions(db, cluster.id, len(preempted_deployments))
 
-    available_cluster_cpu = cluster.cpu_available
-    available_cluster_ram = cluster.ram_available
-    available_cluster_gpu = cluster.gpu_available
+    # Once resources are freed, allocate to the new deployment
+    _allocate_resources(deployment, cluster, state, db)
+    deployment.status = DeploymentStatus.RUNNING
 
-    cpu_required_for_new_deployment = deployment.cpu_required
-    ram_required_for_new_deployment = deployment.ram_required
-    gpu_required_for_new_deployment = deployment.gpu_required
 
-    for preempted_deployment in preempted_deployments:
-        cpu_required_for_preempted_deployment = preempted_deployment.cpu_required
-        ram_required_for_preempted_deployment = preempted_deployment.ram_required
-        gpu_required_for_preempted_deployment = preempted_deployment.gpu_required
-        if (
-                available_cluster_cpu + cpu_required_for_preempted_deployment < cpu_required_for_new_deployment or
-                available_cluster_ram + ram_required_for_preempted_deployment < ram_required_for_new_deployment or
-                available_cluster_gpu + gpu_required_for_preempted_deployment < gpu_required_for_new_deployment
-        ):
-            continue
-        # deallocating resources of the lower-priority deployment
-        _deallocate_resources(preempted_deployment, cluster, db)
-        preempted_deployment.status = DeploymentStatus.PENDING
+def _new_deployment(cluster_id: int, deployment_in: DeploymentCreate, user_id: Optional[int]) -> DeploymentModel:
+    return DeploymentModel(
+        name=deployment_in.name,
+        docker_image=deployment_in.docker_image,
+        cpu_required=deployment_in.cpu_required,
+        ram_required=deployment_in.ram_required,
+        gpu_required=deployment_in.gpu_required,
+        priority=deployment_in.priority,
+        status=DeploymentStatus.PENDING,
+        cluster_id=cluster_id,
+        user_id=user_id,
+    )
+
+
+def _observe_lock_hold(cluster_ids: Tuple[int, ...], acquired: float):
+    held = time.perf_counter() - acquired
+    for cluster_id in cluster_ids:
+        metrics.for_cluster(cluster_id).lock_hold.observe(held)
+
+
+def _record_event(db: Session, kind: DeploymentEventKind, cluster_id: int, deployment_id: int):
+    """
+    Log an event of the current scheduler transaction. Events are inserted together right before it commits.
+    """
+    db.info.setdefault(_EVENTS, []).append((kind, cluster_id, deployment_id))
+
+
+def _count_correction(db: Session, cluster_id: int, drift: Tuple[int, int, int]):
+    """
+    Report a capacity correction once it committed.
+    """
+    def report():
+        metrics.for_cluster(cluster_id).capacity_corrections.inc()
+        for histogram, value in zip((metrics.CPU_DRIFT, metrics.RAM_DRIFT, metrics.GPU_DRIFT), drift):
+            histogram.observe(abs(value))
+    AdvancedScheduler._after_commit(db, report)
+
 
-        # Once resources are freed, allocate to the new deployment
-        _allocate_resources(deployment, cluster, db)
-        deployment.status = DeploymentStatus.RUNNING
-        break
+def _count_preemptions(db: Session, cluster_id: int, count: int):
+    """
+    Count preemptions once the decision making them committed.
+    """
+    if count:
+        AdvancedScheduler._after_commit(db, functools.partial(metrics.for_cluster(cluster_id).preemptions.inc, count))
 
 
 class AdvancedScheduler(Scheduler):
+    """
+    Priority and preemption based scheduler.
+
+    A single instance is created for the whole process (see `app.main.lifespan`), so the cluster
+    locks actually serialize concurrent scheduling on the same cluster and the in-memory
+    `ClusterStateStore` serves placement decisions without reading cluster state back from the database.
+    With a distributed lock backend, the state of a cluster is reloaded each time its lock is acquired,
+    since other workers may have changed it.
+
+    Deployments with dependencies that have not completed yet stay pending outside of their cluster queue.
+    With a local lock backend they are tracked by an in-memory `DependencyGraph`, so a completion only looks
+    at its direct successors; with a distributed one, other workers may block deployments too, so the
+    successors are read from the database instead. Decisions that create or release dependencies lock the
+    clusters of the dependencies as well, so a dependency cannot complete while a deployment is being
+    blocked on it.
+
+    Deployments that do not name a cluster are placed on a cluster of their organization chosen by the
+    placement strategy. Organizations with many clusters are scored over the store's capacity matrix in a
+    few vector operations.
+
+    Every decision appends what it did to each deployment to the `DeploymentEvent` log, and every
+    `snapshot_interval` events of a cluster its state is saved as a `ClusterSnapshot`, in the same
+    transaction. Startup restores the latest snapshots and replays the events logged after them, so it
+    reads at most `snapshot_interval` events per cluster however many deployments are active.
+    """
+
+    def __init__(self, lock_backend: Optional[ClusterLockBackend] = None, placement_strategy: str = "best_fit",
+                 snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+        self.lock_backend = lock_backend or InProcessLockBackend()
+        self.placement_strategy = get_placement_strategy(placement_strategy)
+        self.cluster_states = ClusterStateStore()
+        self.dependencies = DependencyGraph()
+        self.snapshot_interval = snapshot_interval
+        # Events logged per cluster since its latest snapshot, by this process
+        self.events_since_snapshot: Dict[int, int] = defaultdict(int)
+        # Clusters changed by this process since the capacity reconciler last checked them
+        self.dirty_clusters: Set[int] = set()
+
+    def hydrate(self, db: Session):
+        """
+        Recover the state of every cluster from its latest snapshot and the event log, and load the
+        deployments waiting for dependencies. Called once at application startup.
+        """
+        self.events_since_snapshot = defaultdict(int, self.cluster_states.recover(db))
+        # Check every cluster once after startup
+        self.dirty_clusters = {state.id for state in self.cluster_states.states()}
+        if not self.lock_backend.distributed:
+            self.dependencies.hydrate(db)
+
+    @contextmanager
+    def _transaction(self, db: Session, *cluster_ids: int) -> Iterator[None]:
+        """
+        Run a scheduling decision as one unit of work while holding the locks of the given clusters.
+
+        Capacity changes, status changes and inserts are committed once when the outermost transaction
+        ends, so the database never exposes a half-applied decision (e.g. a preempted deployment without
+        the deployment that preempted it). If anything fails the session is rolled back and the in-memory
+        state of the affected clusters is dropped, to be reloaded from the database on next use.
+        Nested transactions (e.g. the queue drain run after a release) join the outer one.
+        With an optimistic lock backend no lock is taken; the cluster versions are compared and swapped
+        right before the commit instead, raising ClusterVersionConflict if another worker committed first.
+        Callbacks registered with `_after_commit` run once the outermost transaction committed, while its
+        locks are still held, and are dropped if it fails.
+        """
+        depth = db.info.get(_TRANSACTION_DEPTH, 0)
+        touched_clusters = db.info.setdefault(_TRANSACTION_CLUSTERS, set())
+        touched_clusters.update(cluster_ids)
+
+        # Lock waits and holds are only timed for the outermost transaction, since nested ones re-enter held
+        # locks, and only for locks shared between workers: requests of the same process queue on the locks of
+        # the AsyncScheduler instead, which times them, and reach the local locks one at a time
+        timed = depth == 0 and self.lock_backend.distributed and not self.lock_backend.optimistic
+        with ExitStack() as stack:
+            # Lock clusters in a consistent order so concurrent decisions on several clusters cannot deadlock
+            for cluster_id in sorted(cluster_ids):
+                if timed:
+                    start = time.perf_counter()
+                    stack.enter_context(self.lock_backend.lock(db, cluster_id))
+                    metrics.for_cluster(cluster_id).lock_wait.observe(time.perf_counter() - start)
+                else:
+                    stack.enter_context(self.lock_backend.lock(db, cluster_id))
+            if timed:
+                # Exit callbacks run in reverse order, so this one runs right before the locks are released
+                stack.callback(_observe_lock_hold, cluster_ids, time.perf_counter())
 
-    def __init__(self):
-        # This dictionary will map cluster IDs to locks for thread safety.
-        self.cluster_locks: Dict[int, threading.Lock] = {}
+            db.info[_TRANSACTION_DEPTH] = depth + 1
+            try:
+                if depth == 0 and self.lock_backend.distributed:
+                    # Other workers may have scheduled on these clusters since we last saw them
+                    for cluster_id in cluster_ids:
+                        self.cluster_states.load(db, cluster_id)
+                yield
+                if depth == 0:
+                    self._write_events(db)
+                    if self.lock_backend.optimistic:
+                        self._swap_versions(db, touched_clusters)
+                    start = time.perf_counter()
+                    db.commit()
+                    metrics.COMMIT_LATENCY.observe(time.perf_counter() - start)
+                    self.dirty_clusters.update(touched_clusters)
+                    for callback in db.info.pop(_AFTER_COMMIT, ()):
+                        callback()
+            except Exception:
+                if depth == 0:
+                    db.rollback()
+                    for cluster_id in touched_clusters:
+                        self.cluster_states.invalidate(cluster_id)
+                raise
+            finally:
+                db.info[_TRANSACTION_DEPTH] = depth
+                if depth == 0:
+                    db.info.pop(_TRANSACTION_CLUSTERS, None)
+                    db.info.pop(_AFTER_COMMIT, None)
+                    db.info.pop(_EVENTS, None)
+                    db.info.pop(_SNAPSHOTS, None)
+
+    @staticmethod
+    def _after_commit(db: Session, callback: Callable[[], None]):
+        """
+        Run `callback` once the current scheduler transaction has committed, e.g. to update in-memory
+        indexes that must not see decisions that could still be rolled back.
+        """
+        db.info.setdefault(_AFTER_COMMIT, []).append(callback)
+
+    def _write_events(self, db: Session):
+        """
+        Insert the events of the transaction with a single bulk insert, and snapshot the clusters that
+        reached `snapshot_interval` events since their previous snapshot, or whose snapshot was requested
+        with `_snapshot_on_commit`. Their previous snapshot is then deleted.
+        """
+        events = db.info.pop(_EVENTS, None)
+        requested = db.info.pop(_SNAPSHOTS, set())
+        if not events and not requested:
+            return
+        counts: Dict[int, int] = Counter()
+        if events:
+            event_ids = db.scalars(
+                insert(DeploymentEvent).returning(DeploymentEvent.id, sort_by_parameter_order=True),
+                [{"kind": kind, "cluster_id": cluster_id, "deployment_id": deployment_id}
+                 for kind, cluster_id, deployment_id in events]
+            ).all()
+            last_event_id = max(event_ids)
+            counts.update(cluster_id for _, cluster_id, _ in events)
+        else:
+            # Events of the snapshotted clusters can only be logged under their locks, which are held
+            last_event_id = db.scalar(select(func.max(DeploymentEvent.id))) or 0
+
+        events_since_snapshot: Dict[int, int] = {}
+        for cluster_id in counts.keys() | requested:
+            count = counts[cluster_id] + self.events_since_snapshot[cluster_id]
+            if count >= self.snapshot_interval or cluster_id in requested:
+                snapshot = self.cluster_states.get(db, cluster_id).to_snapshot(last_event_id)
+                db.add(snapshot)
+                db.flush()
+                db.execute(
+                    delete(ClusterSnapshot).where(ClusterSnapshot.cluster_id == cluster_id,
+                                                  ClusterSnapshot.id < snapshot.id),
+                    execution_options={"synchronize_session": False},
+                )
+                count = 0
+            events_since_snapshot[cluster_id] = count
+        self._after_commit(db, functools.partial(self.events_since_snapshot.update, events_since_snapshot))
+
+    @staticmethod
+    def _snapshot_on_commit(db: Session, cluster_id: int):
+        """
+        Snapshot the cluster when the current scheduler transaction commits, e.g. after a change to its state
+        that no logged event describes.
+        """
+        db.info.setdefault(_SNAPSHOTS, set()).add(cluster_id)
+
+    def _swap_versions(self, db: Session, cluster_ids: Iterable[int]):
+        """
+        Bump the version of every cluster the decision touched, provided nobody else did since it was loaded.
+        """
+        for cluster_id in sorted(cluster_ids):
+            state = self.cluster_states.get(db, cluster_id)
+            result = db.execute(
+                update(Cluster)
+                .where(Cluster.id == cluster_id, Cluster.version == state.version)
+                .values(version=Cluster.version + 1),
+                execution_options={"synchronize_session": False},
+            )
+            if result.rowcount == 0:
+                raise ClusterVersionConflict(cluster_id)
+            state.version += 1
+
+    def take_dirty_clusters(self) -> Set[int]:
+        dirty_clusters, self.dirty_clusters = self.dirty_clusters, set()
+        return dirty_clusters
+
+    def mark_dirty_clusters(self, cluster_ids: Iterable[int]):
+        self.dirty_clusters.update(cluster_ids)
+
+    def drifted_clusters(self, db: Session, cluster_ids: Iterable[int]) -> List[int]:
+        """
+        Compare the available capacity of the given clusters with their limits minus the resources of their
+        running deployments, computed by a single grouped aggregate, without locking. Returns the clusters
+        that drifted, for `reconcile_cluster` to check again and correct under their lock.
+        """
+        running = and_(DeploymentModel.cluster_id == Cluster.id, DeploymentModel.status == DeploymentStatus.RUNNING)
+        rows = db.execute(
+            select(Cluster.id, Cluster.cpu_available, Cluster.ram_available, Cluster.gpu_available,
+                   Cluster.cpu_limit - func.coalesce(func.sum(DeploymentModel.cpu_required), 0),
+                   Cluster.ram_limit - func.coalesce(func.sum(DeploymentModel.ram_required), 0),
+                   Cluster.gpu_limit - func.coalesce(func.sum(DeploymentModel.gpu_required), 0))
+            .outerjoin(DeploymentModel, running)
+            .where(Cluster.id.in_(set(cluster_ids)))
+            .group_by(Cluster.id)
+            .order_by(Cluster.id)
+        ).all()
+
+        drifted = []
+        for cluster_id, *capacity in rows:
+            available, expected = tuple(capacity[:3]), tuple(capacity[3:])
+            if available != expected:
+                drifted.append(cluster_id)
+            elif not self.lock_backend.distributed and cluster_id in self.cluster_states:
+                # The in-memory state is authoritative in this process and may have drifted on its own
+                state = self.cluster_states.get(db, cluster_id)
+                if (state.cpu_available, state.ram_available, state.gpu_available) != expected:
+                    drifted.append(cluster_id)
+        return drifted
+
+    @retry_on_conflict
+    def reconcile_cluster(self, db: Session, cluster_id: int) -> bool:
+        """
+        Recompute the available capacity of a cluster from its running deployments under its lock, and
+        correct the cluster row and in-memory state if they drifted, then drain the queue. An in-memory running
+        set that no longer matches the database (e.g. a missed release) is rebuilt as well. Returns whether
+        anything changed.
+        """
+        with self._transaction(db, cluster_id):
+            cluster = db.get(Cluster, cluster_id, populate_existing=True)
+            running = db.execute(
+                select(DeploymentModel.id, DeploymentModel.cpu_required, DeploymentModel.ram_required,
+                       DeploymentModel.gpu_required)
+                .where(DeploymentModel.cluster_id == cluster_id, DeploymentModel.status == DeploymentStatus.RUNNING)
+            ).all()
+            expected = (cluster.cpu_limit - sum(row.cpu_required for row in running),
+                        cluster.ram_limit - sum(row.ram_required for row in running),
+                        cluster.gpu_limit - sum(row.gpu_required for row in running))
+
+            state = self.cluster_states.get(db, cluster_id)
+            available = (state.cpu_available, state.ram_available, state.gpu_available)
+            reloaded = state.running.keys() != {row.id for row in running}
+            changed = (reloaded or available != expected
+                       or (cluster.cpu_available, cluster.ram_available, cluster.gpu_available) != expected)
+            if changed:
+                if reloaded:
+                    state = self.cluster_states.load(db, cluster_id)
+                state.reset_capacity(*expected)
+                state.copy_capacity_to(cluster)
+                _count_correction(db, cluster_id, tuple(actual - value for actual, value in zip(available, expected)))
+                # Capacity that was lost to the drift may let queued deployments start
+                self.process_cluster_queue(db, cluster)
+                # No event describes the correction, so recovery must start from the corrected state
+                self._snapshot_on_commit(db, cluster_id)
+        # The check marked the cluster dirty, but nothing else could change it while it was locked
+        self.dirty_clusters.discard(cluster_id)
+        return changed
+
+    def dependency_clusters(self, db: Session, deployment_ids: Iterable[int]) -> Set[int]:
+        """
+        Clusters of the given deployments. Blocking a deployment on dependencies locks their clusters too.
+        """
+        deployment_ids = set(deployment_ids)
+        if not deployment_ids:
+            return set()
+        return set(db.scalars(
+            select(DeploymentModel.cluster_id).where(DeploymentModel.id.in_(deployment_ids)).distinct()
+        ))
+
+    def status_update_clusters(self, db: Session, deployment: DeploymentModel,
+                               status_update: DeploymentStatusUpdate) -> Set[int]:
+        """
+        Clusters a status update may change: the deployment's own cluster, the clusters of its dependencies if
+        it is queued again, and the clusters of the deployments it unblocks if it completes.
+        """
+        cluster_ids = {deployment.cluster_id}
+        if status_update.status == DeploymentStatus.PENDING:
+            cluster_ids |= self.dependency_clusters(db, self._unsatisfied_dependencies(db, deployment.id))
+        elif status_update.status == DeploymentStatus.COMPLETED:
+            if self.lock_backend.distributed:
+                cluster_ids |= set(db.scalars(
+                    select(DeploymentModel.cluster_id)
+                    .join(DeploymentDependency, DeploymentDependency.deployment_id == DeploymentModel.id)
+                    .where(DeploymentDependency.depends_on_id == deployment.id,
+                           DeploymentDependency.satisfied.is_(False))
+                    .distinct()
+                ))
+            else:
+                cluster_ids |= self.dependencies.successor_clusters(deployment.id)
+        return cluster_ids
 
-    def _get_cluster_lock(self, cluster_id: int) -> threading.Lock:
+    def _add_dependencies(self, db: Session, dependencies: Dict[int, List[int]],
+                          cluster_ids: Dict[int, int]) -> Set[int]:
         """
-        Get or create a lock for the given cluster ID to ensure thread safety for the same cluster.
+        Insert the dependencies of new deployments and return the deployments that have to wait for some of them.
         """
-        if cluster_id not in self.cluster_locks:
-            # Create a new lock for this cluster if it doesn't already exist.
-            self.cluster_locks[cluster_id] = threading.Lock()
-        return self.cluster_locks[cluster_id]
+        blocked_ids = set()
+        for deployment_id, waiting_on in self._insert_dependencies(db, dependencies).items():
+            if waiting_on:
+                self._block(db, deployment_id, cluster_ids[deployment_id], waiting_on)
+                blocked_ids.add(deployment_id)
+        return blocked_ids
 
+    @staticmethod
+    def _insert_dependencies(db: Session, dependencies: Dict[int, List[int]]) -> Dict[int, List[int]]:
+        """
+        Insert the dependencies of new deployments with a single bulk insert, and return the dependencies each
+        of them still waits for. Dependencies that already completed are inserted as satisfied.
+        """
+        dependencies = {deployment_id: list(dict.fromkeys(depends_on))
+                        for deployment_id, depends_on in dependencies.items() if depends_on}
+        if not dependencies:
+            return {}
+
+        depends_on_ids = {depends_on_id for depends_on in dependencies.values() for depends_on_id in depends_on}
+        completed_ids = set(db.scalars(select(DeploymentModel.id).where(
+            DeploymentModel.id.in_(depends_on_ids), DeploymentModel.status == DeploymentStatus.COMPLETED
+        )))
+        db.execute(insert(DeploymentDependency), [
+            {"deployment_id": deployment_id, "depends_on_id": depends_on_id,
+             "satisfied": depends_on_id in completed_ids}
+            for deployment_id, depends_on in dependencies.items() for depends_on_id in depends_on
+        ])
+        return {deployment_id: [depends_on_id for depends_on_id in depends_on if depends_on_id not in completed_ids]
+                for deployment_id, depends_on in dependencies.items()}
+
+    @staticmethod
+    def _resolve_dependencies(db: Session, deployment_id: int) -> List[int]:
+        """
+        Satisfy the dependencies of a submitted deployment that completed since it was inserted, and return
+        those it still waits for. Runs under the locks of the dependencies' clusters.
+        """
+        waiting_on = AdvancedScheduler._unsatisfied_dependencies(db, deployment_id)
+        completed_ids = set(db.scalars(select(DeploymentModel.id).where(
+            DeploymentModel.id.in_(waiting_on), DeploymentModel.status == DeploymentStatus.COMPLETED
+        ))) if waiting_on else set()
+        if completed_ids:
+            db.execute(
+                update(DeploymentDependency)
+                .where(DeploymentDependency.deployment_id == deployment_id,
+                       DeploymentDependency.depends_on_id.in_(completed_ids))
+                .values(satisfied=True),
+                execution_options={"synchronize_session": False},
+            )
+        return [depends_on_id for depends_on_id in waiting_on if depends_on_id not in completed_ids]
+
+    @staticmethod
+    def _unsatisfied_dependencies(db: Session, deployment_id: int) -> List[int]:
+        return list(db.scalars(select(DeploymentDependency.depends_on_id).where(
+            DeploymentDependency.deployment_id == deployment_id, DeploymentDependency.satisfied.is_(False)
+        )))
+
+    def _block(self, db: Session, deployment_id: int, cluster_id: int, depends_on_ids: List[int]):
+        """
+        Keep a pending deployment out of its cluster queue until the given dependencies complete.
+        """
+        _record_event(db, DeploymentEventKind.BLOCKED, cluster_id, deployment_id)
+        if not self.lock_backend.distributed:
+            self._after_commit(db, lambda: self.dependencies.block(deployment_id, cluster_id, depends_on_ids))
+
+    def _complete_dependencies(self, db: Session, deployment_id: int) -> List[int]:
+        """
+        Satisfy the dependencies on a deployment that just completed and return the deployments it unblocks.
+        With the in-memory graph the returned list is only filled once the transaction has committed.
+        """
+        db.execute(
+            update(DeploymentDependency)
+            .where(DeploymentDependency.depends_on_id == deployment_id, DeploymentDependency.satisfied.is_(False))
+            .values(satisfied=True),
+            execution_options={"synchronize_session": False},
+        )
+        if self.lock_backend.distributed:
+            return list(db.scalars(
+                select(DeploymentModel.id)
+                .where(DeploymentModel.id.in_(select(DeploymentDependency.deployment_id)
+                                              .where(DeploymentDependency.depends_on_id == deployment_id)),
+                       DeploymentModel.status == DeploymentStatus.PENDING,
+                       ~is_blocked())
+                .order_by(DeploymentModel.id)
+            ))
+        unblocked_ids: List[int] = []
+        self._after_commit(db, lambda: unblocked_ids.extend(self.dependencies.completed(deployment_id)))
+        return unblocked_ids
+
+    @retry_on_conflict
+    def _release_dependents(self, db: Session, deployment_ids: List[int]):
+        """
+        Queue deployments whose last dependency completed, and start them if their cluster has room.
+        Runs after the completion committed, with one transaction per cluster, so the locks of the completed
+        deployment's cluster and of its dependents' clusters are never nested.
+        """
+        if not deployment_ids:
+            return
+        unblocked: Dict[int, List[DeploymentModel]] = defaultdict(list)
+        for deployment in db.scalars(select(DeploymentModel).where(
+                DeploymentModel.id.in_(deployment_ids), DeploymentModel.status == DeploymentStatus.PENDING
+        ).order_by(DeploymentModel.id)):
+            unblocked[deployment.cluster_id].append(deployment)
+
+        for cluster_id in sorted(unblocked):
+            cluster = db.get(Cluster, cluster_id)
+            with self._transaction(db, cluster_id):
+                state = self.cluster_states.get(db, cluster_id)
+                for deployment in unblocked[cluster_id]:
+                    # A reloaded cluster state already has them
+                    if deployment.id not in state.pending and deployment.id not in state.running:
+                        state.enqueue(DeploymentEntry.from_model(deployment))
+                    _record_event(db, DeploymentEventKind.QUEUED, cluster_id, deployment.id)
+                self._drain_queue(db, cluster)
+
+    def choose_cluster(self, db: Session, organization_id: int,
+                       deployment_in: DeploymentCreate) -> Tuple[Optional[int], bool]:
+        """
+        Score the organization's clusters with the placement strategy. Membership comes from the indexed
+        organization_id column; capacities come from the in-memory cluster states, without locking, so the
+        choice is only a hint that `place` checks again under the cluster lock.
+        """
+        cluster_ids = db.scalars(
+            select(Cluster.id).where(Cluster.organization_id == organization_id).order_by(Cluster.id)
+        ).all()
+        if len(cluster_ids) < VECTORIZED_PLACEMENT_MIN_CLUSTERS:
+            state, has_room = choose_cluster(
+                (self.cluster_states.get(db, cluster_id) for cluster_id in cluster_ids), deployment_in,
+                self.placement_strategy
+            )
+            return (state.id if state is not None else None), has_room
+
+        position, has_room = choose_cluster_vectorized(
+            self.cluster_states.matrix, self.cluster_states.columns(db, cluster_ids), deployment_in,
+            self.placement_strategy
+        )
+        return (cluster_ids[position] if position is not None else None), has_room
+
+    @metrics.observe_latency(metrics.PLACE_LATENCY)
+    @retry_on_conflict
+    def place(self, db: Session, cluster_id: int, deployment_in: DeploymentCreate,
+              require_capacity: bool = False, user_id: Optional[int] = None) -> Optional[DeploymentModel]:
+        cluster = db.get(Cluster, cluster_id)
+        with self._transaction(db, *({cluster_id} | self.dependency_clusters(db, deployment_in.depends_on))):
+            if require_capacity and not self.cluster_states.get(db, cluster_id).has_capacity_for(deployment_in):
+                return None
+            return self.schedule(db, cluster, deployment_in.model_copy(update={"cluster_id": cluster_id}),
+                                 user_id=user_id)
+
+    @metrics.observe_latency(metrics.SCHEDULE_LATENCY)
+    @retry_on_conflict
     def schedule(
             self,
             db: Session,
             cluster: Cluster,
-            deployment_in: DeploymentCreate
+            deployment_in: DeploymentCreate,
+            user_id: Optional[int] = None
     ) -> DeploymentModel:
         """
         Processes the deployment:
+        - Leaves it pending outside of the cluster queue if some of its dependencies have not completed.
         - Allocates resources if available.
         - If resources are unavailable, attempts to preempt lower priority deployments.
         """
-        deployment = DeploymentModel(
-            name=deployment_in.name,
-            docker_image=deployment_in.docker_image,
-            cpu_required=deployment_in.cpu_required,
-            ram_required=deployment_in.ram_required,
-            gpu_required=deployment_in.gpu_required,
-            priority=deployment_in.priority,
-            status=DeploymentStatus.PENDING,
-            cluster_id=deployment_in.cluster_id,
-        )
+        deployment = _new_deployment(cluster.id, deployment_in, user_id)
 
-        # Get a lock for this specific cluster
-        cluster_lock = self._get_cluster_lock(deployment.cluster_id)
+        # Lock this specific cluster (and those of the dependencies) and commit the whole decision at once
+        with self._transaction(db, *({cluster.id} | self.dependency_clusters(db, deployment_in.depends_on))):
+            state = self.cluster_states.get(db, cluster.id)
 
-        with cluster_lock:
-            # Try to allocate resources for the new deployment
-            if cluster_has_sufficient_resources(cluster, deployment):
-                _allocate_resources(deployment, cluster, db)
-                deployment.status = DeploymentStatus.RUNNING
-            else:
-                # If resources aren't available, attempt preemption
-                _handle_preemption(db, deployment, cluster)
+            # Flush to obtain the deployment ID used to track it in the cluster state
+            db.add(deployment)
+            db.flush()
+            _record_event(db, DeploymentEventKind.SUBMITTED, cluster.id, deployment.id)
+
+            if not self._add_dependencies(db, {deployment.id: deployment_in.depends_on}, {deployment.id: cluster.id}):
+                self._admit(db, deployment, cluster, state)
+        # Within an enclosing transaction nothing is committed yet, so flush for the refresh to see the decision
+        db.flush()
+        db.refresh(deployment)
+        return deployment
+
+    def _admit(self, db: Session, deployment: DeploymentModel, cluster: Cluster, state: ClusterState):
+        """
+        Start a pending deployment that does not wait for dependencies if its cluster has room, preempting
+        lower priority deployments if needed, or queue it.
+        """
+        # Try to allocate resources for the new deployment
+        if state.has_capacity_for(deployment):
+            _allocate_resources(deployment, cluster, state, db)
+            deployment.status = DeploymentStatus.RUNNING
+        else:
+            # If resources aren't available, attempt preemption
+            _handle_preemption(db, deployment, cluster, state,
+                               self._preemption_candidates(state, DeploymentEntry.from_model(deployment)))
+
+        if deployment.status == DeploymentStatus.PENDING:
+            state.enqueue(DeploymentEntry.from_model(deployment))
 
+    def submit(self, db: Session, cluster: Cluster, deployment_in: DeploymentCreate,
+               user_id: Optional[int] = None) -> DeploymentModel:
+        """
+        Insert a deployment as pending, with its dependencies, and commit it without taking the cluster lock.
+        Nothing is decided yet: the deployment stays out of the cluster state until `admit` processes it.
+        """
+        deployment = _new_deployment(cluster.id, deployment_in, user_id)
         db.add(deployment)
+        db.flush()
+        self._insert_dependencies(db, {deployment.id: deployment_in.depends_on})
         db.commit()
+        return deployment
+
+    def admission_clusters(self, db: Session, deployment_id: int) -> Set[int]:
+        deployment = db.get(DeploymentModel, deployment_id)
+        if deployment is None:
+            return set()
+        return {deployment.cluster_id} | self.dependency_clusters(
+            db, self._unsatisfied_dependencies(db, deployment_id)
+        )
+
+    @metrics.observe_latency(metrics.ADMIT_LATENCY)
+    @retry_on_conflict
+    def admit(self, db: Session, deployment_id: int) -> Optional[DeploymentModel]:
+        """
+        Decide on a deployment inserted by `submit`, like `schedule` does for a new one. Deployments that are
+        no longer pending, already running or already waiting for dependencies are left alone, so admitting
+        one twice is harmless; a queued one is taken out of the queue and admitted again.
+        """
+        deployment = db.get(DeploymentModel, deployment_id)
+        if deployment is None:
+            return None
+        cluster = db.get(Cluster, deployment.cluster_id)
+        with self._transaction(db, *self.admission_clusters(db, deployment_id)):
+            state = self.cluster_states.get(db, cluster.id)
+            db.refresh(deployment)
+            if (deployment.status != DeploymentStatus.PENDING or deployment.id in state.running
+                    or deployment.id in self.dependencies):
+                return deployment
+            state.discard(deployment.id)
+            _record_event(db, DeploymentEventKind.SUBMITTED, cluster.id, deployment.id)
+
+            waiting_on = self._resolve_dependencies(db, deployment.id)
+            if waiting_on:
+                self._block(db, deployment.id, cluster.id, waiting_on)
+            else:
+                self._admit(db, deployment, cluster, state)
+        db.flush()
         db.refresh(deployment)
         return deployment
 
+    def unadmitted_deployments(self, db: Session) -> Dict[int, List[int]]:
+        """
+        Pending deployments that neither wait for dependencies nor are in their cluster queue, by cluster: those
+        submitted without being admitted, e.g. because the process stopped in between.
+        """
+        unadmitted: Dict[int, List[int]] = defaultdict(list)
+        for deployment_id, cluster_id in db.execute(
+                select(DeploymentModel.id, DeploymentModel.cluster_id)
+                .where(DeploymentModel.status == DeploymentStatus.PENDING, ~is_blocked())
+                .order_by(DeploymentModel.id)
+        ):
+            if deployment_id not in self.cluster_states.get(db, cluster_id).pending:
+                unadmitted[cluster_id].append(deployment_id)
+        return dict(unadmitted)
+
+    def queued_clusters(self) -> List[int]:
+        return sorted(state.id for state in self.cluster_states.states() if state.pending)
+
+    @metrics.observe_latency(metrics.SCHEDULE_BATCH_LATENCY)
+    @retry_on_conflict
+    def schedule_batch(
+            self,
+            db: Session,
+            clusters: Dict[int, Cluster],
+            deployments_in: List[DeploymentCreate],
+            batch_dependencies: Optional[Dict[int, List[int]]] = None,
+            user_id: Optional[int] = None
+    ) -> List[Tuple[int, DeploymentStatus]]:
+        """
+        Schedules a batch of deployments in one pass per cluster:
+        - Inserts every deployment as pending with a single bulk insert, and their dependencies with another.
+          `batch_dependencies` maps positions in the batch to the positions of the deployments they depend on.
+        - Pushes those that do not wait for dependencies on their cluster queue and drains each queue once.
+        - Preempts lower-priority deployments for the batch deployments still waiting, highest priority first.
+        - Persists all status and capacity changes with a bulk update and a single commit.
+        """
+        depends_on_ids = {depends_on_id for deployment_in in deployments_in
+                          for depends_on_id in deployment_in.depends_on}
+        with self._transaction(db, *(set(clusters) | self.dependency_clusters(db, depends_on_ids))):
+            states = {cluster_id: self.cluster_states.get(db, cluster_id) for cluster_id in clusters}
+
+            deployment_ids = db.scalars(
+                insert(DeploymentModel).returning(DeploymentModel.id, sort_by_parameter_order=True),
+                [{
+                    "name": deployment_in.name,
+                    "docker_image": deployment_in.docker_image,
+                    "cpu_required": deployment_in.cpu_required,
+                    "ram_required": deployment_in.ram_required,
+                    "gpu_required": deployment_in.gpu_required,
+                    "priority": deployment_in.priority,
+                    "status": DeploymentStatus.PENDING,
+                    "cluster_id": deployment_in.cluster_id,
+                    "user_id": user_id,
+                } for deployment_in in deployments_in]
+            ).all()
+            for deployment_id, deployment_in in zip(deployment_ids, deployments_in):
+                _record_event(db, DeploymentEventKind.SUBMITTED, deployment_in.cluster_id, deployment_id)
+
+            batch_dependencies = batch_dependencies or {}
+            blocked_ids = self._add_dependencies(
+                db,
+                {deployment_id: list(deployment_in.depends_on)
+                 + [deployment_ids[position] for position in batch_dependencies.get(index, ())]
+                 for index, (deployment_id, deployment_in) in enumerate(zip(deployment_ids, deployments_in))},
+                {deployment_id: deployment_in.cluster_id
+                 for deployment_id, deployment_in in zip(deployment_ids, deployments_in)},
+            )
+
+            batches: Dict[int, List[DeploymentEntry]] = defaultdict(list)
+            for deployment_id, deployment_in in zip(deployment_ids, deployments_in):
+                if deployment_id in blocked_ids:
+                    continue
+                batches[deployment_in.cluster_id].append(DeploymentEntry(
+                    id=deployment_id,
+                    priority=deployment_in.priority,
+                    cpu_required=deployment_in.cpu_required,
+                    ram_required=deployment_in.ram_required,
+                    gpu_required=deployment_in.gpu_required,
+                    owner_id=user_id,
+                ))
+
+            # Deployments were inserted as pending, so only those now running and the running ones sent
+            # back to the queue need a status update
+            inserted_ids = set(deployment_ids)
+            status_updates: Dict[int, DeploymentStatus] = {}
+            for cluster_id, batch in batches.items():
+                state = states[cluster_id]
+                for entry in batch:
+                    state.enqueue(entry)
+                started_entries, requeued_entries = self._select_from_queue(state)
+                preempted_entries = self._preempt_for_batch(state, batch)
+                _count_preemptions(db, cluster_id, len(requeued_entries) + len(preempted_entries))
+
+                cluster_updates: Dict[int, DeploymentStatus] = {}
+                for entry in started_entries + requeued_entries + preempted_entries + batch:
+                    if entry.id in state.running:
+                        cluster_updates[entry.id] = DeploymentStatus.RUNNING
+                    elif entry.id not in inserted_ids:
+                        cluster_updates[entry.id] = DeploymentStatus.PENDING
+                status_updates.update(cluster_updates)
+                self._record_queue_changes(db, cluster_id, cluster_updates,
+                                           {entry.id for entry in preempted_entries})
+
+            if status_updates:
+                db.execute(update(DeploymentModel), [
+                    {"id": deployment_id, "status": deployment_status}
+                    for deployment_id, deployment_status in status_updates.items()
+                ])
+            for cluster_id, state in states.items():
+                state.copy_capacity_to(clusters[cluster_id])
+
+        return [
+            (deployment_id, DeploymentStatus.RUNNING if deployment_id in states[deployment_in.cluster_id].running
+             else DeploymentStatus.PENDING)
+            for deployment_id, deployment_in in zip(deployment_ids, deployments_in)
+        ]
+
+    @staticmethod
+    def _preemption_candidates(state: ClusterState, entry: DeploymentEntry) -> List[DeploymentEntry]:
+        """
+        Running deployments that may be preempted for the given deployment: those of lower priority.
+        """
+        return [running for running in state.running.values() if running.priority < entry.priority]
+
+    def _preempt_for_batch(self, state: ClusterState, batch: List[DeploymentEntry]) -> List[DeploymentEntry]:
+        """
+        Preempt lower-priority deployments for the batch deployments left waiting, highest priority first.
+        Stops at the first deployment that cannot be placed, so lower priorities never jump ahead of it.
+        Returns the preempted deployments.
+        """
+        preempted_entries: List[DeploymentEntry] = []
+        for entry in sorted(batch, key=lambda entry: (-entry.priority, entry.id)):
+            if entry.id not in state.pending:
+                continue
+            victims = select_victims(entry, state, self._preemption_candidates(state, entry))
+            if victims is None:
+                break
+            if not victims:
+                # It fits but waits behind the head of the queue
+                continue
+            for victim in victims:
+                state.release(victim.id)
+                state.enqueue(victim)
+                preempted_entries.append(victim)
+            state.allocate(entry)
+        return preempted_entries
+
+    @metrics.observe_latency(metrics.STATUS_UPDATE_LATENCY)
+    @retry_on_conflict
+    def update_deployment_status(self, db: Session, deployment: DeploymentModel,
+                                 status_update: DeploymentStatusUpdate) -> DeploymentModel:
+        """
+        Apply a validated status transition and keep the cluster state in sync with it.
+        Completing a deployment releases the deployments that were only waiting for it.
+        """
+        cluster = db.get(Cluster, deployment.cluster_id)
+        # A requeued deployment may still wait for dependencies, whose clusters are locked as well
+        cluster_ids = {cluster.id}
+        if status_update.status == DeploymentStatus.PENDING:
+            cluster_ids |= self.dependency_clusters(db, self._unsatisfied_dependencies(db, deployment.id))
+
+        unblocked_ids: List[int] = []
+        with self._transaction(db, *cluster_ids):
+            state = self.cluster_states.get(db, cluster.id)
+            if self.lock_backend.distributed:
+                # Another worker may have changed the deployment before we got the lock
+                db.refresh(deployment)
+            # Logged before the queue drains that the release triggers, so replays see the same order
+            _record_event(db, _STATUS_EVENTS[status_update.status], cluster.id, deployment.id)
+
+            # Release resources first, so the queue drain can use them
+            self.process_deployment_stopped_running(db, deployment, status_update)
+
+            if deployment.status == DeploymentStatus.PENDING:
+                state.discard(deployment.id)
+                if not self.lock_backend.distributed:
+                    self._after_commit(db, functools.partial(self.dependencies.discard, deployment.id))
+            deployment.status = status_update.status
+
+            if deployment.status == DeploymentStatus.COMPLETED:
+                unblocked_ids = self._complete_dependencies(db, deployment.id)
+            elif deployment.status == DeploymentStatus.PENDING:
+                depends_on_ids = self._unsatisfied_dependencies(db, deployment.id)
+                if depends_on_ids:
+                    self._block(db, deployment.id, cluster.id, depends_on_ids)
+                else:
+                    # Requeued deployments may start right away if the cluster has room for them
+                    state.enqueue(DeploymentEntry.from_model(deployment))
+                    self._drain_queue(db, cluster)
+
+        self._release_dependents(db, unblocked_ids)
+        return deployment
+
+    @retry_on_conflict
     def process_deployment_stopped_running(self, db: Session, deployment: DeploymentModel,
                                            status_uddate: DeploymentStatusUpdate):
         # If the deployment is no longer active, deallocate resources
         if deployment.status == DeploymentStatus.RUNNING:
-            cluster = db.query(Cluster).filter(Cluster.id == deployment.cluster_id).first()
-            # Get a lock for this specific cluster
-            cluster_lock = self._get_cluster_lock(deployment.cluster_id)
+            cluster = db.get(Cluster, deployment.cluster_id)
 
-            # Lock the critical section to ensure thread safety during resource deallocation
-            with cluster_lock:
-                _deallocate_resources(deployment, cluster, db)
-                self.process_cluster_queue(db, cluster)
+            # Lock the critical section to ensure thread safety during resource deallocation,
+            # and commit the release together with the deployments it lets start
+            with self._transaction(db, cluster.id):
+                state = self.cluster_states.get(db, cluster.id)
+                _deallocate_resources(deployment, cluster, state, db)
+                self._drain_queue(db, cluster)
+
+    @contextmanager
+    def deferring_queue_drains(self, db: Session) -> Iterator[Set[int]]:
+        deferred = db.info[_DEFERRED_DRAINS] = set()
+        try:
+            yield deferred
+        finally:
+            db.info.pop(_DEFERRED_DRAINS, None)
+
+    @contextmanager
+    def raising_conflicts(self, db: Session) -> Iterator[None]:
+        db.info[_RAISE_CONFLICTS] = True
+        try:
+            yield
+        finally:
+            db.info.pop(_RAISE_CONFLICTS, None)
+
+    def retry_delay(self, attempt: int) -> Optional[float]:
+        if not self.lock_backend.optimistic or attempt > self.lock_backend.max_retries:
+            return None
+        return self.lock_backend.backoff_delay(attempt)
+
+    def _drain_queue(self, db: Session, cluster: Cluster):
+        """
+        Drain the queue of a cluster that may have room for more deployments, or leave it to the caller if
+        queue drains are deferred on this session.
+        """
+        deferred = db.info.get(_DEFERRED_DRAINS)
+        if deferred is None:
+            self.process_cluster_queue(db, cluster)
+        else:
+            deferred.add(cluster.id)
+
+    def drain_cluster_queue(self, db: Session, cluster_id: int):
+        self.process_cluster_queue(db, db.get(Cluster, cluster_id))
 
+    @metrics.observe_latency(metrics.PROCESS_QUEUE_LATENCY)
+    @retry_on_conflict
     def process_cluster_queue(self, db: Session, cluster: Cluster):
         """
         Process the cluster queue to schedule pending deployments.
         """
-        # Get a lock for this specific cluster
-        cluster_lock = self._get_cluster_lock(cluster.id)
+        with self._transaction(db, cluster.id):
+            state = self.cluster_states.get(db, cluster.id)
 
-        with cluster_lock:
-            # Fetch pending deployments ordered by priority
-            pending_deployments = db.query(DeploymentModel).filter(
-                DeploymentModel.cluster_id == cluster.id,
-                DeploymentModel.status == DeploymentStatus.PENDING
-            ).order_by(DeploymentModel.priority.desc()).all()
+            # Decide which deployments start (or are requeued) using the in-memory state only
+            started_entries, requeued_entries = self._select_from_queue(state)
+            changed_ids = [entry.id for entry in started_entries + requeued_entries]
+            if not changed_ids:
+                return
+            _count_preemptions(db, cluster.id, len(requeued_entries))
 
-            for pending_deployment in pending_deployments:
-                if cluster_has_sufficient_resources(cluster, pending_deployment):
-                    _allocate_resources(pending_deployment, cluster, db)
-                    pending_deployment.status = DeploymentStatus.RUNNING
-                    db.commit()
-                    db.refresh(pending_deployment)
-                else:
-                    break
+            # Persist the decision with a single round trip to load the affected deployments
+            status_updates = {deployment_id: DeploymentStatus.RUNNING if deployment_id in state.running
+                              else DeploymentStatus.PENDING for deployment_id in changed_ids}
+            changed_deployments = db.query(DeploymentModel).filter(DeploymentModel.id.in_(changed_ids)).all()
+            for changed_deployment in changed_deployments:
+                changed_deployment.status = status_updates[changed_deployment.id]
+            state.copy_capacity_to(cluster)
+            self._record_queue_changes(db, cluster.id, status_updates)
+
+    @staticmethod
+    def _record_queue_changes(db: Session, cluster_id: int, status_updates: Dict[int, DeploymentStatus],
+                              preempted_ids: Set[int] = frozenset()):
+        """
+        Log the outcome of a queue drain: the deployments sent back to the queue first, then those started,
+        so that replaying the events pushes them on the queue in the same order as the drain did.
+        """
+        for deployment_id, deployment_status in status_updates.items():
+            if deployment_status == DeploymentStatus.PENDING:
+                _record_event(db, DeploymentEventKind.PREEMPTED if deployment_id in preempted_ids
+                              else DeploymentEventKind.REQUEUED, cluster_id, deployment_id)
+        for deployment_id, deployment_status in status_updates.items():
+            if deployment_status == DeploymentStatus.RUNNING:
+                _record_event(db, DeploymentEventKind.STARTED, cluster_id, deployment_id)
+
+    def _select_from_queue(self, state: ClusterState) -> Tuple[List[DeploymentEntry], List[DeploymentEntry]]:
+        """
+        Strict priority policy: start deployments from the head of the queue while they fit and stop at the
+        first one that does not. Returns the started deployments and the running deployments sent back to
+        the queue (always empty for this policy). Subclasses override this to implement other policies.
+        """
+        started_entries: List[DeploymentEntry] = []
+        while state.pending:
+            pending_entry = state.pending.peek()
+            if not state.has_capacity_for(pending_entry):
+                break
+            state.pending.pop()
+            state.allocate(pending_entry)
+            started_entries.append(pending_entry)
+        return started_entries, []
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import metrics
+from app.schedulers.async_scheduler import AsyncScheduler
+
+logger = logging.getLogger(__name__)
+
+
+async def reconcile_capacity_periodically(scheduler: AsyncScheduler,
+                                          session_factory: "async_sessionmaker[AsyncSession]", interval: float):
+    """
+    Background task correcting the capacity drift of clusters every `interval` seconds.
+
+    Clusters are tracked incrementally: each pass only checks the clusters the scheduler changed since the
+    previous one (every cluster right after startup), so an idle fleet costs nothing and a busy one a single
+    grouped aggregate per pass plus one locked check per drifted cluster. Runs until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        start = time.perf_counter()
+        try:
+            async with session_factory() as db:
+                corrected = await scheduler.reconcile_capacity(db)
+        except Exception:
+            # The clusters the pass did not check are checked by the next one
+            logger.exception("Capacity reconciliation failed")
+            continue
+        metrics.RECONCILE_LATENCY.observe(time.perf_counter() - start)
+        if corrected:
+            logger.warning("Corrected the available capacity of clusters %s", corrected)
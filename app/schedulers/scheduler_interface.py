@@ -1,20 +1,177 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from sqlalchemy.orm import Session
 
 from app.models.cluster import Cluster
-from app.models.deployment import Deployment as DeploymentModel
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.placement import PLACEMENT_ATTEMPTS
 from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
 
 
 class Scheduler(ABC):
+    def hydrate(self, db: Session):
+        """
+        Load any state the scheduler keeps in memory. Called once at application startup.
+        """
+        pass
+
+    @abstractmethod
+    def schedule(self, db: Session, cluster: Cluster, deployment_in: DeploymentCreate,
+                 user_id: Optional[int] = None) -> DeploymentModel:
+        """
+        Schedule a single deployment, checking resources and preemption. `user_id` is the submitting user, if any.
+        """
+        pass
+
+    @abstractmethod
+    def choose_cluster(self, db: Session, organization_id: int,
+                       deployment_in: DeploymentCreate) -> Tuple[Optional[int], bool]:
+        """
+        Choose a cluster of the organization for a deployment that did not name one.
+        Returns the cluster ID, or None if no cluster is large enough, and whether it has room right now.
+        """
+        pass
+
     @abstractmethod
-    def schedule(self, db: Session, cluster: Cluster, deployment_in: DeploymentCreate) -> DeploymentModel:
+    def place(self, db: Session, cluster_id: int, deployment_in: DeploymentCreate,
+              require_capacity: bool = False, user_id: Optional[int] = None) -> Optional[DeploymentModel]:
+        """
+        Schedule a deployment on the cluster returned by `choose_cluster`. With `require_capacity`, returns None
+        instead if the cluster no longer has room once locked, so the caller can choose again.
+        """
+        pass
+
+    def schedule_in_organization(self, db: Session, organization_id: int,
+                                 deployment_in: DeploymentCreate,
+                                 user_id: Optional[int] = None) -> Optional[DeploymentModel]:
+        """
+        Schedule a deployment on the best cluster of the organization, or return None if none is large enough.
+        The choice is made without locks, so it is checked again under the lock of the chosen cluster.
+        """
+        for attempt in range(PLACEMENT_ATTEMPTS):
+            cluster_id, has_room = self.choose_cluster(db, organization_id, deployment_in)
+            if cluster_id is None:
+                return None
+            # The last attempt keeps its choice even if the cluster filled up meanwhile, and queues there
+            deployment = self.place(db, cluster_id, deployment_in, has_room and attempt + 1 < PLACEMENT_ATTEMPTS,
+                                    user_id=user_id)
+            if deployment is not None:
+                return deployment
+
+    @abstractmethod
+    def schedule_batch(self, db: Session, clusters: Dict[int, Cluster], deployments_in: List[DeploymentCreate],
+                       batch_dependencies: Optional[Dict[int, List[int]]] = None,
+                       user_id: Optional[int] = None) -> List[Tuple[int, DeploymentStatus]]:
+        """
+        Schedule many deployments at once in a single transaction. `batch_dependencies` maps positions in the
+        batch to the positions of the deployments of the same batch they depend on.
+        Returns the ID and status of each deployment, in the order they were submitted.
+        """
+        pass
+
+    @abstractmethod
+    def submit(self, db: Session, cluster: Cluster, deployment_in: DeploymentCreate,
+               user_id: Optional[int] = None) -> DeploymentModel:
+        """
+        Persist a new deployment as pending without scheduling it, for a background dispatcher to `admit` it.
+        """
+        pass
+
+    @abstractmethod
+    def admit(self, db: Session, deployment_id: int) -> Optional[DeploymentModel]:
+        """
+        Schedule a deployment persisted by `submit`, as `schedule` does. Admitting a deployment twice is harmless.
+        """
+        pass
+
+    def admission_clusters(self, db: Session, deployment_id: int) -> Set[int]:
+        """
+        Clusters to lock when admitting a submitted deployment, or an empty set if it does not exist.
+        """
+        return set()
+
+    def unadmitted_deployments(self, db: Session) -> Dict[int, List[int]]:
         """
-        Schedule a single deployment, checking resources and preemption.
+        Submitted deployments that were never admitted, by cluster, e.g. because the process stopped before.
+        """
+        return {}
+
+    def queued_clusters(self) -> List[int]:
+        """
+        Clusters with deployments waiting in their queue.
+        """
+        return []
+
+    @contextmanager
+    def deferring_queue_drains(self, db: Session) -> Iterator[Set[int]]:
+        """
+        Within the block, decisions taken with this session leave the cluster queues they would drain as they
+        are, and add the clusters to the yielded set instead, for the caller to drain with `drain_cluster_queue`.
+        """
+        yield set()
+
+    @contextmanager
+    def raising_conflicts(self, db: Session) -> Iterator[None]:
+        """
+        Within the block, decisions taken with this session raise ClusterVersionConflict instead of retrying,
+        for the caller to retry them after `retry_delay`.
+        """
+        yield
+
+    def retry_delay(self, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying a decision for the `attempt`-th time after a cluster version conflict,
+        or None to give up.
+        """
+        return None
+
+    def drain_cluster_queue(self, db: Session, cluster_id: int):
+        """
+        Start the deployments of a cluster queue that fit, as the scheduling policy allows.
         """
         pass
 
+    def dependency_clusters(self, db: Session, deployment_ids: Iterable[int]) -> Set[int]:
+        """
+        Clusters to lock, besides its own, when scheduling a deployment depending on the given deployments.
+        """
+        return set()
+
+    def status_update_clusters(self, db: Session, deployment: DeploymentModel,
+                               status_update: DeploymentStatusUpdate) -> Set[int]:
+        """
+        Clusters to lock when applying a status update to a deployment.
+        """
+        return {deployment.cluster_id}
+
+    def take_dirty_clusters(self) -> Set[int]:
+        """
+        Clusters whose capacity changed since the previous call, for the capacity reconciler.
+        """
+        return set()
+
+    def mark_dirty_clusters(self, cluster_ids: Iterable[int]):
+        """
+        Hand clusters taken with `take_dirty_clusters` back, for the next call, if they could not be checked.
+        """
+        pass
+
+    def drifted_clusters(self, db: Session, cluster_ids: Iterable[int]) -> List[int]:
+        """
+        The given clusters whose available capacity no longer matches their running deployments, checked
+        without locks.
+        """
+        return []
+
+    def reconcile_cluster(self, db: Session, cluster_id: int) -> bool:
+        """
+        Recompute the available capacity of a cluster from its running deployments and correct it if it
+        drifted. Returns whether it was corrected.
+        """
+        return False
+
     @abstractmethod
     def process_deployment_stopped_running(self, db: Session, deployment: DeploymentModel,
                                                  status_update: DeploymentStatusUpdate):
@@ -22,3 +179,11 @@ class Scheduler(ABC):
         process updated deployments to dealloc resources if applicable
         """
         pass
+
+    @abstractmethod
+    def update_deployment_status(self, db: Session, deployment: DeploymentModel,
+                                 status_update: DeploymentStatusUpdate) -> DeploymentModel:
+        """
+        Apply a status transition to a deployment, releasing or queueing resources as needed.
+        """
+        pass
@@ -1,27 +1,55 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
+from app.core.units import CpuQuantity, CpuUnits, GpuQuantity, GpuUnits, RamQuantity, RamUnits
+
 
 class ClusterBase(BaseModel):
     name: str
-    cpu_limit: float = Field(ge=0, description="CPU limit must be a non-negative float")
-    ram_limit: float = Field(ge=0, description="RAM limit must be a non-negative float")
-    gpu_limit: float = Field(ge=0, description="GPU limit must be a non-negative float")
 
 
-class ClusterCreate(ClusterBase):
-    pass
+class ClusterIn(ClusterBase):
+    cpu_limit: CpuQuantity = Field(ge=0, description="CPUs; must be a non-negative number")
+    ram_limit: RamQuantity = Field(ge=0, description="RAM in GB; must be a non-negative number")
+    gpu_limit: GpuQuantity = Field(ge=0, description="GPUs; must be a non-negative number")
+
 
+class ClusterCreate(ClusterIn):
+    fair_share: bool = Field(default=False, description="Share the cluster between users with Dominant Resource "
+                                                        "Fairness under the fair_share scheduling policy")
 
-class ClusterUpdate(ClusterBase):
+
+class ClusterUpdate(ClusterIn):
     pass
 
 
 class Cluster(ClusterBase):
     id: int
     organization_id: int
-    cpu_available: float
-    ram_available: float
-    gpu_available: float
+    cpu_limit: CpuUnits
+    ram_limit: RamUnits
+    gpu_limit: GpuUnits
+    cpu_available: CpuUnits
+    ram_available: RamUnits
+    gpu_available: GpuUnits
+    fair_share: bool = False
 
     class Config:
         from_attributes = True
+
+
+class ClusterListItem(BaseModel):
+    """
+    Cluster returned by listings. Every field is optional, since clients may ask for a subset of them.
+    """
+    id: Optional[int] = None
+    name: Optional[str] = None
+    organization_id: Optional[int] = None
+    cpu_limit: Optional[CpuUnits] = None
+    ram_limit: Optional[RamUnits] = None
+    gpu_limit: Optional[GpuUnits] = None
+    cpu_available: Optional[CpuUnits] = None
+    ram_available: Optional[RamUnits] = None
+    gpu_available: Optional[GpuUnits] = None
+    fair_share: Optional[bool] = None
@@ -1,21 +1,40 @@
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 
+from app.core.units import CpuQuantity, CpuUnits, GpuQuantity, GpuUnits, RamQuantity, RamUnits
 from app.models.deployment import DeploymentStatus
 
 
 class DeploymentBase(BaseModel):
     name: str
     docker_image: str
-    cpu_required: float = Field(ge=0, description="CPU required must be a non-negative float")
-    ram_required: float = Field(ge=0, description="RAM required must be a non-negative float")
-    gpu_required: float = Field(ge=0, description="GPU required must be a non-negative float")
     priority: int = Field(ge=0, description="Priority must be a non-negative integer")
 
 
-class DeploymentCreate(DeploymentBase):
+class DeploymentIn(DeploymentBase):
+    cpu_required: CpuQuantity = Field(ge=0, description="CPUs required; must be a non-negative number")
+    ram_required: RamQuantity = Field(ge=0, description="RAM required in GB; must be a non-negative number")
+    gpu_required: GpuQuantity = Field(ge=0, description="GPUs required; must be a non-negative number")
+
+
+class DeploymentCreate(DeploymentIn):
+    cluster_id: Optional[int] = Field(
+        default=None,
+        description="Cluster to run on. If not set, the best cluster of the user's organization is chosen"
+    )
+    depends_on: List[int] = Field(default_factory=list,
+                                  description="IDs of the deployments that must complete before this one starts")
+
+
+class DeploymentBatchCreate(DeploymentCreate):
     cluster_id: int
+    depends_on_index: List[int] = Field(
+        default_factory=list,
+        description="Positions in the batch of the deployments that must complete before this one starts"
+    )
 
-class DeploymentUpdate(DeploymentBase):
+class DeploymentUpdate(DeploymentIn):
     pass
 
 class DeploymentStatusUpdate(BaseModel):
@@ -24,8 +43,33 @@ class DeploymentStatusUpdate(BaseModel):
 
 class Deployment(DeploymentBase):
     id: int
+    cpu_required: CpuUnits
+    ram_required: RamUnits
+    gpu_required: GpuUnits
     cluster_id: int
     status: DeploymentStatus
 
     class Config:
         from_attributes = True
+
+
+class DeploymentListItem(BaseModel):
+    """
+    Deployment returned by listings. Every field is optional, since clients may ask for a subset of them.
+    """
+    id: Optional[int] = None
+    name: Optional[str] = None
+    docker_image: Optional[str] = None
+    cpu_required: Optional[CpuUnits] = None
+    ram_required: Optional[RamUnits] = None
+    gpu_required: Optional[GpuUnits] = None
+    priority: Optional[int] = None
+    cluster_id: Optional[int] = None
+    status: Optional[DeploymentStatus] = None
+
+
+class DeploymentBatchResult(BaseModel):
+    index: int = Field(description="Position of the deployment in the submitted batch")
+    deployment_id: Optional[int] = None
+    status: Optional[DeploymentStatus] = Field(default=None, description="Not set if the deployment was rejected")
+    reason: Optional[str] = None
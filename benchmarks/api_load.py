@@ -0,0 +1,87 @@
+"""
+API load benchmark.
+
+Seeds a user, an organization and a cluster through the API of a running server, then keeps a number of
+concurrent clients busy for a fixed time with a mix of cluster listings and deployment creations.
+Reports requests per second and latency percentiles, to compare builds or settings of the same API.
+
+Start the server with a rate limit that does not get in the way, e.g.:
+    RATE_LIMIT_DEFAULT=1000000/minute uvicorn app.main:app --workers 1
+    python -m benchmarks.api_load --url http://localhost:8000 --concurrency 1 10 100
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+PASSWORD = "Benchmark1!"
+
+
+async def seed(client: httpx.AsyncClient) -> int:
+    """
+    Register and log in a fresh user owning an organization with a large cluster. Returns the cluster ID.
+    """
+    username = f"bench_{uuid.uuid4().hex[:12]}"
+    response = await client.post("/api/v1/auth/register",
+                                 json={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+    response.raise_for_status()
+    response = await client.post("/api/v1/auth/login", json={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    response = await client.post("/api/v1/organizations/", json={"name": username})
+    response.raise_for_status()
+    response = await client.post("/api/v1/clusters/", json={"name": username, "cpu_limit": 1e6, "ram_limit": 1e6,
+                                                            "gpu_limit": 0})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def run_client(client: httpx.AsyncClient, cluster_id: int, deadline: float, latencies: list, errors: list):
+    deployment = {"name": "benchmark", "docker_image": "benchmark", "cpu_required": 1, "ram_required": 1,
+                  "gpu_required": 0, "priority": 1, "cluster_id": cluster_id}
+    request_number = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if request_number % 2:
+            response = await client.post("/api/v1/deployments/", json=deployment)
+        else:
+            response = await client.get("/api/v1/clusters/")
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+        request_number += 1
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(url: str, concurrency: int, duration: float):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        cluster_id = await seed(client)
+        latencies, errors = [], []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(run_client(client, cluster_id, deadline, latencies, errors)
+                               for _ in range(concurrency)))
+
+    latencies.sort()
+    print(f"{concurrency:>4} clients | {len(latencies) / duration:>8.1f} req/s"
+          f" | p50 {percentile(latencies, 0.5) * 1000:>7.1f} ms | p99 {percentile(latencies, 0.99) * 1000:>7.1f} ms"
+          f" | {len(errors)} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds each level of concurrency runs")
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        asyncio.run(run(args.url, concurrency, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Completion storm benchmark.
+
+Fills a cluster with N running deployments and as many queued ones, then completes every running deployment
+at once through the AsyncScheduler, with the same concurrency either way: once where each completion drains
+the queue in the transaction of its release, and once where the drains of concurrent completions are
+coalesced. Reports the wall time of each and how many queue drain passes ran.
+
+Usage:
+    python -m benchmarks.completion_storm --running 500 --policy backfill --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.factory import create_scheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+COMPLETED = DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+
+
+class UncoalescedAsyncScheduler(AsyncScheduler):
+    """
+    Drains the queue in every status update, whatever the other updates in progress.
+    """
+
+    def _defers_drains(self, cluster_id: int) -> bool:
+        return False
+
+
+def count_drains(scheduler):
+    """
+    Count the queue drain passes of the scheduler.
+    """
+    passes = []
+    process_cluster_queue = scheduler.process_cluster_queue
+
+    def counted(db, cluster):
+        passes.append(cluster.id)
+        return process_cluster_queue(db, cluster)
+
+    scheduler.process_cluster_queue = counted
+    return passes
+
+
+def fill_cluster(path: str, policy: str, running: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    scheduler = create_scheduler(policy, "local")
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+        cluster = Cluster(name="benchmark", cpu_limit=cpu_units(running), ram_limit=ram_units(running), gpu_limit=0,
+                          cpu_available=cpu_units(running), ram_available=ram_units(running), gpu_available=0)
+        db.add(cluster)
+        db.commit()
+        scheduler.schedule_batch(db, {cluster.id: cluster}, [
+            DeploymentCreate(name=f"deployment-{index}", docker_image="benchmark", cpu_required=1, ram_required=1,
+                             gpu_required=0, priority=index % 10, cluster_id=cluster.id)
+            for index in range(2 * running)
+        ])
+    engine.dispose()
+
+
+async def complete_concurrently(path: str, scheduler: AsyncScheduler, concurrency: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 60},
+                                 pool_size=concurrency, max_overflow=0)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with session_factory() as db:
+        await db.run_sync(scheduler.scheduler.hydrate)
+        running = await db.run_sync(lambda session: [deployment.id for deployment in session.query(DeploymentModel)
+                                    .filter(DeploymentModel.status == DeploymentStatus.RUNNING)])
+    passes = count_drains(scheduler.scheduler)
+    requests = asyncio.Semaphore(concurrency)
+
+    async def complete(deployment_id: int):
+        async with requests, session_factory() as db:
+            await scheduler.update_deployment_status(db, await db.get(DeploymentModel, deployment_id), COMPLETED)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(complete(deployment_id) for deployment_id in running))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed, len(passes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--running", type=int, default=500, help="Deployments completing at once")
+    parser.add_argument("--policy", default="priority")
+    parser.add_argument("--concurrency", type=int, default=50, help="Completion requests in progress at once")
+    parser.add_argument("--debounce", type=float, default=0.0, help="Seconds a coalesced drain waits")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.db")
+        for name, scheduler in (
+            ("drain per completion", UncoalescedAsyncScheduler(create_scheduler(args.policy, "local"))),
+            ("coalesced drains", AsyncScheduler(create_scheduler(args.policy, "local"), args.debounce)),
+        ):
+            fill_cluster(path, args.policy, args.running)
+            results[name] = asyncio.run(complete_concurrently(path, scheduler, args.concurrency))
+
+    print(f"{args.running} completions, {args.policy} policy, {args.concurrency} at once")
+    for name, (elapsed, passes) in results.items():
+        print(f"{name + ':':<22}{elapsed * 1000:>8.1f} ms, {passes} drain passes")
+
+
+if __name__ == "__main__":
+    main()
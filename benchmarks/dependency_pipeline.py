@@ -0,0 +1,72 @@
+"""
+Dependency pipeline benchmark.
+
+Submits a pipeline of N deployments as a single batch, where every stage depends on the previous one and on
+the first stage (so the first stage has N-1 dependents), then completes the stages one by one. Reports the
+time to admit the pipeline and the average time per completion, including the release of the next stage.
+With the incremental ready-set both should stay flat per deployment as the pipeline grows.
+
+Usage:
+    python -m benchmarks.dependency_pipeline --sizes 1000 10000
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.factory import create_scheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+def run(database_url: str, size: int):
+    engine = create_engine(database_url, poolclass=StaticPool)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    scheduler = create_scheduler("priority", "local")
+    completed = DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+        cluster = Cluster(name="benchmark", cpu_limit=cpu_units(1), ram_limit=ram_units(1), gpu_limit=0,
+                          cpu_available=cpu_units(1), ram_available=ram_units(1), gpu_available=0)
+        db.add(cluster)
+        db.commit()
+
+        deployments_in = [DeploymentCreate(name=f"stage-{index}", docker_image="benchmark", cpu_required=1,
+                                           ram_required=1, gpu_required=0, priority=1, cluster_id=cluster.id)
+                          for index in range(size)]
+        batch_dependencies = {index: sorted({0, index - 1}) for index in range(1, size)}
+
+        start = time.perf_counter()
+        placements = scheduler.schedule_batch(db, {cluster.id: cluster}, deployments_in, batch_dependencies)
+        admission = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for deployment_id, _ in placements:
+            deployment = db.get(DeploymentModel, deployment_id)
+            assert deployment.status == DeploymentStatus.RUNNING, "stages must run one after the other"
+            scheduler.update_deployment_status(db, deployment, completed)
+        advancement = time.perf_counter() - start
+
+    engine.dispose()
+    print(f"{size:>7} deployments | admitted in {admission * 1000:>8.1f} ms ({admission / size * 1e6:>6.1f} us each)"
+          f" | {advancement / size * 1000:>6.2f} ms per completion")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(args.database_url, size)
+
+
+if __name__ == "__main__":
+    main()
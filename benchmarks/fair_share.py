@@ -0,0 +1,58 @@
+"""
+Fair share benchmark: strict priority versus Dominant Resource Fairness on a synthetic multi-tenant trace.
+
+One cluster is shared by a "heavy" tenant that submits a large burst of long, high priority CPU deployments
+at once, a GPU tenant and a few "light" tenants submitting small low priority deployments over time. The trace
+is replayed with `benchmarks.simulation` against each policy. For each tenant the benchmark reports the mean
+and 95th percentile wait before first starting, the mean slowdown ((wait + runtime) / runtime) and the
+tenant's time-averaged dominant share of the cluster, then Jain's fairness index over the tenants' slowdowns
+(1 is perfectly fair), the preemptions and the scheduling decisions per second.
+
+Usage:
+    python -m benchmarks.fair_share --heavy 200 --light-tenants 3 --horizon 400
+"""
+import argparse
+import random
+from typing import List
+
+from app.schedulers.factory import create_scheduler
+from benchmarks.simulation import ClusterSpec, Simulator, TraceJob
+
+CLUSTER = ClusterSpec(cpu=32, ram=128, gpu=4, fair_share=True)
+
+
+def make_trace(heavy: int, light_tenants: int, horizon: float, rng: random.Random) -> List[TraceJob]:
+    trace = [TraceJob(0.0, rng.uniform(20, 40), 10, 4, 8, 0, "heavy", 0) for _ in range(heavy)]
+    arrival = 0.0
+    while True:
+        arrival += rng.expovariate(1 / 8)
+        if arrival > horizon:
+            break
+        trace.append(TraceJob(arrival, rng.uniform(10, 20), 5, 1, 8, 1, "gpu", 0))
+    for index in range(light_tenants):
+        arrival = 0.0
+        while True:
+            arrival += rng.expovariate(1 / 4)
+            if arrival > horizon:
+                break
+            trace.append(TraceJob(arrival, rng.uniform(2, 6), 1, 2, 4, 0, f"light-{index}", 0))
+    return sorted(trace, key=lambda job: job.arrival)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--heavy", type=int, default=200, help="Deployments of the heavy tenant, all submitted at once")
+    parser.add_argument("--light-tenants", type=int, default=3)
+    parser.add_argument("--horizon", type=float, default=400, help="Simulated time over which the others submit")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    trace = make_trace(args.heavy, args.light_tenants, args.horizon, random.Random(args.seed))
+    for policy in ("priority", "fair_share"):
+        report = Simulator(create_scheduler(policy, "local"), [CLUSTER], args.database_url).run(trace)
+        report.print_summary(policy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Cluster lock contention benchmark.
+
+Starts N worker processes, each with its own engine and scheduler, that repeatedly schedule a deployment
+and complete it again, either all on the same cluster or each on its own cluster. Reports the number of
+scheduling decisions per second and checks that no cluster ended up overcommitted, i.e. that its available
+capacity matches its limit minus the resources of its running deployments.
+
+Usage:
+    python -m benchmarks.lock_contention --database-url postgresql://... --backend postgres_advisory --workers 8
+"""
+import argparse
+import multiprocessing
+import time
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.models.organization_member import OrganizationMember  # noqa
+from app.schedulers.factory import create_scheduler
+from app.schedulers.locking import LOCK_BACKENDS
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+CLUSTER_CPU = cpu_units(8)
+CLUSTER_RAM = ram_units(8)
+
+
+def create_engine_for(database_url: str):
+    connect_args = {"timeout": 30} if database_url.startswith("sqlite") else {}
+    return create_engine(database_url, connect_args=connect_args)
+
+
+def setup_clusters(database_url: str, cluster_count: int):
+    engine = create_engine_for(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        clusters = [Cluster(name=f"benchmark-{index}", cpu_limit=CLUSTER_CPU, ram_limit=CLUSTER_RAM,
+                            gpu_limit=0, cpu_available=CLUSTER_CPU, ram_available=CLUSTER_RAM, gpu_available=0)
+                    for index in range(cluster_count)]
+        db.add_all(clusters)
+        db.commit()
+        cluster_ids = [cluster.id for cluster in clusters]
+    engine.dispose()
+    return cluster_ids
+
+
+def worker(database_url: str, backend: str, cluster_id: int, duration: float, results):
+    engine = create_engine_for(database_url)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    scheduler = create_scheduler("priority", backend)
+    completed = DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+    deployment_in = DeploymentCreate(name="benchmark", docker_image="benchmark", cpu_required=1, ram_required=1,
+                                     gpu_required=0, priority=1, cluster_id=cluster_id)
+
+    decisions = errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        with session_factory() as db:
+            try:
+                cluster = db.get(Cluster, cluster_id)
+                deployment = scheduler.schedule(db, cluster, deployment_in)
+                if deployment.status == DeploymentStatus.RUNNING:
+                    scheduler.update_deployment_status(db, deployment, completed)
+                decisions += 2
+            except Exception:
+                errors += 1
+    results.put((decisions, errors))
+    engine.dispose()
+
+
+def check_capacity(database_url: str, cluster_ids):
+    """
+    Return the clusters whose available CPU does not match their running deployments.
+    """
+    engine = create_engine_for(database_url)
+    inconsistent = []
+    with sessionmaker(bind=engine)() as db:
+        for cluster in db.query(Cluster).filter(Cluster.id.in_(cluster_ids)).all():
+            running_cpu = db.query(func.coalesce(func.sum(DeploymentModel.cpu_required), 0)).filter(
+                DeploymentModel.cluster_id == cluster.id,
+                DeploymentModel.status == DeploymentStatus.RUNNING
+            ).scalar()
+            if abs(cluster.cpu_limit - cluster.cpu_available - running_cpu) > 1e-6 or cluster.cpu_available < 0:
+                inconsistent.append((cluster.id, cluster.cpu_available, running_cpu))
+    engine.dispose()
+    return inconsistent
+
+
+def run(database_url: str, backend: str, workers: int, duration: float, shared_cluster: bool):
+    cluster_ids = setup_clusters(database_url, 1 if shared_cluster else workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(database_url, backend, cluster_ids[index % len(cluster_ids)],
+                                                     duration, results))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    decisions = sum(outcome[0] for outcome in outcomes)
+    errors = sum(outcome[1] for outcome in outcomes)
+    inconsistent = check_capacity(database_url, cluster_ids)
+    scenario = "same cluster" if shared_cluster else "different clusters"
+    print(f"{backend:>18} | {workers:>2} workers | {scenario:>18} | {decisions / duration:>9.1f} decisions/s"
+          f" | {errors:>4} errors | {len(inconsistent)} inconsistent clusters")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./benchmark.db")
+    parser.add_argument("--backend", default="local", choices=sorted(LOCK_BACKENDS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds each scenario runs")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        for shared_cluster in (True, False):
+            run(args.database_url, args.backend, workers, args.duration, shared_cluster)
+
+
+if __name__ == "__main__":
+    main()
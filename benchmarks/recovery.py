@@ -0,0 +1,77 @@
+"""
+Startup recovery benchmark.
+
+Fills a cluster with N active deployments (a few running, the rest queued) through the scheduler, then starts
+and completes deployments one at a time, so the event log grows past several snapshots. Reports how long a
+fresh scheduler takes to rebuild the cluster state by loading every active deployment (`hydrate`) and from the
+latest snapshot plus the tail of the event log (`recover`), and how many events were replayed. The replayed
+tail never exceeds the snapshot interval, however long the log.
+
+Usage:
+    python -m benchmarks.recovery --active 10000 --completions 5000 --snapshot-interval 1000
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.cluster_state import ClusterStateStore
+from app.schedulers.factory import create_scheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--active", type=int, default=10000, help="Deployments running or queued at the end")
+    parser.add_argument("--completions", type=int, default=5000, help="Deployments completed one at a time")
+    parser.add_argument("--snapshot-interval", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, poolclass=StaticPool)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    scheduler = create_scheduler("priority", "local", snapshot_interval=args.snapshot_interval)
+    completed = DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+        cluster = Cluster(name="benchmark", cpu_limit=cpu_units(64), ram_limit=ram_units(256), gpu_limit=0,
+                          cpu_available=cpu_units(64), ram_available=ram_units(256), gpu_available=0)
+        db.add(cluster)
+        db.commit()
+
+        scheduler.schedule_batch(db, {cluster.id: cluster}, [
+            DeploymentCreate(name=f"deployment-{index}", docker_image="benchmark", cpu_required=1, ram_required=1,
+                             gpu_required=0, priority=index % 10, cluster_id=cluster.id)
+            for index in range(args.active + args.completions)
+        ])
+        for _ in range(args.completions):
+            deployment = db.query(DeploymentModel).filter(DeploymentModel.status == DeploymentStatus.RUNNING).first()
+            scheduler.update_deployment_status(db, deployment, completed)
+
+        start = time.perf_counter()
+        ClusterStateStore().hydrate(db)
+        hydrate = time.perf_counter() - start
+
+        recovered = create_scheduler("priority", "local", snapshot_interval=args.snapshot_interval)
+        start = time.perf_counter()
+        recovered.hydrate(db)
+        recover = time.perf_counter() - start
+
+        assert recovered.cluster_states.get(db, cluster.id).running.keys() == \
+            scheduler.cluster_states.get(db, cluster.id).running.keys()
+        print(f"{args.active} active deployments, snapshot every {args.snapshot_interval} events")
+        print(f"hydrate from deployments: {hydrate * 1000:>8.1f} ms")
+        print(f"recover from snapshot:    {recover * 1000:>8.1f} ms "
+              f"({recovered.events_since_snapshot[cluster.id]} events replayed)")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
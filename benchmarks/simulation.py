@@ -0,0 +1,377 @@
+"""
+Discrete-event simulation of a scheduler replaying a trace of deployments.
+
+A trace lists deployments with their arrival time, runtime, priority, resource shape, tenant (the user
+submitting them) and optionally the cluster they target; deployments without a cluster are placed on a
+cluster of the organization. `Simulator` replays it in simulated time against any `Scheduler`, on a fresh
+in-memory SQLite database: arrivals are scheduled, deployments are completed once they have run for their
+runtime, and a preempted deployment starts over when it runs again. Which deployments run is read back from
+the database after each decision, so the simulation only relies on the `Scheduler` interface.
+
+Events at the same time are processed in trace order, completions first, so a replay is deterministic: the
+same trace and scheduler always make the same decisions. Only the decisions per second depend on the machine.
+
+Traces are read from and written to JSON lines or CSV files (see `load_trace` and `save_trace`), with the
+fields of `TraceJob`. See `benchmarks.trace_replay` for the command line.
+"""
+import csv
+import heapq
+import json
+import random
+import statistics
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.units import cpu_units, gpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.models.organization import Organization
+from app.models.user import User
+from app.schedulers.scheduler_interface import Scheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+# Kinds of events, in the order they are processed at the same simulated time
+_COMPLETION, _ARRIVAL = 0, 1
+
+
+@dataclass
+class TraceJob:
+    arrival: float
+    duration: float
+    priority: int
+    cpu: float
+    ram: float
+    gpu: float
+    tenant: str = "default"
+    # Position of the targeted cluster in the simulated clusters, or None to let the scheduler place it
+    cluster: Optional[int] = None
+
+
+@dataclass
+class ClusterSpec:
+    cpu: float
+    ram: float
+    gpu: float
+    fair_share: bool = False
+
+
+@dataclass
+class TenantStats:
+    deployments: int = 0
+    waits: List[float] = field(default_factory=list)
+    slowdowns: List[float] = field(default_factory=list)
+    # Integral over simulated time of the tenant's dominant share of the total capacity
+    share_time: float = 0.0
+
+
+@dataclass
+class SimulationReport:
+    deployments: int
+    # Deployments no cluster could ever hold (only when placed by the scheduler) and deployments still
+    # pending or running once no more events were left
+    rejected: int
+    unfinished: int
+    decisions: int
+    decision_seconds: float
+    preemptions: int
+    makespan: float
+    # Time-averaged fraction of the total CPU, RAM and GPU in use
+    utilization: Tuple[float, float, float]
+    # Time from arrival to first start of each deployment that started
+    waits: List[float]
+    tenants: Dict[str, TenantStats]
+
+    @property
+    def decisions_per_second(self) -> float:
+        return self.decisions / self.decision_seconds if self.decision_seconds else 0.0
+
+    def wait_percentile(self, percentile: float) -> float:
+        return percentile_of(self.waits, percentile)
+
+    def jain_index(self) -> float:
+        """
+        Jain's fairness index over the inverse of the tenants' mean slowdowns: 1 when every tenant is slowed
+        down alike, 1/n when a single tenant gets all the service.
+        """
+        values = [1 / statistics.fmean(stats.slowdowns) for stats in self.tenants.values() if stats.slowdowns]
+        if not values:
+            return 1.0
+        return sum(values) ** 2 / (len(values) * sum(value * value for value in values))
+
+    def print_summary(self, title: str, per_tenant: bool = True):
+        print(f"--- {title}: {self.deployments} deployments ({self.rejected} rejected, {self.unfinished} unfinished),"
+              f" {self.decisions_per_second:,.0f} decisions/s, {self.preemptions} preemptions,"
+              f" makespan {self.makespan:.0f}")
+        cpu, ram, gpu = self.utilization
+        print(f"utilization cpu {cpu:.2f} ram {ram:.2f} gpu {gpu:.2f} | wait p50 {self.wait_percentile(50):.1f}"
+              f" p95 {self.wait_percentile(95):.1f} p99 {self.wait_percentile(99):.1f}"
+              f" | Jain's index over slowdowns {self.jain_index():.3f}")
+        if not per_tenant:
+            return
+        for tenant, stats in sorted(self.tenants.items()):
+            mean_wait = statistics.fmean(stats.waits) if stats.waits else 0.0
+            mean_slowdown = statistics.fmean(stats.slowdowns) if stats.slowdowns else 0.0
+            share = stats.share_time / self.makespan if self.makespan else 0.0
+            print(f"{tenant:>10} | {stats.deployments:>5} deployments | wait mean {mean_wait:>7.1f}"
+                  f" p95 {percentile_of(stats.waits, 95):>7.1f} | slowdown {mean_slowdown:>6.2f}"
+                  f" | dominant share {share:>5.2f}")
+
+
+def percentile_of(values: Sequence[float], percentile: float) -> float:
+    """
+    Nearest-rank percentile, 0 for no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))]
+
+
+def synthetic_trace(count: int, rng: random.Random, tenants: int = 4, mean_interarrival: float = 1.0,
+                    clusters: Optional[int] = None) -> List[TraceJob]:
+    """
+    Poisson arrivals of deployments with exponential runtimes, priorities from 0 to 10 and a mix of small,
+    large and GPU resource shapes. With `clusters`, each deployment targets a random one of them; otherwise
+    the scheduler places them.
+    """
+    shapes = [(1, 2, 0), (2, 4, 0), (4, 16, 0), (8, 32, 0), (2, 8, 1), (4, 16, 2)]
+    trace = []
+    arrival = 0.0
+    for _ in range(count):
+        arrival += rng.expovariate(1 / mean_interarrival)
+        cpu, ram, gpu = rng.choice(shapes)
+        trace.append(TraceJob(arrival=round(arrival, 3), duration=round(rng.expovariate(1 / 20) + 1, 3),
+                              priority=rng.randint(0, 10), cpu=cpu, ram=ram, gpu=gpu,
+                              tenant=f"tenant-{rng.randrange(tenants)}",
+                              cluster=rng.randrange(clusters) if clusters else None))
+    return trace
+
+
+def load_trace(path: str) -> List[TraceJob]:
+    """
+    Read a trace from a CSV file (with a header row) or a JSON lines file, one deployment per row.
+    """
+    with open(path, newline="") as trace_file:
+        if path.endswith(".csv"):
+            rows = [{name: value for name, value in row.items() if value != ""} for row in csv.DictReader(trace_file)]
+        else:
+            rows = [json.loads(line) for line in trace_file if line.strip()]
+    types = {trace_field.name: trace_field.type for trace_field in fields(TraceJob)}
+    return [TraceJob(**{name: _parse(types[name], value) for name, value in row.items()}) for row in rows]
+
+
+def save_trace(path: str, trace: Sequence[TraceJob]):
+    with open(path, "w", newline="") as trace_file:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(trace_file, fieldnames=[trace_field.name for trace_field in fields(TraceJob)])
+            writer.writeheader()
+            writer.writerows(asdict(job) for job in trace)
+        else:
+            for job in trace:
+                trace_file.write(json.dumps(asdict(job)) + "\n")
+
+
+def _parse(annotation, value):
+    if value is None or annotation is str:
+        return value
+    if annotation in (int, Optional[int]):
+        return int(value)
+    return float(value)
+
+
+class Simulator:
+    """
+    Replays traces against a scheduler over the given clusters, all of a single organization.
+    The scheduler should be fresh, since each run starts from an empty database.
+    """
+
+    def __init__(self, scheduler: Scheduler, clusters: Sequence[ClusterSpec], database_url: str = "sqlite://"):
+        self.scheduler = scheduler
+        self.clusters = list(clusters)
+        self.database_url = database_url
+
+    def run(self, trace: Sequence[TraceJob]) -> SimulationReport:
+        engine = create_engine(self.database_url, poolclass=StaticPool)
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        try:
+            with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+                return _Run(self.scheduler, self.clusters, trace, db).replay()
+        finally:
+            engine.dispose()
+
+
+class _Run:
+    def __init__(self, scheduler: Scheduler, specs: List[ClusterSpec], trace: Sequence[TraceJob], db: Session):
+        self.scheduler = scheduler
+        self.trace = trace
+        self.db = db
+
+        organization = Organization(name="simulation", invite_code="simulation")
+        db.add(organization)
+        db.flush()
+        self.clusters = []
+        for index, spec in enumerate(specs):
+            cpu, ram, gpu = cpu_units(spec.cpu), ram_units(spec.ram), gpu_units(spec.gpu)
+            self.clusters.append(Cluster(name=f"cluster-{index}", organization_id=organization.id, cpu_limit=cpu,
+                                         ram_limit=ram, gpu_limit=gpu, cpu_available=cpu, ram_available=ram,
+                                         gpu_available=gpu, fair_share=spec.fair_share))
+        tenants = sorted({job.tenant for job in trace})
+        self.users = {tenant: User(username=tenant, email=f"{tenant}@simulation", hashed_password="")
+                      for tenant in tenants}
+        db.add_all([*self.clusters, *self.users.values()])
+        db.commit()
+        self.organization_id = organization.id
+        self.capacity = tuple(sum(getattr(spec, resource) for spec in specs) for resource in ("cpu", "ram", "gpu"))
+        self.inverse_capacity = tuple(1 / total if total else 0.0 for total in self.capacity)
+
+        self.tenants = {tenant: TenantStats() for tenant in tenants}
+        # Deployment ID <-> position of its job in the trace
+        self.deployment_jobs: Dict[int, int] = {}
+        self.job_deployments: Dict[int, int] = {}
+        # Running deployments per cluster, and the run each completion event belongs to
+        self.running: Dict[int, Set[int]] = {cluster.id: set() for cluster in self.clusters}
+        self.runs: Dict[int, int] = {}
+        self.started: Dict[int, float] = {}
+        self.finished: Dict[int, float] = {}
+        # Resources in use, in total and per tenant
+        self.used = [0.0, 0.0, 0.0]
+        self.tenant_used = {tenant: [0.0, 0.0, 0.0] for tenant in tenants}
+        self.events: List[Tuple[float, int, int, int, int]] = []
+        self.sequence = 0
+        self.decisions = 0
+        self.decision_seconds = 0.0
+        self.preemptions = 0
+        self.rejected = 0
+        self.now = 0.0
+        self.usage_time = [0.0, 0.0, 0.0]
+
+    def replay(self) -> SimulationReport:
+        for index, job in enumerate(self.trace):
+            self._push(job.arrival, _ARRIVAL, index, 0)
+        completed = DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+
+        while self.events:
+            at, _, _, index, run = heapq.heappop(self.events)
+            self._advance(at)
+            job = self.trace[index]
+            if run == 0:
+                deployment = self._decide(self._arrive, job)
+                if deployment is None:
+                    self.rejected += 1
+                    continue
+                self.deployment_jobs[deployment.id] = index
+                self.job_deployments[index] = deployment.id
+                self.tenants[job.tenant].deployments += 1
+                cluster_id = deployment.cluster_id
+            else:
+                deployment_id = self.job_deployments[index]
+                deployment = self.db.get(DeploymentModel, deployment_id)
+                if self.runs.get(deployment_id) != run or deployment.status != DeploymentStatus.RUNNING:
+                    # The run this completion belongs to was preempted
+                    continue
+                self._decide(self.scheduler.update_deployment_status, self.db, deployment, completed)
+                self.finished[deployment_id] = self.now
+                self._stop(deployment_id)
+                self.running[deployment.cluster_id].discard(deployment_id)
+                cluster_id = deployment.cluster_id
+            self._observe(cluster_id)
+
+        return self._report()
+
+    def _arrive(self, job: TraceJob) -> Optional[DeploymentModel]:
+        deployment_in = DeploymentCreate(
+            name=job.tenant, docker_image="simulation", cpu_required=job.cpu, ram_required=job.ram,
+            gpu_required=job.gpu, priority=job.priority,
+            cluster_id=self.clusters[job.cluster].id if job.cluster is not None else None,
+        )
+        user_id = self.users[job.tenant].id
+        if job.cluster is None:
+            return self.scheduler.schedule_in_organization(self.db, self.organization_id, deployment_in,
+                                                           user_id=user_id)
+        return self.scheduler.schedule(self.db, self.clusters[job.cluster], deployment_in, user_id=user_id)
+
+    def _decide(self, decision, *args):
+        start = time.perf_counter()
+        result = decision(*args)
+        self.decision_seconds += time.perf_counter() - start
+        self.decisions += 1
+        return result
+
+    def _observe(self, cluster_id: int):
+        """
+        Compare the running deployments of the cluster with the previous decision's: those gone without
+        completing were preempted, the new ones start a run and get their completion event.
+        """
+        running = set(self.db.scalars(select(DeploymentModel.id).where(
+            DeploymentModel.cluster_id == cluster_id, DeploymentModel.status == DeploymentStatus.RUNNING
+        )))
+        previous = self.running[cluster_id]
+        for deployment_id in previous - running:
+            self.preemptions += 1
+            self._stop(deployment_id)
+        for deployment_id in sorted(running - previous):
+            index = self.deployment_jobs[deployment_id]
+            job = self.trace[index]
+            self.started.setdefault(deployment_id, self.now)
+            self.runs[deployment_id] = self.runs.get(deployment_id, 0) + 1
+            self._push(self.now + job.duration, _COMPLETION, index, self.runs[deployment_id])
+            self._account(job, 1)
+        self.running[cluster_id] = running
+
+    def _stop(self, deployment_id: int):
+        self._account(self.trace[self.deployment_jobs[deployment_id]], -1)
+
+    def _account(self, job: TraceJob, sign: int):
+        for used in (self.used, self.tenant_used[job.tenant]):
+            used[0] += sign * job.cpu
+            used[1] += sign * job.ram
+            used[2] += sign * job.gpu
+
+    def _advance(self, at: float):
+        elapsed = at - self.now
+        if elapsed > 0:
+            for resource in range(3):
+                self.usage_time[resource] += elapsed * self.used[resource]
+            for tenant, used in self.tenant_used.items():
+                self.tenants[tenant].share_time += elapsed * max(
+                    amount * inverse for amount, inverse in zip(used, self.inverse_capacity)
+                )
+        self.now = at
+
+    def _push(self, at: float, kind: int, index: int, run: int):
+        heapq.heappush(self.events, (at, kind, self.sequence, index, run))
+        self.sequence += 1
+
+    def _report(self) -> SimulationReport:
+        waits = []
+        for deployment_id, index in self.deployment_jobs.items():
+            job = self.trace[index]
+            stats = self.tenants[job.tenant]
+            if deployment_id in self.started:
+                wait = self.started[deployment_id] - job.arrival
+                waits.append(wait)
+                stats.waits.append(wait)
+            if deployment_id in self.finished:
+                stats.slowdowns.append((self.finished[deployment_id] - job.arrival) / job.duration)
+        return SimulationReport(
+            deployments=len(self.trace),
+            rejected=self.rejected,
+            unfinished=len(self.deployment_jobs) - len(self.finished),
+            decisions=self.decisions,
+            decision_seconds=self.decision_seconds,
+            preemptions=self.preemptions,
+            makespan=self.now,
+            utilization=tuple(
+                usage * inverse / self.now if self.now else 0.0
+                for usage, inverse in zip(self.usage_time, self.inverse_capacity)
+            ),
+            waits=waits,
+            tenants=self.tenants,
+        )
@@ -6,21 +6,29 @@ import pytest
 from fastapi.testclient import TestClient
 from httpx import Cookies
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
-from app.core.deps import get_db
+from app.core.deps import get_db, get_scheduler, get_session_factory
+from app.core.principal import principal_cache
 from app.core.security import get_password_hash
+from app.core.units import cpu_units, gpu_units, ram_units
 from app.db.base import Base
 from app.main import app
 from app.models.cluster import Cluster as ClusterModel
 from app.models.organization import Organization as OrganizationModel
 from app.models.organization_member import OrganizationMember
 from app.models.user import User as UserModel
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
 
 # Database setup for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The API uses an AsyncSession on the same database, through aiosqlite
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 # Test User Data
 TEST_USER_NAME = "testuser"
@@ -128,8 +136,9 @@ def create_org(db, org_name):
 
 def create_cluster(db, organization_id: int, name: str, cpu: float, ram: float, gpu: float) -> ClusterModel:
     """
-    Helper function to create a cluster in the database.
+    Helper function to create a cluster in the database, from decimal CPUs, GB of RAM and GPUs.
     """
+    cpu, ram, gpu = cpu_units(cpu), ram_units(ram), gpu_units(gpu)
     cluster = ClusterModel(
         name=name,
         cpu_limit=cpu,
@@ -172,19 +181,21 @@ def setup_database():
 @pytest.fixture(scope="function", autouse=True)
 def db() -> Generator:
     """
-    Fixture to setup and tear down a transaction for each test.
+    Fixture to provide a session for each test and empty every table afterward.
     Automatically applied to all tests.
+
+    The API commits through its own asyncio connections, so the data has to be committed to be seen
+    on both sides and cannot be rolled back with a surrounding transaction.
     """
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    session = TestingSessionLocal()
 
     try:
         yield session  # Provide the session to the test
     finally:
         session.close()
-        transaction.rollback()  # Rollback the transaction after each test
-        connection.close()
+        with engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
 
 
 # Session-scoped fixture for creating the test client with overridden dependency
@@ -206,14 +217,20 @@ def client(client_config, db) -> Generator:
     Function-scoped fixture to override the database session for each test.
     """
 
-    # Override the `get_db` dependency to use the session from the db fixture
-    def override_get_db():
-        try:
-            yield db
-        finally:
-            db.close()
+    # Override the `get_db` dependency to use the test database
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: TestingAsyncSessionLocal
+
+    # Each test empties the database, so it also needs a scheduler with fresh in-memory state
+    scheduler = AsyncScheduler(AdvancedScheduler())
+    app.dependency_overrides[get_scheduler] = lambda: scheduler
+
+    # User IDs are reused once the tables are emptied, so cached users must not outlive the test
+    principal_cache.clear()
 
     # Use the configured client from the session-scoped fixture
     yield client_config
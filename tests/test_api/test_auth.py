@@ -1,6 +1,8 @@
 # tests/test_auth.py
 from fastapi.testclient import TestClient
+from passlib.context import CryptContext
 
+from app.core.security import password_hasher, pwd_context
 from tests.conftest import get_test_user, TEST_USER_PASSWORD
 
 
@@ -122,6 +124,28 @@ def test_login_invalid_credentials(client: TestClient, get_test_user):
     assert response.json()["detail"] == "User not found"
 
 
+def test_login_rehashes_outdated_password_hash(client: TestClient, db, get_test_user):
+    """Test that logging in upgrades a hash made with a lower bcrypt cost factor."""
+    get_test_user.hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(TEST_USER_PASSWORD)
+    db.commit()
+
+    response = login_user(client, TEST_USER_PASSWORD, get_test_user.username)
+    assert response.status_code == 200
+
+    db.refresh(get_test_user)
+    assert not pwd_context.needs_update(get_test_user.hashed_password)
+    assert pwd_context.verify(TEST_USER_PASSWORD, get_test_user.hashed_password)
+
+
+def test_login_rejected_when_password_hasher_is_saturated(client: TestClient, get_test_user, monkeypatch):
+    """Test that logins fail fast with 503 once the password hasher queue is full."""
+    monkeypatch.setattr(password_hasher, "in_flight", password_hasher.max_in_flight)
+
+    response = login_user(client, TEST_USER_PASSWORD, get_test_user.username)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
 def test_login_empty_fields(client: TestClient):
     """Test login with empty fields."""
     response = login_user(client, "", "")
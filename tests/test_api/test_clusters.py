@@ -36,6 +36,11 @@ def test_create_cluster_success(client: TestClient, get_logged_in_test_org_admin
     assert response_data["cpu_limit"] == cluster_data["cpu_limit"]
     assert response_data["ram_limit"] == cluster_data["ram_limit"]
     assert response_data["gpu_limit"] == cluster_data["gpu_limit"]
+    assert response_data["fair_share"] is False
+
+    response = create_cluster(client, cookies, {**cluster_data, "fair_share": True})
+    assert response.status_code == 200
+    assert response.json()["fair_share"] is True
 
 
 def test_create_cluster_invalid_resource_limits(client: TestClient, get_logged_in_test_org_admin_cookies):
@@ -1,9 +1,16 @@
 # tests/test_deployment.py
+import csv
+import io
+import json
+
 from fastapi.testclient import TestClient
 from httpx import Cookies
+from sqlalchemy.orm import Session
 
 from app.models.cluster import Cluster as ClusterModel
-from app.models.deployment import DeploymentStatus
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.models.user import User as UserModel
+from app.schedulers.async_scheduler import AsyncScheduler
 
 
 def test_create_deployment_success(client: TestClient, get_test_cluster: ClusterModel, get_logged_in_test_user_cookies: Cookies):
@@ -27,6 +34,11 @@ def test_create_deployment_success(client: TestClient, get_test_cluster: Cluster
     assert response_data["status"] == DeploymentStatus.RUNNING.value
 
 
+def test_deployments_are_scheduled_in_the_request_by_default(client: TestClient):
+    """The API suite runs with an inline scheduler, like the application with the default settings."""
+    assert type(client.app.state.scheduler) is AsyncScheduler
+
+
 def test_create_deployment_insufficient_resources(client: TestClient, get_test_cluster: ClusterModel,
                                                   get_logged_in_test_user_cookies: Cookies):
     """Test deployment creation with insufficient resources."""
@@ -48,6 +60,30 @@ def test_create_deployment_insufficient_resources(client: TestClient, get_test_c
     assert response_data["name"] == "test-deployment"
     assert response_data["status"] == DeploymentStatus.PENDING.value
 
+def test_create_deployment_without_cluster(client: TestClient, db: Session, get_test_cluster: ClusterModel,
+                                           get_test_user: UserModel, get_logged_in_test_user_cookies: Cookies):
+    """Test that a deployment without cluster is placed on a cluster of the user's organization."""
+    cookies = get_logged_in_test_user_cookies
+    deployment_data = {"name": "placed", "docker_image": "my_image", "cpu_required": 2, "ram_required": 4,
+                       "gpu_required": 1, "priority": 1}
+
+    response = client.post("/deployments/", json=deployment_data, cookies=cookies)
+    assert response.status_code == 200
+    assert response.json()["cluster_id"] == get_test_cluster.id
+    assert response.json()["status"] == DeploymentStatus.RUNNING.value
+    # The deployment records who submitted it
+    assert db.get(DeploymentModel, response.json()["id"]).user_id == get_test_user.id
+
+    # No cluster of the organization could ever hold it
+    response = client.post("/deployments/", json={**deployment_data, "cpu_required": 100}, cookies=cookies)
+    assert response.status_code == 400
+
+    # Placement needs to know the user's organization
+    client.cookies.clear()
+    response = client.post("/deployments/", json=deployment_data)
+    assert response.status_code == 401
+
+
 def test_list_deployments_success(client: TestClient, get_test_cluster: ClusterModel, get_logged_in_test_user_cookies: Cookies):
     """Test listing deployments."""
     cookies = get_logged_in_test_user_cookies
@@ -72,6 +108,62 @@ def test_list_deployments_success(client: TestClient, get_test_cluster: ClusterM
     assert len(response_data) == 1
     assert response_data[0]["name"] == "test-deployment"
 
+def test_list_deployments_pagination_filters_and_projection(client: TestClient, get_test_cluster: ClusterModel,
+                                                            get_logged_in_test_user_cookies: Cookies):
+    """Test keyset pagination, filters and field projection of the deployment listing."""
+    cookies = get_logged_in_test_user_cookies
+    for index, (name, cpu) in enumerate([("web-1", 1), ("web-2", 1), ("batch-1", 10), ("web-3", 1)]):
+        client.post("/deployments/", json={"name": name, "docker_image": "my_image", "cpu_required": cpu,
+                                           "ram_required": 1, "gpu_required": 0, "priority": index,
+                                           "cluster_id": get_test_cluster.id}, cookies=cookies)
+
+    first_page = client.get("/deployments/", params={"limit": 2}, cookies=cookies)
+    assert [item["name"] for item in first_page.json()] == ["web-1", "web-2"]
+    next_url = first_page.links["next"]["url"]
+    second_page = client.get(next_url, cookies=cookies)
+    assert [item["name"] for item in second_page.json()] == ["batch-1", "web-3"]
+    assert "next" not in second_page.links
+
+    response = client.get("/deployments/", params={"name_prefix": "web", "min_priority": 1, "status": "running",
+                                                   "fields": "name,priority"}, cookies=cookies)
+    assert response.json() == [{"name": "web-2", "priority": 1}, {"name": "web-3", "priority": 3}]
+
+    response = client.get("/deployments/", params={"status": "pending", "fields": "name"}, cookies=cookies)
+    assert response.json() == [{"name": "batch-1"}]
+
+    response = client.get("/deployments/", params={"fields": "name,password"}, cookies=cookies)
+    assert response.status_code == 400
+
+
+def test_export_deployments(client: TestClient, get_test_cluster: ClusterModel,
+                            get_logged_in_test_user_cookies: Cookies):
+    """Test the streaming NDJSON and CSV exports, with and without gzip."""
+    cookies = get_logged_in_test_user_cookies
+    for index, (name, cpu) in enumerate([("web-1", 1), ("batch-1", 10), ("web-2", 1)]):
+        client.post("/deployments/", json={"name": name, "docker_image": "my_image", "cpu_required": cpu,
+                                           "ram_required": 1, "gpu_required": 0, "priority": index,
+                                           "cluster_id": get_test_cluster.id}, cookies=cookies)
+
+    response = client.get("/deployments/export", cookies=cookies)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-encoding"] == "gzip"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["name"] for row in rows] == ["web-1", "batch-1", "web-2"]
+    assert rows[1]["status"] == "pending"
+
+    response = client.get("/deployments/export", params={"format": "csv", "fields": "name,status",
+                                                         "name_prefix": "web"},
+                          headers={"Accept-Encoding": "identity"}, cookies=cookies)
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"].startswith("text/csv")
+    assert list(csv.reader(io.StringIO(response.text))) == [["name", "status"], ["web-1", "running"],
+                                                            ["web-2", "running"]]
+
+    response = client.get("/deployments/export", params={"fields": "password"}, cookies=cookies)
+    assert response.status_code == 400
+
+
 def test_list_deployments_user_not_in_org(client: TestClient, get_logged_in_test_user_cookies: Cookies):
     """Test listing deployments for a user not in any organization."""
     cookies = get_logged_in_test_user_cookies
@@ -82,6 +174,100 @@ def test_list_deployments_user_not_in_org(client: TestClient, get_logged_in_test
     assert response.json() == {"detail": "User is not part of any organization"}
 
 
+def test_completing_deployment_starts_queued_deployment(client: TestClient, get_test_cluster: ClusterModel,
+                                                        get_logged_in_test_user_cookies: Cookies):
+    """Test that finishing a running deployment frees resources for the pending ones."""
+    cookies = get_logged_in_test_user_cookies
+
+    deployment_data = {
+        "name": "test-deployment",
+        "docker_image": "my_image",
+        "cpu_required": 3,
+        "ram_required": 4,
+        "gpu_required": 1,
+        "priority": 1,
+        "cluster_id": get_test_cluster.id
+    }
+
+    running = client.post("/deployments/", json=deployment_data, cookies=cookies).json()
+    queued = client.post("/deployments/", json=deployment_data, cookies=cookies).json()
+    assert running["status"] == DeploymentStatus.RUNNING.value
+    assert queued["status"] == DeploymentStatus.PENDING.value
+
+    response = client.patch(f"/deployments/{running['id']}/status", json={"status": "completed"}, cookies=cookies)
+    assert response.status_code == 200
+    assert response.json()["status"] == DeploymentStatus.COMPLETED.value
+
+    deployments = {d["id"]: d for d in client.get("/deployments/", cookies=cookies).json()}
+    assert deployments[queued["id"]]["status"] == DeploymentStatus.RUNNING.value
+
+
+
+def test_create_deployments_batch(client: TestClient, get_test_cluster: ClusterModel,
+                                  get_logged_in_test_user_cookies: Cookies):
+    """Test creating a batch of deployments with per item results."""
+    cookies = get_logged_in_test_user_cookies
+
+    def deployment_data(cpu: float, cluster_id: int) -> dict:
+        return {"name": "batch-deployment", "docker_image": "my_image", "cpu_required": cpu, "ram_required": 1,
+                "gpu_required": 0, "priority": 1, "cluster_id": cluster_id}
+
+    batch = [
+        deployment_data(2, get_test_cluster.id),
+        deployment_data(2, get_test_cluster.id),
+        deployment_data(1, get_test_cluster.id),
+        deployment_data(1, get_test_cluster.id + 1000),
+    ]
+    response = client.post("/deployments/batch", json=batch, cookies=cookies)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert [result["status"] for result in results] == ["running", "running", "pending", None]
+    assert results[2]["reason"] == "Waiting for resources"
+    assert results[3] == {"index": 3, "deployment_id": None, "status": None, "reason": "Cluster not found"}
+
+    deployments = client.get("/deployments/", cookies=cookies).json()
+    assert sorted(d["id"] for d in deployments) == sorted(result["deployment_id"] for result in results[:3])
+
+
+def test_deployment_dependencies(client: TestClient, get_test_cluster: ClusterModel,
+                                 get_logged_in_test_user_cookies: Cookies):
+    """Test submitting a pipeline of dependent deployments and advancing it."""
+    cookies = get_logged_in_test_user_cookies
+
+    def deployment_data(**dependencies) -> dict:
+        return {"name": "stage", "docker_image": "my_image", "cpu_required": 1, "ram_required": 1,
+                "gpu_required": 0, "priority": 1, "cluster_id": get_test_cluster.id, **dependencies}
+
+    response = client.post("/deployments/", json=deployment_data(depends_on=[12345]), cookies=cookies)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Dependencies not found: 12345"}
+
+    response = client.post("/deployments/batch", json=[deployment_data(depends_on_index=[1]),
+                                                        deployment_data(depends_on_index=[0])], cookies=cookies)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Dependency cycle between deployments at positions 0, 1"}
+
+    batch = [
+        deployment_data(),
+        deployment_data(depends_on_index=[0]),
+        deployment_data(depends_on=[12345]),
+        deployment_data(depends_on_index=[2]),
+    ]
+    results = client.post("/deployments/batch", json=batch, cookies=cookies).json()
+    assert [result["status"] for result in results] == ["running", "pending", None, None]
+    assert [result["reason"] for result in results] == [None, "Waiting for dependencies or resources",
+                                                        "Dependency not found", "Dependency rejected"]
+
+    first_id, second_id = results[0]["deployment_id"], results[1]["deployment_id"]
+    response = client.patch(f"/deployments/{first_id}/status", json={"status": "completed"}, cookies=cookies)
+    assert response.status_code == 200
+    deployments = {d["id"]: d for d in client.get("/deployments/", cookies=cookies).json()}
+    assert deployments[second_id]["status"] == "running"
+
+
+
 #
 # # tests/test_deployment.py
 # import pytest
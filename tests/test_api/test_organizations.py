@@ -74,6 +74,20 @@ def test_create_organization_success(client: TestClient, db: Session, get_test_u
     validate_role_of_user_in_org(user, db, org_id, "admin")
 
 
+def test_new_member_can_use_organization_right_away(client: TestClient, get_logged_in_test_user_cookies: Cookies):
+    cookies = get_logged_in_test_user_cookies
+
+    # The user is cached as not being part of an organization
+    response = client.get("/clusters", cookies=cookies)
+    assert response.status_code == 400
+
+    response = create_organization(client, cookies, "test-organization")
+    assert response.status_code == 200
+
+    response = client.get("/clusters", cookies=cookies)
+    assert response.status_code == 200
+
+
 def test_create_organization_already_a_member(client: TestClient, get_test_org_admin: UserModel,
                                               get_logged_in_test_user_cookies: Cookies):
     cookies = get_logged_in_test_user_cookies
@@ -0,0 +1,110 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, REGISTRY
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import DeploymentStatus
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate
+
+
+def deployment_in(cluster: ClusterModel, cpu: float, priority: int) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=4,
+                            gpu_required=0, priority=priority, cluster_id=cluster.id)
+
+
+def sample(name: str, labels: dict = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+def test_scheduler_records_latencies_locks_and_preemptions(db: Session, get_test_cluster: ClusterModel):
+    cluster_label = {"cluster_id": str(get_test_cluster.id)}
+    schedules_before = sample("scheduler_decision_seconds_count", {"operation": "schedule"})
+    preemptions_before = sample("scheduler_preemptions_total", cluster_label)
+    lock_waits_before = sample("scheduler_lock_wait_seconds_count", cluster_label)
+    lock_holds_before = sample("scheduler_lock_hold_seconds_count", cluster_label)
+    commits_before = sample("scheduler_commit_seconds_count")
+    scheduler = AdvancedScheduler()
+
+    low = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=4, priority=1))
+    high = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=4, priority=5))
+
+    assert (low.status, high.status) == (DeploymentStatus.PENDING, DeploymentStatus.RUNNING)
+    assert sample("scheduler_decision_seconds_count", {"operation": "schedule"}) == schedules_before + 2
+    assert sample("scheduler_decision_seconds_count", {"operation": "preemption"}) >= 1
+    assert sample("scheduler_preemptions_total", cluster_label) == preemptions_before + 1
+    # One commit per decision: the nested transactions join the outer one
+    assert sample("scheduler_commit_seconds_count") == commits_before + 2
+    # Local thread locks are not contended once requests queued on the AsyncScheduler's locks, so not timed
+    assert sample("scheduler_lock_wait_seconds_count", cluster_label) == lock_waits_before
+    assert sample("scheduler_lock_hold_seconds_count", cluster_label) == lock_holds_before
+
+
+async def schedule_on_one_cluster(database_url: str, cluster_id: int):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with session_factory() as db:
+        cluster = ClusterModel(id=cluster_id, name="cluster", organization_id=1, cpu_limit=cpu_units(4),
+                               ram_limit=ram_units(16), gpu_limit=0, cpu_available=cpu_units(4),
+                               ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        await db.commit()
+    scheduler = AsyncScheduler(AdvancedScheduler())
+
+    async def request():
+        async with session_factory() as db:
+            await scheduler.schedule(db, await db.get(ClusterModel, cluster.id),
+                                     deployment_in(cluster, cpu=1, priority=1))
+
+    await asyncio.gather(request(), request())
+    await engine.dispose()
+
+
+def test_async_scheduler_records_waits_for_cluster_locks(tmp_path):
+    cluster_id = 42
+    cluster_label = {"cluster_id": str(cluster_id)}
+    waits_before = {name: sample(f"scheduler_lock_wait_seconds_{name}", cluster_label) for name in ("count", "sum")}
+    holds_before = sample("scheduler_lock_hold_seconds_count", cluster_label)
+
+    asyncio.run(schedule_on_one_cluster(f"sqlite+aiosqlite:///{tmp_path / 'metrics.db'}", cluster_id))
+
+    assert sample("scheduler_lock_wait_seconds_count", cluster_label) == waits_before["count"] + 2
+    assert sample("scheduler_lock_hold_seconds_count", cluster_label) == holds_before + 2
+    # The second request waited for the whole decision of the first one
+    waited = sample("scheduler_lock_wait_seconds_sum", cluster_label) - waits_before["sum"]
+    assert waited >= 0.0005
+
+
+def test_cluster_state_collector_reads_queue_depth_and_utilization(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    for priority in (5, 1, 1):
+        scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=3, priority=priority))
+    registry = CollectorRegistry()
+
+    metrics.register_cluster_states(scheduler.cluster_states, registry)
+
+    cluster_id = str(get_test_cluster.id)
+    assert registry.get_sample_value("scheduler_queue_depth", {"cluster_id": cluster_id}) == 2
+    assert registry.get_sample_value("scheduler_cluster_utilization",
+                                     {"cluster_id": cluster_id, "resource": "cpu"}) == 0.75
+    assert registry.get_sample_value("scheduler_cluster_utilization",
+                                     {"cluster_id": cluster_id, "resource": "ram"}) == 0.25
+
+
+def test_metrics_endpoint(client: TestClient):
+    # /metrics is mounted on the application root, outside of the API prefix
+    response = client.get("http://testserver/metrics/")
+
+    assert response.status_code == 200
+    for name in ("scheduler_decision_seconds", "scheduler_lock_wait_seconds", "scheduler_commit_seconds",
+                 "scheduler_queue_depth", "scheduler_cluster_utilization"):
+        assert name in response.text
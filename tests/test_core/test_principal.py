@@ -0,0 +1,40 @@
+from sqlalchemy.orm import Session
+
+from app.core.principal import Principal, PrincipalCache, principal_cache
+from app.models.organization_member import OrganizationMember
+from app.models.user import User as UserModel
+from tests.conftest import create_org
+
+
+def test_cache_evicts_least_recently_used():
+    cache = PrincipalCache(max_size=2, ttl=60)
+    cache.put(Principal(id=1, is_active=True))
+    cache.put(Principal(id=2, is_active=True))
+    assert cache.get(1) is not None
+
+    cache.put(Principal(id=3, is_active=True))
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert cache.get(3) is not None
+
+
+def test_cache_expires_entries():
+    cache = PrincipalCache(max_size=2, ttl=0)
+    cache.put(Principal(id=1, is_active=True))
+
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_membership_and_user_changes_invalidate_cache(db: Session, get_test_user: UserModel):
+    principal_cache.put(Principal.from_model(get_test_user))
+    organization = create_org(db, "Organization")
+    db.add(OrganizationMember(user_id=get_test_user.id, organization_id=organization.id, role="admin"))
+    db.commit()
+    assert principal_cache.get(get_test_user.id) is None
+
+    principal_cache.put(Principal.from_model(get_test_user))
+    get_test_user.is_active = False
+    db.commit()
+    assert principal_cache.get(get_test_user.id) is None
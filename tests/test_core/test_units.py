@@ -0,0 +1,41 @@
+import pytest
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.core.units import cpu_units, gpu_units, ram_units
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import DeploymentStatus
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.cluster import Cluster, ClusterCreate
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+def test_decimal_amounts_are_validated_into_units_and_rendered_back():
+    cluster_in = ClusterCreate(name="cluster", cpu_limit=0.1, ram_limit=0.5, gpu_limit="1.25")
+
+    assert (cluster_in.cpu_limit, cluster_in.ram_limit, cluster_in.gpu_limit) == (100, 512, 1250)
+    cluster = Cluster(id=1, name="cluster", organization_id=1, cpu_limit=100, ram_limit=512, gpu_limit=1250,
+                      cpu_available=100, ram_available=512, gpu_available=1250)
+    assert cluster.model_dump(mode="json")["cpu_limit"] == 0.1
+    assert cluster.model_dump(mode="json")["gpu_available"] == 1.25
+    with pytest.raises(ValidationError):
+        ClusterCreate(name="cluster", cpu_limit="lots", ram_limit=1, gpu_limit=0)
+
+
+def test_repeated_allocations_give_back_exactly_the_capacity(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    deployment_in = DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=0.1, ram_required=0.3,
+                                     gpu_required=0, priority=1, cluster_id=get_test_cluster.id)
+    completed = DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+
+    for _ in range(100):
+        deployments = [scheduler.schedule(db, get_test_cluster, deployment_in) for _ in range(7)]
+        for deployment in deployments:
+            scheduler.update_deployment_status(db, deployment, completed)
+
+    db.refresh(get_test_cluster)
+    state = scheduler.cluster_states.get(db, get_test_cluster.id)
+    assert get_test_cluster.cpu_available == state.cpu_available == get_test_cluster.cpu_limit == cpu_units(4)
+    assert get_test_cluster.ram_available == state.ram_available == ram_units(16)
+    assert get_test_cluster.gpu_available == gpu_units(2)
+    assert scheduler.drifted_clusters(db, [get_test_cluster.id]) == []
@@ -0,0 +1,103 @@
+"""
+Check that the scheduler's hot queries are served by indexes on a realistically sized table.
+
+The deployment table is filled with 1M rows, of which 2% are running or pending, and the query plans are
+inspected with EXPLAIN. The tests run on a temporary SQLite database by default; set EXPLAIN_DATABASE_URL
+to an empty PostgreSQL database to check the PostgreSQL plans instead.
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Query
+
+from app.db.migrate import upgrade_database
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment, DeploymentStatus, is_active
+
+ORGANIZATIONS = 100
+CLUSTERS = 1000
+DEPLOYMENTS = 1_000_000
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    url = os.environ.get("EXPLAIN_DATABASE_URL") or f"sqlite:///{tmp_path_factory.mktemp('explain') / 'plans.db'}"
+    engine = create_engine(url)
+    upgrade_database(engine)
+    with engine.begin() as connection:
+        _populate(connection)
+    yield engine
+    engine.dispose()
+
+
+def _populate(connection):
+    status_type = "deploymentstatus" if connection.dialect.name == "postgresql" else "VARCHAR"
+    connection.execute(text(f"""
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {ORGANIZATIONS})
+        INSERT INTO organization (name, invite_code) SELECT 'organization-' || n, 'invite-' || n FROM seq
+    """))
+    connection.execute(text(f"""
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {CLUSTERS})
+        INSERT INTO cluster (name, organization_id, cpu_limit, ram_limit, gpu_limit,
+                             cpu_available, ram_available, gpu_available, version)
+        SELECT 'cluster-' || n, (SELECT MIN(id) FROM organization) + n % {ORGANIZATIONS},
+               64, 256, 8, 64, 256, 8, 0
+        FROM seq
+    """))
+    # Every 50th deployment is pending and the next one running, the rest is finished history
+    connection.execute(text(f"""
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {DEPLOYMENTS})
+        INSERT INTO deployment (name, cluster_id, docker_image, status, priority,
+                                cpu_required, ram_required, gpu_required)
+        SELECT 'deployment-' || n, (SELECT MIN(id) FROM cluster) + n % {CLUSTERS}, 'image',
+               CAST(CASE n % 50 WHEN 0 THEN 'PENDING' WHEN 1 THEN 'RUNNING'
+                               WHEN 2 THEN 'FAILED' WHEN 3 THEN 'CANCELLED' ELSE 'COMPLETED' END
+                    AS {status_type}),
+               n % 10, 1, 1, 0
+        FROM seq
+    """))
+    connection.execute(text("ANALYZE"))
+
+
+def explain(engine, statement) -> str:
+    if isinstance(statement, Query):
+        statement = statement.statement
+    with engine.connect() as connection:
+        sql = str(statement.compile(connection, compile_kwargs={"literal_binds": True}))
+        if connection.dialect.name == "sqlite":
+            return "\n".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+        return "\n".join(row[0] for row in connection.execute(text(f"EXPLAIN {sql}")))
+
+
+def assert_uses_index(plan: str, *index_names: str):
+    assert any(index_name in plan for index_name in index_names), plan
+    assert "Seq Scan" not in plan, plan
+
+
+def test_cluster_load_uses_index(engine):
+    # ClusterStateStore.load: both indexes narrow the lookup down to the active deployments of the cluster
+    query = select(Deployment).where(Deployment.cluster_id == 42, is_active())
+    assert_uses_index(explain(engine, query),
+                      "ix_deployment_active_cluster_id_priority", "ix_deployment_cluster_id_status_priority")
+
+
+def test_hydrate_uses_partial_index(engine):
+    # ClusterStateStore.hydrate reads the active deployments of every cluster
+    query = select(Deployment).where(is_active())
+    assert_uses_index(explain(engine, query), "ix_deployment_active_cluster_id_priority")
+
+
+def test_cluster_listing_by_status_uses_composite_index(engine):
+    # Deployment listing of a cluster filtered on status, highest priority first
+    query = (select(Deployment)
+             .where(Deployment.cluster_id == 42, Deployment.status == DeploymentStatus.FAILED)
+             .order_by(Deployment.priority.desc()))
+    plan = explain(engine, query)
+    assert_uses_index(plan, "ix_deployment_cluster_id_status_priority")
+    assert "TEMP B-TREE" not in plan, plan
+
+
+def test_organization_clusters_use_index(engine):
+    query = select(Cluster).where(Cluster.organization_id == 1)
+    assert_uses_index(explain(engine, query), "ix_cluster_organization_id")
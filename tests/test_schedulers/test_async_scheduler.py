@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.locking import OptimisticLockBackend
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+async def schedule_concurrently(database_url: str, count: int):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async with session_factory() as db:
+        cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                               gpu_limit=0, cpu_available=cpu_units(4), ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        await db.commit()
+        cluster_id = cluster.id
+
+    scheduler = AsyncScheduler(AdvancedScheduler())
+    deployment_in = DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=1, ram_required=1,
+                                     gpu_required=0, priority=1, cluster_id=cluster_id)
+
+    async def request():
+        async with session_factory() as db:
+            deployment = await scheduler.schedule(db, await db.get(ClusterModel, cluster_id), deployment_in)
+            return deployment.status
+
+    statuses = await asyncio.gather(*(request() for _ in range(count)))
+    async with session_factory() as db:
+        cpu_available = (await db.get(ClusterModel, cluster_id)).cpu_available
+    await engine.dispose()
+    return statuses, cpu_available
+
+
+def test_concurrent_requests_do_not_overcommit_cluster(tmp_path):
+    statuses, cpu_available = asyncio.run(
+        schedule_concurrently(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}", count=10)
+    )
+
+    assert statuses.count(DeploymentStatus.RUNNING) == 4
+    assert statuses.count(DeploymentStatus.PENDING) == 6
+    assert cpu_available == 0
+
+
+async def complete_concurrently(database_url: str, count: int):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async with session_factory() as db:
+        cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(count),
+                               ram_limit=ram_units(16), gpu_limit=0, cpu_available=cpu_units(count),
+                               ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        await db.commit()
+
+    scheduler = AsyncScheduler(AdvancedScheduler())
+    passes = []
+    process_cluster_queue = scheduler.scheduler.process_cluster_queue
+    scheduler.scheduler.process_cluster_queue = lambda db, cluster: (passes.append(cluster.id),
+                                                                    process_cluster_queue(db, cluster))
+    commits = []
+    event.listen(engine.sync_engine, "commit", lambda connection: commits.append(connection))
+    deployment_in = DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=1, ram_required=1,
+                                     gpu_required=0, priority=1, cluster_id=cluster.id)
+    async with session_factory() as db:
+        deployments = [await scheduler.schedule(db, cluster, deployment_in) for _ in range(2 * count + 1)]
+
+    async def complete(deployment_id: int):
+        async with session_factory() as db:
+            deployment = await scheduler.update_deployment_status(
+                db, await db.get(DeploymentModel, deployment_id),
+                DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+            )
+            return deployment.status
+
+    passes.clear()
+    statuses = await asyncio.gather(*(complete(deployment.id) for deployment in deployments[:count]))
+    storm_passes = len(passes)
+
+    # Alone on its cluster, a completion drains the queue in the transaction of its release
+    passes.clear()
+    commits.clear()
+    await complete(deployments[count].id)
+    lone = len(passes), len(commits)
+
+    async with session_factory() as db:
+        started = [(await db.get(DeploymentModel, deployment.id)).status for deployment in deployments[count + 1:]]
+    await engine.dispose()
+    return statuses, started, storm_passes, lone
+
+
+def test_concurrent_completions_share_queue_drains(tmp_path):
+    statuses, started, storm_passes, lone = asyncio.run(
+        complete_concurrently(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}", count=8)
+    )
+
+    assert statuses == [DeploymentStatus.COMPLETED] * 8
+    # Every completion returned after a drain that saw its release
+    assert started == [DeploymentStatus.RUNNING] * 8
+    # The first completion may drain alone if the others were not in progress yet, the rest share a pass
+    assert storm_passes <= 2
+    assert lone == (1, 1)
+
+
+async def retry_while_serving(database_url: str, backoff: float):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with session_factory() as db:
+        clusters = [ClusterModel(name=name, organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                                 gpu_limit=0, cpu_available=cpu_units(4), ram_available=ram_units(16),
+                                 gpu_available=0) for name in ("conflicting", "other")]
+        db.add_all(clusters)
+        await db.commit()
+
+    lock_backend = OptimisticLockBackend(max_retries=1)
+    lock_backend.backoff_delay = lambda attempt: backoff
+    scheduler = AsyncScheduler(AdvancedScheduler(lock_backend))
+    load = scheduler.scheduler.cluster_states.load
+    stale = [clusters[0].id]
+
+    def load_stale_version(db, cluster_id):
+        # The first decision on the conflicting cluster reads a version another worker already replaced
+        state = load(db, cluster_id)
+        if cluster_id in stale:
+            stale.remove(cluster_id)
+            state.version -= 1
+        return state
+
+    scheduler.scheduler.cluster_states.load = load_stale_version
+
+    async def request(cluster: ClusterModel):
+        start = time.perf_counter()
+        async with session_factory() as db:
+            deployment = await scheduler.schedule(db, await db.get(ClusterModel, cluster.id), DeploymentCreate(
+                name="deployment", docker_image="my_image", cpu_required=1, ram_required=1, gpu_required=0,
+                priority=1, cluster_id=cluster.id
+            ))
+        return deployment.status, time.perf_counter() - start
+
+    results = await asyncio.gather(*(request(cluster) for cluster in clusters))
+    await engine.dispose()
+    return results
+
+
+def test_conflict_backoff_does_not_block_other_requests(tmp_path):
+    backoff = 0.5
+    (retried, retried_time), (other, other_time) = asyncio.run(
+        retry_while_serving(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}", backoff)
+    )
+
+    assert (retried, other) == (DeploymentStatus.RUNNING, DeploymentStatus.RUNNING)
+    assert retried_time >= backoff
+    # Served while the conflicting request was backing off
+    assert other_time < backoff
@@ -0,0 +1,87 @@
+from sqlalchemy.orm import Session
+
+from app.core.units import cpu_units
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import DeploymentStatus
+from app.schedulers.backfill_scheduler import BackfillScheduler
+from app.schedulers.cluster_state import ClusterState, DeploymentEntry
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+def deployment_in(cluster: ClusterModel, cpu: float, priority: int) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                            gpu_required=0, priority=priority, cluster_id=cluster.id)
+
+
+def complete(scheduler, db: Session, deployment):
+    return scheduler.update_deployment_status(db, deployment, DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED))
+
+
+def fill_cluster_and_block_head(scheduler, db: Session, cluster: ClusterModel):
+    """
+    Run a 3 CPU deployment on the 4 CPU test cluster, then queue a 4 CPU head and a 1 CPU deployment behind it.
+    """
+    running = scheduler.schedule(db, cluster, deployment_in(cluster, cpu=3, priority=5))
+    head = scheduler.schedule(db, cluster, deployment_in(cluster, cpu=4, priority=5))
+    small = scheduler.schedule(db, cluster, deployment_in(cluster, cpu=1, priority=1))
+    return running, head, small
+
+
+def test_strict_priority_blocks_behind_head(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    running, head, small = fill_cluster_and_block_head(scheduler, db, get_test_cluster)
+    other = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=2, priority=1))
+    complete(scheduler, db, running)
+
+    # The small deployment keeps the head from starting, and the head keeps the 2 CPU one from using idle CPUs
+    assert small.status == DeploymentStatus.RUNNING
+    assert head.status == DeploymentStatus.PENDING
+    assert other.status == DeploymentStatus.PENDING
+    assert get_test_cluster.cpu_available == cpu_units(3)
+
+
+def test_backfill_starts_small_deployments_and_evicts_them_for_the_head(db: Session,
+                                                                        get_test_cluster: ClusterModel):
+    scheduler = BackfillScheduler()
+    running, head, small = fill_cluster_and_block_head(scheduler, db, get_test_cluster)
+
+    assert head.status == DeploymentStatus.PENDING
+    assert small.status == DeploymentStatus.RUNNING
+    assert set(scheduler.backfilled[get_test_cluster.id]) == {small.id}
+
+    # Releasing the 3 CPU deployment is enough for the head once the backfilled deployment is evicted
+    complete(scheduler, db, running)
+
+    assert head.status == DeploymentStatus.RUNNING
+    assert small.status == DeploymentStatus.PENDING
+    assert get_test_cluster.cpu_available == 0
+
+
+def test_backfilled_deployments_are_restored_after_a_restart(db: Session, get_test_cluster: ClusterModel):
+    running, head, small = fill_cluster_and_block_head(BackfillScheduler(), db, get_test_cluster)
+
+    restarted = BackfillScheduler()
+    restarted.hydrate(db)
+    complete(restarted, db, running)
+
+    db.refresh(head)
+    db.refresh(small)
+    assert head.status == DeploymentStatus.RUNNING
+    assert small.status == DeploymentStatus.PENDING
+
+
+def test_only_deployments_dispatched_behind_the_head_are_evicted():
+    state = ClusterState(id=1, organization_id=1, cpu_limit=cpu_units(2), ram_limit=1, gpu_limit=0,
+                         cpu_available=0, ram_available=1, gpu_available=0)
+    first = DeploymentEntry(id=10, priority=1, cpu_required=cpu_units(1), ram_required=0, gpu_required=0)
+    second = DeploymentEntry(id=11, priority=1, cpu_required=cpu_units(1), ram_required=0, gpu_required=0)
+    for entry in (first, second):
+        state.running[entry.id] = entry
+    backfilled = {first.id: state.pending.dispatch_key(first)}
+    # Submitted before both, but requeued (e.g. evicted) after the first one was dispatched
+    head = DeploymentEntry(id=5, priority=1, cpu_required=cpu_units(1), ram_required=0, gpu_required=0)
+    state.pending.push(head)
+    backfilled[second.id] = state.pending.dispatch_key(second)
+
+    assert BackfillScheduler._reclaim_for(head, state, backfilled) == [second]
@@ -0,0 +1,65 @@
+import numpy as np
+
+from app.schedulers.capacity_matrix import CapacityMatrix
+from app.schedulers.cluster_state import ClusterState, ClusterStateStore, DeploymentEntry
+
+
+def make_entry(deployment_id: int, cpu: float, ram: float = 0, gpu: float = 0) -> DeploymentEntry:
+    return DeploymentEntry(id=deployment_id, priority=1, cpu_required=cpu, ram_required=ram, gpu_required=gpu)
+
+
+def test_columns_grow_and_stay_stable():
+    matrix = CapacityMatrix(capacity=2)
+    columns = [matrix.column(cluster_id) for cluster_id in (10, 20, 30)]
+    matrix.set(columns[2], (8, 32, 0), (4, 16, 0), pending=3)
+
+    assert columns == [0, 1, 2]
+    assert matrix.column(30) == 2
+    assert list(matrix.columns([30, 10])) == [2, 0]
+    assert list(matrix.available[:, 2]) == [4, 16, 0]
+    assert matrix.pending[2] == 3
+    # No GPU at all: normalizing by the GPU limit must not divide by zero
+    assert list(matrix.inverse_limits[:, 2]) == [1 / 8, 1 / 32, 0]
+
+
+def test_fit_mask_of_a_deployment():
+    matrix = CapacityMatrix()
+    for cluster_id, available in ((1, (4, 16, 0)), (2, (8, 8, 2))):
+        matrix.set(matrix.column(cluster_id), (8, 16, 2), available, pending=0)
+    columns = matrix.columns([1, 2])
+
+    assert matrix.fit_mask(columns, np.array((2, 4, 0))).tolist() == [True, True]
+    assert matrix.fit_mask(columns, np.array((6, 0, 0))).tolist() == [False, True]
+    assert matrix.fit_mask(columns, np.array((1, 0, 1))).tolist() == [False, True]
+
+
+def test_cluster_states_keep_their_column_in_sync():
+    store = ClusterStateStore()
+    state = ClusterState(id=1, organization_id=1, cpu_limit=8, ram_limit=32, gpu_limit=2,
+                         cpu_available=8, ram_available=32, gpu_available=2)
+    store.put(state)
+
+    state.enqueue(make_entry(1, cpu=3, ram=8, gpu=1))
+    assert store.matrix.pending[state.column] == 1
+
+    state.allocate(make_entry(1, cpu=3, ram=8, gpu=1))
+    assert np.array_equal(store.matrix.available[:, state.column], [5, 24, 1])
+    assert store.matrix.pending[state.column] == 0
+
+    state.release(1)
+    assert np.array_equal(store.matrix.available[:, state.column], [8, 32, 2])
+
+
+def test_cluster_states_write_to_the_grown_matrix():
+    store = ClusterStateStore()
+    store.matrix = CapacityMatrix(capacity=1)
+    first = ClusterState(id=1, organization_id=1, cpu_limit=8, ram_limit=32, gpu_limit=2,
+                         cpu_available=8, ram_available=32, gpu_available=2)
+    store.put(first)
+    # Registering a second cluster replaces the arrays the first one was written to
+    store.put(ClusterState(id=2, organization_id=1, cpu_limit=4, ram_limit=16, gpu_limit=0,
+                           cpu_available=4, ram_available=16, gpu_available=0))
+
+    first.allocate(make_entry(1, cpu=3, ram=8, gpu=1))
+
+    assert store.matrix.available.tolist() == [[5, 4], [24, 16], [1, 0]]
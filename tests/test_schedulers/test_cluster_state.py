@@ -0,0 +1,51 @@
+from sqlalchemy.orm import Session
+
+from app.core.units import cpu_units, ram_units
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.cluster_state import ClusterStateStore
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate
+
+
+def create_deployment(db: Session, cluster: ClusterModel, status: DeploymentStatus, cpu: float,
+                      priority: int = 1) -> DeploymentModel:
+    """
+    Helper function to insert a deployment directly in the database.
+    """
+    deployment = DeploymentModel(name="deployment", docker_image="my_image", cluster_id=cluster.id, status=status,
+                                 priority=priority, cpu_required=cpu_units(cpu), ram_required=ram_units(1),
+                                 gpu_required=0)
+    db.add(deployment)
+    db.commit()
+    return deployment
+
+
+def test_hydrate_loads_running_and_pending_deployments(db: Session, get_test_cluster: ClusterModel):
+    running = create_deployment(db, get_test_cluster, DeploymentStatus.RUNNING, cpu=1)
+    pending = create_deployment(db, get_test_cluster, DeploymentStatus.PENDING, cpu=8)
+    create_deployment(db, get_test_cluster, DeploymentStatus.COMPLETED, cpu=1)
+
+    store = ClusterStateStore()
+    store.hydrate(db)
+
+    state = store.get(db, get_test_cluster.id)
+    assert set(state.running) == {running.id}
+    assert set(state.pending.ids()) == {pending.id}
+    assert state.cpu_available == get_test_cluster.cpu_available
+
+
+def test_scheduler_keeps_state_in_sync(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    deployment_in = DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=3, ram_required=1,
+                                     gpu_required=0, priority=1, cluster_id=get_test_cluster.id)
+
+    first = scheduler.schedule(db, get_test_cluster, deployment_in)
+    second = scheduler.schedule(db, get_test_cluster, deployment_in)
+
+    state = scheduler.cluster_states.get(db, get_test_cluster.id)
+    assert first.status == DeploymentStatus.RUNNING
+    assert second.status == DeploymentStatus.PENDING
+    assert set(state.running) == {first.id}
+    assert set(state.pending.ids()) == {second.id}
+    assert state.cpu_available == get_test_cluster.cpu_available == cpu_units(1)
@@ -0,0 +1,131 @@
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.locking import InProcessLockBackend, OptimisticLockBackend
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+@pytest.fixture
+def isolated_db() -> Generator:
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def create_cluster(db: Session, cpu: float = 4) -> ClusterModel:
+    cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(cpu), ram_limit=ram_units(16),
+                           gpu_limit=0, cpu_available=cpu_units(cpu), ram_available=ram_units(16), gpu_available=0)
+    db.add(cluster)
+    db.commit()
+    return cluster
+
+
+def deployment_in(cluster: ClusterModel, cpu: float = 1, depends_on=()) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                            gpu_required=0, priority=1, cluster_id=cluster.id, depends_on=list(depends_on))
+
+
+def complete(scheduler: AdvancedScheduler, db: Session, deployment: DeploymentModel):
+    scheduler.update_deployment_status(db, deployment, DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED))
+
+
+def status_of(db: Session, deployment_id: int) -> DeploymentStatus:
+    db.expire_all()
+    return db.get(DeploymentModel, deployment_id).status
+
+
+@pytest.mark.parametrize("lock_backend", [InProcessLockBackend(), OptimisticLockBackend()])
+def test_deployment_waits_for_its_dependencies(isolated_db: Session, lock_backend):
+    cluster = create_cluster(isolated_db)
+    other_cluster = create_cluster(isolated_db)
+    scheduler = AdvancedScheduler(lock_backend)
+    first = scheduler.schedule(isolated_db, cluster, deployment_in(cluster))
+    second = scheduler.schedule(isolated_db, other_cluster, deployment_in(other_cluster))
+
+    dependent = scheduler.schedule(isolated_db, cluster, deployment_in(cluster, depends_on=[first.id, second.id]))
+
+    assert dependent.status == DeploymentStatus.PENDING
+    assert dependent.id not in scheduler.cluster_states.get(isolated_db, cluster.id).pending
+
+    complete(scheduler, isolated_db, first)
+    assert status_of(isolated_db, dependent.id) == DeploymentStatus.PENDING
+
+    # The last dependency completes on another cluster
+    complete(scheduler, isolated_db, second)
+    assert status_of(isolated_db, dependent.id) == DeploymentStatus.RUNNING
+    assert dependent.id in scheduler.cluster_states.get(isolated_db, cluster.id).running
+
+
+def test_completed_dependencies_do_not_block(isolated_db: Session):
+    cluster = create_cluster(isolated_db)
+    scheduler = AdvancedScheduler()
+    first = scheduler.schedule(isolated_db, cluster, deployment_in(cluster))
+    complete(scheduler, isolated_db, first)
+
+    dependent = scheduler.schedule(isolated_db, cluster, deployment_in(cluster, depends_on=[first.id]))
+
+    assert dependent.status == DeploymentStatus.RUNNING
+
+
+def test_batch_pipeline_advances_as_stages_complete(isolated_db: Session):
+    cluster = create_cluster(isolated_db)
+    scheduler = AdvancedScheduler()
+    # 0 <- 1 <- 2, and 2 also depends on 0
+    placements = scheduler.schedule_batch(isolated_db, {cluster.id: cluster},
+                                          [deployment_in(cluster) for _ in range(3)], {1: [0], 2: [0, 1]})
+    ids = [deployment_id for deployment_id, _ in placements]
+    assert [status for _, status in placements] == [DeploymentStatus.RUNNING, DeploymentStatus.PENDING,
+                                                    DeploymentStatus.PENDING]
+
+    complete(scheduler, isolated_db, isolated_db.get(DeploymentModel, ids[0]))
+    assert status_of(isolated_db, ids[1]) == DeploymentStatus.RUNNING
+    assert status_of(isolated_db, ids[2]) == DeploymentStatus.PENDING
+
+    complete(scheduler, isolated_db, isolated_db.get(DeploymentModel, ids[1]))
+    assert status_of(isolated_db, ids[2]) == DeploymentStatus.RUNNING
+
+
+def test_hydrate_restores_blocked_deployments(isolated_db: Session):
+    cluster = create_cluster(isolated_db)
+    scheduler = AdvancedScheduler()
+    first = scheduler.schedule(isolated_db, cluster, deployment_in(cluster))
+    dependent = scheduler.schedule(isolated_db, cluster, deployment_in(cluster, depends_on=[first.id]))
+
+    restarted = AdvancedScheduler()
+    restarted.hydrate(isolated_db)
+
+    assert dependent.id in restarted.dependencies
+    assert dependent.id not in restarted.cluster_states.get(isolated_db, cluster.id).pending
+    complete(restarted, isolated_db, isolated_db.get(DeploymentModel, first.id))
+    assert status_of(isolated_db, dependent.id) == DeploymentStatus.RUNNING
+
+
+def test_cancelled_deployment_stops_waiting(isolated_db: Session):
+    cluster = create_cluster(isolated_db)
+    scheduler = AdvancedScheduler()
+    first = scheduler.schedule(isolated_db, cluster, deployment_in(cluster))
+    dependent = scheduler.schedule(isolated_db, cluster, deployment_in(cluster, depends_on=[first.id]))
+
+    cancelled = DeploymentStatusUpdate(status=DeploymentStatus.CANCELLED)
+    scheduler.update_deployment_status(isolated_db, dependent, cancelled)
+    assert dependent.id not in scheduler.dependencies
+    complete(scheduler, isolated_db, first)
+    assert status_of(isolated_db, dependent.id) == DeploymentStatus.CANCELLED
+
+    # Its dependency completed in the meantime, so it starts right away when run again
+    scheduler.update_deployment_status(isolated_db, dependent, DeploymentStatusUpdate(status=DeploymentStatus.PENDING))
+    assert status_of(isolated_db, dependent.id) == DeploymentStatus.RUNNING
@@ -0,0 +1,55 @@
+import pytest
+
+from app.schedulers.dependency_graph import DependencyCycle, DependencyGraph, topological_order
+
+
+def test_topological_order_puts_dependencies_first():
+    order = topological_order(4, [(2, 0), (3, 2), (3, 1)])
+
+    assert order.index(2) < order.index(0)
+    assert order.index(3) < order.index(2)
+    assert order.index(3) < order.index(1)
+
+
+def test_topological_order_detects_cycles():
+    with pytest.raises(DependencyCycle) as cycle:
+        topological_order(4, [(0, 1), (1, 2), (2, 1), (3, 3)])
+
+    assert cycle.value.nodes == [1, 2, 3]
+
+
+def test_deployment_is_ready_once_every_dependency_completed():
+    graph = DependencyGraph()
+    graph.block(3, cluster_id=1, dependencies=[1, 2])
+    graph.block(4, cluster_id=2, dependencies=[1])
+
+    assert graph.successor_clusters(1) == {1, 2}
+    assert graph.completed(1) == [4]
+    assert 3 in graph
+    assert graph.completed(2) == [3]
+    assert len(graph) == 0
+
+
+def test_discarded_deployment_is_never_released():
+    graph = DependencyGraph()
+    graph.block(2, cluster_id=1, dependencies=[1])
+    graph.discard(2)
+
+    assert graph.completed(1) == []
+    assert graph.successor_clusters(1) == set()
+
+
+def test_large_pipeline_advances_one_completion_at_a_time():
+    # 10k stage chain, plus a final deployment waiting for every stage
+    size = 10_000
+    graph = DependencyGraph()
+    for stage in range(1, size):
+        graph.block(stage, cluster_id=1, dependencies=[stage - 1])
+    graph.block(size, cluster_id=1, dependencies=range(size))
+
+    released = []
+    for stage in range(size):
+        released.extend(graph.completed(stage))
+
+    assert released == list(range(1, size + 1))
+    assert len(graph) == 0
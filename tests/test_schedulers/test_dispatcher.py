@@ -0,0 +1,206 @@
+import asyncio
+from collections import defaultdict, deque
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.dispatcher import (ADMIT, DRAIN, DispatchEvent, DispatchingScheduler, InMemoryDispatchBackend,
+                                       RedisDispatchBackend)
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the few Redis commands the dispatch backend uses. Every command yields to the event
+    loop first, like a round-trip to the server, and the pop script runs as one step, like scripts in Redis.
+    """
+
+    def __init__(self):
+        self.lists = defaultdict(deque)
+        self.sets = defaultdict(set)
+
+    async def rpush(self, key, value):
+        await asyncio.sleep(0)
+        self.lists[key].append(value)
+
+    async def sadd(self, key, member):
+        await asyncio.sleep(0)
+        self.sets[key].add(str(member))
+
+    async def smembers(self, key):
+        await asyncio.sleep(0)
+        return set(self.sets[key])
+
+    async def eval(self, script, numkeys, queue_key, clusters_key, cluster_id):
+        await asyncio.sleep(0)
+        if self.lists[queue_key]:
+            return self.lists[queue_key].popleft()
+        self.sets[clusters_key].discard(str(cluster_id))
+        return None
+
+    async def aclose(self):
+        pass
+
+
+def deployment_in(cluster_id: int, cpu: float, priority: int = 1, depends_on=()) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                            gpu_required=0, priority=priority, cluster_id=cluster_id, depends_on=list(depends_on))
+
+
+async def setup(database_url: str):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with session_factory() as db:
+        cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                               gpu_limit=0, cpu_available=cpu_units(4), ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        await db.commit()
+    return engine, session_factory, cluster
+
+
+async def statuses(session_factory, deployments):
+    async with session_factory() as db:
+        return [(await db.get(DeploymentModel, deployment.id, populate_existing=True)).status
+                for deployment in deployments]
+
+
+async def submit_and_complete(database_url: str, backend):
+    engine, session_factory, cluster = await setup(database_url)
+    scheduler = DispatchingScheduler(AdvancedScheduler(), backend, session_factory)
+    async with session_factory() as db:
+        submitted = [await scheduler.schedule(db, cluster, deployment_in(cluster.id, cpu=cpu, priority=priority))
+                     for cpu, priority in ((2, 1), (2, 1), (3, 5), (1, 1))]
+    before_dispatch = [deployment.status for deployment in submitted]
+    await scheduler.join()
+    dispatched = await statuses(session_factory, submitted)
+
+    async with session_factory() as db:
+        running = await db.get(DeploymentModel, submitted[2].id)
+        completed = await scheduler.update_deployment_status(
+            db, running, DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED)
+        )
+    before_drain = await statuses(session_factory, submitted)
+    await scheduler.join()
+    drained = await statuses(session_factory, submitted)
+    await scheduler.close()
+    await engine.dispose()
+    return before_dispatch, dispatched, completed.status, before_drain, drained
+
+
+@pytest.mark.parametrize("backend", [InMemoryDispatchBackend, lambda: RedisDispatchBackend(FakeRedis())])
+def test_dispatchers_decide_after_the_request_returned(tmp_path, backend):
+    before_dispatch, dispatched, completed, before_drain, drained = asyncio.run(
+        submit_and_complete(f"sqlite+aiosqlite:///{tmp_path / 'dispatch.db'}", backend())
+    )
+
+    running, pending = DeploymentStatus.RUNNING, DeploymentStatus.PENDING
+    assert before_dispatch == [pending] * 4
+    # Admitted in submission order: the high priority deployment preempted the first two
+    assert dispatched == [pending, pending, running, running]
+    # The completion is applied in the request, the queue is drained by the dispatcher afterwards
+    assert completed == DeploymentStatus.COMPLETED
+    assert before_drain == [pending, pending, DeploymentStatus.COMPLETED, running]
+    assert drained == [running, pending, DeploymentStatus.COMPLETED, running]
+
+
+async def complete_storm(database_url: str, count: int):
+    engine, session_factory, cluster = await setup(database_url)
+    backend = InMemoryDispatchBackend()
+    events = []
+    push = backend.push
+
+    async def record_push(cluster_id: int, event: str):
+        events.append(DispatchEvent.decode(event).kind)
+        await push(cluster_id, event)
+
+    backend.push = record_push
+    scheduler = DispatchingScheduler(AdvancedScheduler(), backend, session_factory, drain_debounce=0.05)
+    async with session_factory() as db:
+        deployments = [await scheduler.schedule(db, cluster, deployment_in(cluster.id, cpu=1))
+                       for _ in range(2 * count)]
+    await scheduler.join()
+    events.clear()
+
+    async def complete(deployment_id: int):
+        async with session_factory() as db:
+            await scheduler.update_deployment_status(db, await db.get(DeploymentModel, deployment_id),
+                                                     DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED))
+
+    await asyncio.gather(*(complete(deployment.id) for deployment in deployments[:count]))
+    await scheduler.join()
+    started = await statuses(session_factory, deployments[count:])
+    # The next completion queues a drain again
+    await complete(deployments[count].id)
+    await scheduler.join()
+    await scheduler.close()
+    await engine.dispose()
+    return events, started
+
+
+def test_completions_queue_one_drain_until_it_starts(tmp_path):
+    events, started = asyncio.run(complete_storm(f"sqlite+aiosqlite:///{tmp_path / 'storm.db'}", count=4))
+
+    assert started == [DeploymentStatus.RUNNING] * 4
+    assert events == [DRAIN, DRAIN]
+
+
+async def pop_while_pushing():
+    backend = RedisDispatchBackend(FakeRedis())
+    # The queue of the cluster is found empty while an event is being pushed to it
+    popped, _ = await asyncio.gather(backend.pop(1), backend.push(1, DispatchEvent(DRAIN).encode()))
+    return popped, await backend.clusters(), await backend.pop(1)
+
+
+def test_redis_backend_keeps_events_pushed_while_popping():
+    popped, clusters, queued = asyncio.run(pop_while_pushing())
+
+    assert popped is None
+    assert clusters == [1]
+    assert DispatchEvent.decode(queued).kind == DRAIN
+
+
+async def recover_leftover_work(database_url: str):
+    engine, session_factory, cluster = await setup(database_url)
+    scheduler = AdvancedScheduler()
+    async with session_factory() as db:
+        # Submitted by a previous run that stopped before dispatching them: one event is still queued in
+        # Redis, the other one was lost
+        queued = await db.run_sync(scheduler.submit, cluster, deployment_in(cluster.id, cpu=1))
+        lost = await db.run_sync(scheduler.submit, cluster, deployment_in(cluster.id, cpu=1))
+        dependent = await db.run_sync(scheduler.submit, cluster, deployment_in(cluster.id, cpu=1,
+                                                                               depends_on=[queued.id]))
+    redis = FakeRedis()
+    await RedisDispatchBackend(redis).push(cluster.id, DispatchEvent(ADMIT, queued.id).encode())
+
+    recovered = AdvancedScheduler()
+    async with session_factory() as db:
+        await db.run_sync(recovered.hydrate)
+    dispatcher = DispatchingScheduler(recovered, RedisDispatchBackend(redis), session_factory)
+    await dispatcher.recover()
+    await dispatcher.join()
+    result = await statuses(session_factory, [queued, lost, dependent])
+    blocked = dependent.id in recovered.dependencies
+    # Admitting again what was already admitted changes nothing
+    async with session_factory() as db:
+        await dispatcher.admit(db, queued.id)
+    await dispatcher.close()
+    await engine.dispose()
+    return result, blocked, recovered.cluster_states.get(None, cluster.id).cpu_available, redis.lists
+
+
+def test_recover_admits_deployments_whose_event_was_lost(tmp_path):
+    result, blocked, cpu_available, queues = asyncio.run(
+        recover_leftover_work(f"sqlite+aiosqlite:///{tmp_path / 'recover.db'}")
+    )
+
+    assert result == [DeploymentStatus.RUNNING, DeploymentStatus.RUNNING, DeploymentStatus.PENDING]
+    assert blocked
+    assert cpu_available == cpu_units(2)
+    assert not any(queues.values())
@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.cluster import Cluster as ClusterModel
+from app.models.cluster_snapshot import ClusterSnapshot
+from app.models.deployment import DeploymentStatus
+from app.models.deployment_event import DeploymentEvent, DeploymentEventKind
+from app.schedulers.cluster_state import ClusterState
+from app.schedulers.factory import create_scheduler
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+
+
+def deployment_in(cluster: ClusterModel, cpu: float, priority: int) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                            gpu_required=0, priority=priority, cluster_id=cluster.id)
+
+
+def logged_events(db: Session):
+    return [(event.deployment_id, event.kind)
+            for event in db.scalars(select(DeploymentEvent).order_by(DeploymentEvent.id))]
+
+
+def view(state: ClusterState):
+    return (sorted(state.running), [entry.id for entry in state.pending.in_order()],
+            (state.cpu_available, state.ram_available, state.gpu_available))
+
+
+def test_decisions_are_logged_in_order(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    low_priority = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=4, priority=1))
+    high_priority = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=4, priority=5))
+    scheduler.update_deployment_status(db, high_priority, DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED))
+
+    assert logged_events(db) == [
+        (low_priority.id, DeploymentEventKind.SUBMITTED),
+        (low_priority.id, DeploymentEventKind.STARTED),
+        (high_priority.id, DeploymentEventKind.SUBMITTED),
+        (low_priority.id, DeploymentEventKind.PREEMPTED),
+        (high_priority.id, DeploymentEventKind.STARTED),
+        (high_priority.id, DeploymentEventKind.COMPLETED),
+        (low_priority.id, DeploymentEventKind.STARTED),
+    ]
+
+
+@pytest.mark.parametrize("policy", ["priority", "backfill", "fair_share"])
+def test_recovery_replays_the_log_after_the_latest_snapshot(db: Session, get_test_cluster: ClusterModel,
+                                                            policy: str):
+    scheduler = create_scheduler(policy, snapshot_interval=5)
+    deployments = [
+        scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=cpu, priority=priority))
+        for cpu, priority in ((2, 1), (1, 3), (2, 2), (3, 5), (1, 1))
+    ]
+    scheduler.schedule_batch(db, {get_test_cluster.id: get_test_cluster},
+                             [deployment_in(get_test_cluster, cpu=1, priority=priority) for priority in (4, 0, 6)])
+    for deployment, status in ((deployments[3], DeploymentStatus.COMPLETED),
+                               (deployments[0], DeploymentStatus.CANCELLED),
+                               (deployments[3], DeploymentStatus.PENDING)):
+        db.refresh(deployment)
+        scheduler.update_deployment_status(db, deployment, DeploymentStatusUpdate(status=status))
+    expected = view(scheduler.cluster_states.get(db, get_test_cluster.id))
+
+    recovered = create_scheduler(policy, snapshot_interval=5)
+    recovered.hydrate(db)
+
+    assert view(recovered.cluster_states.get(db, get_test_cluster.id)) == expected
+    # Older snapshots are dropped, and only the events after the latest one are replayed
+    assert len(logged_events(db)) > 10
+    assert len(db.scalars(select(ClusterSnapshot)).all()) == 1
+    replayed = recovered.events_since_snapshot[get_test_cluster.id]
+    assert replayed < 5 and replayed == scheduler.events_since_snapshot[get_test_cluster.id]
+
+
+def test_recovery_without_snapshot_loads_the_deployments(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    for priority in (1, 2, 3):
+        scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=3, priority=priority))
+    expected = view(scheduler.cluster_states.get(db, get_test_cluster.id))
+
+    recovered = AdvancedScheduler()
+    recovered.hydrate(db)
+
+    assert db.scalars(select(ClusterSnapshot)).first() is None
+    assert view(recovered.cluster_states.get(db, get_test_cluster.id)) == expected
+    assert recovered.events_since_snapshot[get_test_cluster.id] == 0
+
+
+def test_rolled_back_decisions_are_not_logged(db: Session, get_test_cluster: ClusterModel, monkeypatch):
+    scheduler = AdvancedScheduler()
+    monkeypatch.setattr(scheduler, "_swap_versions", lambda db, cluster_ids: 1 / 0)
+    monkeypatch.setattr(scheduler.lock_backend, "optimistic", True)
+    with pytest.raises(ZeroDivisionError):
+        scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, cpu=1, priority=1))
+
+    assert logged_events(db) == []
+    assert scheduler.events_since_snapshot[get_test_cluster.id] == 0
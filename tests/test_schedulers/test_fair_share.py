@@ -0,0 +1,145 @@
+from sqlalchemy.orm import Session
+
+from app.core.units import cpu_units
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import DeploymentStatus
+from app.models.user import User as UserModel
+from app.schedulers.cluster_state import DeploymentEntry
+from app.schedulers.fair_share_queue import FairShareQueue
+from app.schedulers.fair_share_scheduler import FairShareScheduler
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate, DeploymentStatusUpdate
+from tests.conftest import create_user
+
+
+def make_entry(deployment_id: int, owner_id: int, priority: int = 1, cpu: float = 1, gpu: float = 0) -> DeploymentEntry:
+    return DeploymentEntry(id=deployment_id, priority=priority, cpu_required=cpu, ram_required=1,
+                           gpu_required=gpu, owner_id=owner_id)
+
+
+def deployment_in(cluster: ClusterModel, priority: int) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=1, ram_required=1,
+                            gpu_required=0, priority=priority, cluster_id=cluster.id)
+
+
+def test_fair_share_queue_dispatches_the_user_with_the_lowest_dominant_share():
+    queue = FairShareQueue(cpu_limit=10, ram_limit=100, gpu_limit=4)
+    # User 1 holds half of the GPUs, user 2 a fifth of the CPUs
+    queue.started(make_entry(1, owner_id=1, gpu=2))
+    queue.started(make_entry(2, owner_id=2, cpu=2))
+    queue.push(make_entry(3, owner_id=1, priority=10))
+    queue.push(make_entry(4, owner_id=2, priority=1))
+    queue.push(make_entry(5, owner_id=2, priority=5))
+
+    assert queue.dominant_share(1) == 0.5
+    assert queue.dominant_share(2, adding=make_entry(6, owner_id=2, cpu=3)) == 0.5
+    # Within a user, priority still decides
+    assert queue.peek().id == 5
+
+    # Once user 2 runs 6 CPUs, it holds more than user 1
+    queue.started(queue.pop())
+    queue.started(make_entry(7, owner_id=2, cpu=3))
+    assert queue.peek().id == 3
+
+    queue.stopped(make_entry(1, owner_id=1, gpu=2))
+    assert [entry.id for entry in queue.in_order()] == [3, 4]
+    assert queue.pop().id == 3
+    assert queue.pop().id == 4
+    assert not queue and queue.pop() is None
+
+
+def test_fair_share_queue_in_order_replays_the_shares():
+    queue = FairShareQueue(cpu_limit=10, ram_limit=100, gpu_limit=0)
+    for deployment_id in range(1, 4):
+        queue.push(make_entry(deployment_id, owner_id=1, priority=5))
+    queue.push(make_entry(4, owner_id=2, cpu=3))
+    queue.push(make_entry(5, owner_id=2, cpu=3))
+
+    # User 2's first deployment takes 30% of the CPUs, so user 1 catches up before their second one
+    assert [entry.id for entry in queue.in_order()] == [1, 4, 2, 3, 5]
+    assert [entry.id for entry in queue.in_order(limit=2)] == [1, 4]
+    # The queue itself is unchanged
+    assert len(queue) == 5 and queue.remove(2).id == 2 and 2 not in queue
+    assert sorted(queue.ids()) == [1, 3, 4, 5]
+
+
+def test_heavy_user_does_not_starve_the_others(db: Session, get_test_cluster: ClusterModel,
+                                               get_test_user: UserModel):
+    other_user = create_user(db, "other@email.com", "OtherPassword1!", "other")
+    get_test_cluster.fair_share = True
+    db.commit()
+
+    scheduler = FairShareScheduler()
+    # Both users run 2 of the 4 CPUs, then each queues one more deployment
+    running = [scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=10), user_id=user_id)
+               for user_id in (get_test_user.id, get_test_user.id, other_user.id, other_user.id)]
+    urgent = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=10),
+                                user_id=get_test_user.id)
+    modest = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=1),
+                                user_id=other_user.id)
+    assert (urgent.status, modest.status) == (DeploymentStatus.PENDING, DeploymentStatus.PENDING)
+
+    scheduler.update_deployment_status(db, running[2], DeploymentStatusUpdate(status=DeploymentStatus.COMPLETED))
+    db.refresh(urgent)
+    db.refresh(modest)
+
+    # The other user now holds less of the cluster, so their deployment goes first despite its priority
+    assert (urgent.status, modest.status) == (DeploymentStatus.PENDING, DeploymentStatus.RUNNING)
+    assert modest.user_id == other_user.id
+
+
+def test_strict_priority_on_clusters_without_fair_share(db: Session, get_test_cluster: ClusterModel,
+                                                        get_test_user: UserModel):
+    other_user = create_user(db, "other@email.com", "OtherPassword1!", "other")
+    for scheduler in (AdvancedScheduler(), FairShareScheduler()):
+        running = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=5),
+                                     user_id=get_test_user.id)
+        assert running.status == DeploymentStatus.RUNNING
+    assert get_test_cluster.cpu_available == cpu_units(2)
+
+    scheduler = FairShareScheduler()
+    for _ in range(2):
+        scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=5), user_id=get_test_user.id)
+    low = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=1), user_id=other_user.id)
+    assert low.status == DeploymentStatus.PENDING
+
+
+def test_new_user_preempts_the_user_above_their_share(db: Session, get_test_cluster: ClusterModel,
+                                                      get_test_user: UserModel):
+    other_user = create_user(db, "other@email.com", "OtherPassword1!", "other")
+    get_test_cluster.fair_share = True
+    db.commit()
+    scheduler = FairShareScheduler()
+    hogs = [scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=5),
+                               user_id=get_test_user.id) for _ in range(4)]
+
+    # Equal priority does not protect the deployments of a user holding the whole cluster
+    newcomer = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=5),
+                                  user_id=other_user.id)
+
+    assert newcomer.status == DeploymentStatus.RUNNING
+    for hog in hogs:
+        db.refresh(hog)
+    assert [hog.status for hog in hogs].count(DeploymentStatus.PENDING) == 1
+    assert get_test_cluster.cpu_available == 0
+
+
+def test_shares_do_not_preempt_higher_priority_deployments(db: Session, get_test_cluster: ClusterModel,
+                                                          get_test_user: UserModel):
+    other_user = create_user(db, "other@email.com", "OtherPassword1!", "other")
+    get_test_cluster.fair_share = True
+    db.commit()
+    scheduler = FairShareScheduler()
+    hogs = [scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=priority),
+                               user_id=get_test_user.id) for priority in (10, 10, 10, 1)]
+
+    newcomer = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=5),
+                                  user_id=other_user.id)
+    urgent = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster, priority=5),
+                                user_id=other_user.id)
+
+    # Only the heavy user's low priority deployment could make room
+    assert (newcomer.status, urgent.status) == (DeploymentStatus.RUNNING, DeploymentStatus.PENDING)
+    for hog in hogs:
+        db.refresh(hog)
+    assert [hog.status for hog in hogs] == [DeploymentStatus.RUNNING] * 3 + [DeploymentStatus.PENDING]
@@ -0,0 +1,147 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import DeploymentStatus
+from app.schedulers.factory import create_scheduler
+from app.schedulers.locking import (ClusterVersionConflict, InProcessLockBackend, OptimisticLockBackend,
+                                    PostgresAdvisoryLockBackend, PostgresRowLockBackend, create_lock_backend)
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate
+
+
+class SharedLockBackend(InProcessLockBackend):
+    """
+    In-process stand-in for a database lock: shared by several schedulers acting as separate workers.
+    """
+    distributed = True
+
+
+def test_create_lock_backend():
+    assert isinstance(create_lock_backend("local"), InProcessLockBackend)
+    assert isinstance(create_lock_backend("postgres_advisory"), PostgresAdvisoryLockBackend)
+    assert isinstance(create_lock_backend("postgres_row"), PostgresRowLockBackend)
+    assert isinstance(create_lock_backend("optimistic"), OptimisticLockBackend)
+    assert isinstance(create_scheduler("priority", "postgres_row").lock_backend, PostgresRowLockBackend)
+    with pytest.raises(ValueError):
+        create_lock_backend("zookeeper")
+
+
+def test_distributed_backend_sees_other_workers_decisions():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_factory() as db:
+        cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                               gpu_limit=0, cpu_available=cpu_units(4), ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        db.commit()
+        cluster_id = cluster.id
+
+    backend = SharedLockBackend()
+    workers = [AdvancedScheduler(lock_backend=backend), AdvancedScheduler(lock_backend=backend)]
+    deployment_in = DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=3, ram_required=1,
+                                     gpu_required=0, priority=1, cluster_id=cluster_id)
+    statuses = []
+    for scheduler in workers:
+        with session_factory() as db:
+            deployment = scheduler.schedule(db, db.get(ClusterModel, cluster_id), deployment_in)
+            statuses.append(deployment.status)
+
+    # The second worker reloaded the cluster under the lock instead of trusting its stale copy
+    assert statuses == [DeploymentStatus.RUNNING, DeploymentStatus.PENDING]
+    with session_factory() as db:
+        assert db.get(ClusterModel, cluster_id).cpu_available == cpu_units(1)
+    engine.dispose()
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """
+    Sessions on a file database, each with its own connection, so concurrent workers can be interleaved.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'optimistic.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def interleave_after_load(scheduler, other_worker):
+    """
+    Run `other_worker` right after `scheduler` loads a cluster the first time, i.e. between its read and its commit.
+    """
+    load = scheduler.cluster_states.load
+    pending = [other_worker]
+
+    def load_then_interleave(db, cluster_id):
+        state = load(db, cluster_id)
+        if pending:
+            pending.pop()()
+        return state
+
+    scheduler.cluster_states.load = load_then_interleave
+
+
+def test_optimistic_backend_retries_on_conflict(file_session_factory):
+    with file_session_factory() as db:
+        cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                               gpu_limit=0, cpu_available=cpu_units(4), ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        db.commit()
+        cluster_id = cluster.id
+
+    deployment_in = DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=3, ram_required=1,
+                                     gpu_required=0, priority=1, cluster_id=cluster_id)
+    first, second = AdvancedScheduler(OptimisticLockBackend()), AdvancedScheduler(OptimisticLockBackend())
+
+    def first_worker_schedules():
+        with file_session_factory() as other_db:
+            first.schedule(other_db, other_db.get(ClusterModel, cluster_id), deployment_in)
+
+    interleave_after_load(second, first_worker_schedules)
+    conflicts_before = REGISTRY.get_sample_value("scheduler_cluster_version_conflicts_total",
+                                                 {"cluster_id": str(cluster_id)}) or 0
+    with file_session_factory() as db:
+        deployment = second.schedule(db, db.get(ClusterModel, cluster_id), deployment_in)
+        # The first attempt was based on an idle cluster; the retry saw the other worker's deployment
+        assert deployment.status == DeploymentStatus.PENDING
+
+    conflicts = REGISTRY.get_sample_value("scheduler_cluster_version_conflicts_total", {"cluster_id": str(cluster_id)})
+    assert conflicts == conflicts_before + 1
+    with file_session_factory() as db:
+        cluster = db.get(ClusterModel, cluster_id)
+        assert cluster.cpu_available == cpu_units(1)
+        assert cluster.version == 2
+
+
+def test_optimistic_backend_gives_up_after_max_retries(file_session_factory):
+    with file_session_factory() as db:
+        cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                               gpu_limit=0, cpu_available=cpu_units(4), ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        db.commit()
+        cluster_id = cluster.id
+
+    scheduler = AdvancedScheduler(OptimisticLockBackend(max_retries=2, base_delay=0))
+    load = scheduler.cluster_states.load
+
+    def load_stale_version(db, cluster_id):
+        state = load(db, cluster_id)
+        state.version -= 1
+        return state
+
+    scheduler.cluster_states.load = load_stale_version
+    deployment_in = DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=1, ram_required=1,
+                                     gpu_required=0, priority=1, cluster_id=cluster_id)
+    with file_session_factory() as db:
+        with pytest.raises(ClusterVersionConflict):
+            scheduler.schedule(db, db.get(ClusterModel, cluster_id), deployment_in)
+
+    # Nothing of the failed decision was committed
+    with file_session_factory() as db:
+        assert db.get(ClusterModel, cluster_id).cpu_available == cpu_units(4)
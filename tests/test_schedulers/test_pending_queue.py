@@ -0,0 +1,33 @@
+from app.schedulers.cluster_state import DeploymentEntry
+from app.schedulers.pending_queue import PendingQueue
+
+
+def make_entry(deployment_id: int, priority: int) -> DeploymentEntry:
+    return DeploymentEntry(id=deployment_id, priority=priority, cpu_required=1, ram_required=1, gpu_required=0)
+
+
+def test_pending_queue_orders_by_priority_then_fifo():
+    queue = PendingQueue()
+    for deployment_id, priority in [(1, 1), (2, 5), (3, 1), (4, 5)]:
+        queue.push(make_entry(deployment_id, priority))
+
+    assert [entry.id for entry in queue.in_order()] == [2, 4, 1, 3]
+    assert [queue.pop().id for _ in range(4)] == [2, 4, 1, 3]
+    assert queue.pop() is None
+
+
+def test_pending_queue_skips_removed_entries():
+    queue = PendingQueue()
+    for deployment_id in range(1, 4):
+        queue.push(make_entry(deployment_id, priority=deployment_id))
+
+    queue.remove(3)
+
+    assert 3 not in queue
+    assert len(queue) == 2
+    assert queue.peek().id == 2
+
+    # Re-queueing a deployment moves it behind deployments of the same priority
+    queue.push(make_entry(4, priority=2))
+    queue.push(make_entry(2, priority=2))
+    assert [queue.pop().id for _ in range(3)] == [4, 2, 1]
@@ -0,0 +1,120 @@
+import random
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import DeploymentStatus
+from app.schedulers.cluster_state import ClusterState, ClusterStateStore, DeploymentEntry
+from app.schedulers.placement import (PLACEMENT_STRATEGIES, VECTORIZED_PLACEMENT_MIN_CLUSTERS, choose_cluster,
+                                      choose_cluster_vectorized, get_placement_strategy)
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate
+from tests.conftest import create_cluster
+
+
+def make_state(cluster_id: int, available=(8, 32, 4), limits=(8, 32, 4)) -> ClusterState:
+    return ClusterState(id=cluster_id, organization_id=1, cpu_limit=limits[0], ram_limit=limits[1],
+                        gpu_limit=limits[2], cpu_available=available[0], ram_available=available[1],
+                        gpu_available=available[2])
+
+
+def make_entry(cpu: float, ram: float = 0, gpu: float = 0) -> DeploymentEntry:
+    return DeploymentEntry(id=100, priority=1, cpu_required=cpu, ram_required=ram, gpu_required=gpu)
+
+
+def deployment_in(cpu: float, priority: int = 1) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                            gpu_required=0, priority=priority)
+
+
+def test_best_fit_picks_the_tightest_cluster_and_worst_fit_the_emptiest():
+    states = [make_state(1, available=(6, 32, 4)), make_state(2, available=(3, 32, 4)), make_state(3)]
+
+    assert choose_cluster(states, make_entry(cpu=2), PLACEMENT_STRATEGIES["best_fit"]) == (states[1], True)
+    assert choose_cluster(states, make_entry(cpu=2), PLACEMENT_STRATEGIES["worst_fit"]) == (states[2], True)
+    # Too large for the tightest cluster, so best fit moves to the next one
+    assert choose_cluster(states, make_entry(cpu=4), PLACEMENT_STRATEGIES["best_fit"]) == (states[0], True)
+
+
+def test_drf_balances_the_dominant_resource():
+    # Cluster 1 has the most free resources overall, but its GPUs are almost all used
+    states = [make_state(1, available=(8, 32, 1)), make_state(2, available=(4, 16, 3))]
+
+    assert choose_cluster(states, make_entry(cpu=1, gpu=1), PLACEMENT_STRATEGIES["worst_fit"])[0] is states[0]
+    assert choose_cluster(states, make_entry(cpu=1, gpu=1), PLACEMENT_STRATEGIES["drf"])[0] is states[1]
+
+
+def test_falls_back_to_the_least_loaded_cluster_large_enough():
+    full = make_state(1, available=(0, 0, 0))
+    busy = make_state(2, available=(1, 32, 4))
+    small = make_state(3, available=(2, 8, 1), limits=(2, 8, 1))
+    full.enqueue(make_entry(cpu=1))
+    busy.enqueue(make_entry(cpu=1))
+    busy.enqueue(DeploymentEntry(id=101, priority=1, cpu_required=1, ram_required=0, gpu_required=0))
+
+    assert choose_cluster([full, busy, small], make_entry(cpu=4), PLACEMENT_STRATEGIES["best_fit"]) == (full, False)
+    assert choose_cluster([full, busy, small], make_entry(cpu=16), PLACEMENT_STRATEGIES["best_fit"]) == (None, False)
+
+
+def test_unknown_placement_strategy():
+    with pytest.raises(ValueError):
+        get_placement_strategy("random")
+
+
+def test_schedule_in_organization(db: Session, get_test_cluster: ClusterModel):
+    # The test cluster has 4 CPUs, the other one 8
+    large = create_cluster(db, get_test_cluster.organization_id, "large", 8, 16, 2)
+    scheduler = AdvancedScheduler(placement_strategy="best_fit")
+
+    first = scheduler.schedule_in_organization(db, get_test_cluster.organization_id, deployment_in(cpu=3))
+    second = scheduler.schedule_in_organization(db, get_test_cluster.organization_id, deployment_in(cpu=3))
+    third = scheduler.schedule_in_organization(db, get_test_cluster.organization_id, deployment_in(cpu=6))
+
+    assert (first.cluster_id, first.status) == (get_test_cluster.id, DeploymentStatus.RUNNING)
+    assert (second.cluster_id, second.status) == (large.id, DeploymentStatus.RUNNING)
+    # Neither cluster has room left, so it waits on the large cluster, the only one it can ever run on
+    assert (third.cluster_id, third.status) == (large.id, DeploymentStatus.PENDING)
+    assert scheduler.schedule_in_organization(db, get_test_cluster.organization_id, deployment_in(cpu=9)) is None
+
+
+def test_place_rechecks_capacity_under_the_lock(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    cluster_id, has_room = scheduler.choose_cluster(db, get_test_cluster.organization_id, deployment_in(cpu=3))
+    assert (cluster_id, has_room) == (get_test_cluster.id, True)
+
+    # Another decision takes the room before the lock is acquired
+    scheduler.place(db, cluster_id, deployment_in(cpu=2))
+
+    assert scheduler.place(db, cluster_id, deployment_in(cpu=3), require_capacity=True) is None
+    assert scheduler.place(db, cluster_id, deployment_in(cpu=3)).status == DeploymentStatus.PENDING
+
+
+@pytest.mark.parametrize("strategy", sorted(PLACEMENT_STRATEGIES))
+def test_vectorized_choice_matches_scalar_choice(strategy: str):
+    rng = random.Random(7)
+    store = ClusterStateStore()
+    states = []
+    for cluster_id in range(200):
+        limits = (rng.choice([8000, 16000, 64000]), rng.choice([32768, 65536, 262144]), rng.choice([0, 2000, 8000]))
+        state = make_state(cluster_id, available=tuple(rng.randint(0, limit) for limit in limits), limits=limits)
+        store.put(state)
+        states.append(state)
+
+    columns = store.matrix.columns(state.id for state in states)
+    for _ in range(100):
+        entry = make_entry(cpu=rng.randint(0, 16000), ram=rng.randint(0, 65536), gpu=rng.choice([0, 0, 1000, 4000]))
+        position, has_room = choose_cluster_vectorized(store.matrix, columns, entry, PLACEMENT_STRATEGIES[strategy])
+        chosen = states[position] if position is not None else None
+        assert (chosen, has_room) == choose_cluster(states, entry, PLACEMENT_STRATEGIES[strategy])
+
+
+def test_choose_cluster_among_many_clusters(db: Session, get_test_cluster: ClusterModel):
+    organization_id = get_test_cluster.organization_id
+    clusters = [create_cluster(db, organization_id, f"cluster-{index}", 4 + index % 8, 16, 2)
+                for index in range(VECTORIZED_PLACEMENT_MIN_CLUSTERS)]
+    scheduler = AdvancedScheduler(placement_strategy="worst_fit")
+
+    # The first of the largest clusters wins, like with the scalar pass
+    assert scheduler.choose_cluster(db, organization_id, deployment_in(cpu=2)) == (clusters[7].id, True)
+    assert scheduler.choose_cluster(db, organization_id, deployment_in(cpu=100)) == (None, False)
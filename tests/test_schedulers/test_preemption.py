@@ -0,0 +1,90 @@
+import random
+
+from sqlalchemy.orm import Session
+
+from app.core.units import cpu_units
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import DeploymentStatus
+from app.schedulers.cluster_state import ClusterState, DeploymentEntry
+from app.schedulers.preemption import eviction_cost, select_victims
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate
+
+
+def make_state(available=(0, 0, 0), limits=(8, 32, 4)) -> ClusterState:
+    return ClusterState(id=1, organization_id=1, cpu_limit=limits[0], ram_limit=limits[1], gpu_limit=limits[2],
+                        cpu_available=available[0], ram_available=available[1], gpu_available=available[2])
+
+
+def make_entry(deployment_id: int, priority: int, cpu: float, ram: float = 0, gpu: float = 0) -> DeploymentEntry:
+    return DeploymentEntry(id=deployment_id, priority=priority, cpu_required=cpu, ram_required=ram, gpu_required=gpu)
+
+
+def test_select_victims_combines_several_deployments():
+    state = make_state(available=(1, 8, 0))
+    candidates = [make_entry(1, priority=1, cpu=2), make_entry(2, priority=1, cpu=2), make_entry(3, priority=1, cpu=1)]
+
+    victims = select_victims(make_entry(10, priority=5, cpu=5), state, candidates)
+
+    assert sorted(victim.id for victim in victims) == [1, 2]
+
+
+def test_select_victims_prefers_cheaper_evictions():
+    state = make_state(available=(0, 8, 0))
+    # Either the two low priority deployments or the single higher priority one frees 2 CPUs
+    candidates = [make_entry(1, priority=0, cpu=1), make_entry(2, priority=0, cpu=1), make_entry(3, priority=4, cpu=2)]
+
+    victims = select_victims(make_entry(10, priority=5, cpu=2), state, candidates)
+
+    assert sorted(victim.id for victim in victims) == [1, 2]
+    assert sum(eviction_cost(victim, state) for victim in victims) < eviction_cost(candidates[2], state)
+
+
+def test_select_victims_prefers_evicting_smaller_deployments():
+    state = make_state(available=(0, 8, 0))
+    # Same priority and both free the missing CPU, but evicting the first one also gives up all the GPUs
+    candidates = [make_entry(1, priority=1, cpu=1, gpu=4), make_entry(2, priority=1, cpu=1)]
+
+    victims = select_victims(make_entry(10, priority=5, cpu=1), state, candidates)
+
+    assert [victim.id for victim in victims] == [2]
+    assert eviction_cost(candidates[1], state) < eviction_cost(candidates[0], state)
+
+
+def test_select_victims_covers_every_dimension_or_gives_up():
+    state = make_state(available=(4, 0, 0))
+    candidates = [make_entry(1, priority=1, cpu=0, ram=8), make_entry(2, priority=1, cpu=0, ram=0, gpu=1)]
+
+    victims = select_victims(make_entry(10, priority=5, cpu=1, ram=4, gpu=1), state, candidates)
+    assert sorted(victim.id for victim in victims) == [1, 2]
+
+    assert select_victims(make_entry(11, priority=5, cpu=1, ram=4, gpu=2), state, candidates) is None
+
+
+def test_select_victims_scales_to_hundreds_of_deployments():
+    rng = random.Random(42)
+    state = make_state(available=(0, 0, 0), limits=(512.0, 2048.0, 64.0))
+    candidates = [make_entry(i, priority=rng.randint(0, 4), cpu=rng.uniform(0.5, 4), ram=rng.uniform(1, 16),
+                             gpu=rng.choice([0, 0, 1])) for i in range(500)]
+
+    required = make_entry(1000, priority=5, cpu=10, ram=40, gpu=3)
+    victims = select_victims(required, state, candidates)
+
+    assert sum(victim.cpu_required for victim in victims) >= 10
+    assert sum(victim.ram_required for victim in victims) >= 40
+    assert sum(victim.gpu_required for victim in victims) >= 3
+
+
+def test_schedule_preempts_several_lower_priority_deployments(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+
+    def deployment_in(cpu: float, priority: int) -> DeploymentCreate:
+        return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                                gpu_required=0, priority=priority, cluster_id=get_test_cluster.id)
+
+    low_priority = [scheduler.schedule(db, get_test_cluster, deployment_in(cpu=2, priority=1)) for _ in range(2)]
+    high_priority = scheduler.schedule(db, get_test_cluster, deployment_in(cpu=3, priority=5))
+
+    assert high_priority.status == DeploymentStatus.RUNNING
+    assert [deployment.status for deployment in low_priority] == [DeploymentStatus.PENDING] * 2
+    assert get_test_cluster.cpu_available == cpu_units(1)
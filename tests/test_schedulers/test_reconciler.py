@@ -0,0 +1,159 @@
+import asyncio
+
+from prometheus_client import REGISTRY
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.core.units import cpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers.async_scheduler import AsyncScheduler
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate
+
+
+def deployment_in(cluster_id: int, cpu: float, priority: int = 1) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                            gpu_required=0, priority=priority, cluster_id=cluster_id)
+
+
+def corrections(cluster_id: int) -> float:
+    return REGISTRY.get_sample_value("scheduler_capacity_corrections_total", {"cluster_id": str(cluster_id)}) or 0
+
+
+def test_drifted_capacity_is_corrected(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    for cpu in (1, 1.5):
+        scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster.id, cpu))
+    assert scheduler.take_dirty_clusters() == {get_test_cluster.id}
+
+    # Both the row and the in-memory state lost half a CPU
+    state = scheduler.cluster_states.get(db, get_test_cluster.id)
+    state.reset_capacity(cpu_units(1), state.ram_available, state.gpu_available)
+    state.copy_capacity_to(get_test_cluster)
+    db.commit()
+    before = corrections(get_test_cluster.id)
+
+    assert scheduler.drifted_clusters(db, [get_test_cluster.id]) == [get_test_cluster.id]
+    assert scheduler.reconcile_cluster(db, get_test_cluster.id)
+
+    db.refresh(get_test_cluster)
+    assert get_test_cluster.cpu_available == state.cpu_available == cpu_units(1.5)
+    assert get_test_cluster.ram_available == state.ram_available == ram_units(14)
+    assert corrections(get_test_cluster.id) == before + 1
+    # Checking a cluster does not mark it dirty again, and a consistent cluster is left alone
+    assert scheduler.take_dirty_clusters() == set()
+    assert scheduler.drifted_clusters(db, [get_test_cluster.id]) == []
+    assert not scheduler.reconcile_cluster(db, get_test_cluster.id)
+
+
+def test_missed_release_is_reconciled(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    running = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster.id, cpu=4))
+    queued = scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster.id, cpu=2))
+    # The deployment stopped without the scheduler releasing its resources
+    db.execute(update(DeploymentModel).where(DeploymentModel.id == running.id).values(status=DeploymentStatus.FAILED))
+    db.commit()
+
+    assert scheduler.drifted_clusters(db, scheduler.take_dirty_clusters()) == [get_test_cluster.id]
+    assert scheduler.reconcile_cluster(db, get_test_cluster.id)
+
+    # The freed resources went to the queued deployment
+    state = scheduler.cluster_states.get(db, get_test_cluster.id)
+    db.refresh(queued)
+    assert queued.status == DeploymentStatus.RUNNING
+    assert list(state.running) == [queued.id] and state.cpu_available == cpu_units(2)
+
+
+def test_corrections_survive_recovery_from_snapshots(db: Session, get_test_cluster: ClusterModel):
+    scheduler = AdvancedScheduler(snapshot_interval=1)
+    scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster.id, cpu=1))
+    # The in-memory state lost a CPU, then a decision snapshotted it
+    state = scheduler.cluster_states.get(db, get_test_cluster.id)
+    state.reset_capacity(state.cpu_available - cpu_units(1), state.ram_available, state.gpu_available)
+    scheduler.schedule(db, get_test_cluster, deployment_in(get_test_cluster.id, cpu=1))
+
+    assert scheduler.reconcile_cluster(db, get_test_cluster.id)
+
+    recovered = AdvancedScheduler(snapshot_interval=1)
+    recovered.hydrate(db)
+    assert recovered.cluster_states.get(db, get_test_cluster.id).cpu_available == state.cpu_available == cpu_units(2)
+
+
+async def reconcile_dirty_clusters(database_url: str):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async with session_factory() as db:
+        clusters = [ClusterModel(name=f"cluster-{index}", organization_id=1, cpu_limit=cpu_units(4),
+                                 ram_limit=ram_units(16), gpu_limit=0, cpu_available=cpu_units(4),
+                                 ram_available=ram_units(16), gpu_available=0) for index in range(3)]
+        db.add_all(clusters)
+        await db.commit()
+        cluster_ids = [cluster.id for cluster in clusters]
+
+    scheduler = AsyncScheduler(AdvancedScheduler())
+    async with session_factory() as db:
+        for cluster_id in cluster_ids[:2]:
+            await scheduler.schedule(db, await db.get(ClusterModel, cluster_id), deployment_in(cluster_id, cpu=1))
+        # Only the second cluster drifts
+        await db.execute(update(ClusterModel).where(ClusterModel.id == cluster_ids[1]).values(cpu_available=0))
+        await db.commit()
+
+    async with session_factory() as db:
+        first_pass = await scheduler.reconcile_capacity(db)
+        second_pass = await scheduler.reconcile_capacity(db)
+        cpu_available = (await db.get(ClusterModel, cluster_ids[1], populate_existing=True)).cpu_available
+    await engine.dispose()
+    return cluster_ids, first_pass, second_pass, cpu_available
+
+
+def test_reconciler_passes_only_correct_drifted_clusters(tmp_path):
+    cluster_ids, first_pass, second_pass, cpu_available = asyncio.run(
+        reconcile_dirty_clusters(f"sqlite+aiosqlite:///{tmp_path / 'reconcile.db'}")
+    )
+
+    assert first_pass == [cluster_ids[1]]
+    assert second_pass == []
+    assert cpu_available == cpu_units(3)
+
+
+async def reconcile_after_failure(database_url: str):
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async with session_factory() as db:
+        cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                               gpu_limit=0, cpu_available=0, ram_available=ram_units(16), gpu_available=0)
+        db.add(cluster)
+        await db.commit()
+
+    scheduler = AsyncScheduler(AdvancedScheduler())
+    scheduler.scheduler.mark_dirty_clusters([cluster.id])
+    reconcile_cluster = scheduler.scheduler.reconcile_cluster
+
+    def fail_once(db, cluster_id):
+        scheduler.scheduler.reconcile_cluster = reconcile_cluster
+        raise RuntimeError("database unavailable")
+
+    scheduler.scheduler.reconcile_cluster = fail_once
+    async with session_factory() as db:
+        try:
+            await scheduler.reconcile_capacity(db)
+        except RuntimeError:
+            pass
+        retried = await scheduler.reconcile_capacity(db)
+    await engine.dispose()
+    return cluster.id, retried
+
+
+def test_failed_reconciliation_is_retried_by_the_next_pass(tmp_path):
+    cluster_id, retried = asyncio.run(reconcile_after_failure(f"sqlite+aiosqlite:///{tmp_path / 'reconcile.db'}"))
+
+    assert retried == [cluster_id]
@@ -0,0 +1,79 @@
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
+
+from app.core.units import cpu_units, gpu_units, ram_units
+from app.db.base import Base
+from app.models.cluster import Cluster as ClusterModel
+from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
+from app.schedulers import priority_preemption_scheduler
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from app.schemas.deployment import DeploymentCreate
+
+
+@pytest.fixture
+def isolated_db() -> Generator:
+    """
+    Fixture providing a session on its own in-memory database, so tests can observe real commits and rollbacks.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def isolated_cluster(isolated_db: Session) -> ClusterModel:
+    cluster = ClusterModel(name="cluster", organization_id=1, cpu_limit=cpu_units(4), ram_limit=ram_units(16),
+                           gpu_limit=gpu_units(2), cpu_available=cpu_units(4), ram_available=ram_units(16),
+                           gpu_available=gpu_units(2))
+    isolated_db.add(cluster)
+    isolated_db.commit()
+    return cluster
+
+
+def deployment_in(cluster: ClusterModel, cpu: float, priority: int) -> DeploymentCreate:
+    return DeploymentCreate(name="deployment", docker_image="my_image", cpu_required=cpu, ram_required=1,
+                            gpu_required=0, priority=priority, cluster_id=cluster.id)
+
+
+def test_preemption_is_committed_once(isolated_db: Session, isolated_cluster: ClusterModel):
+    scheduler = AdvancedScheduler()
+    for _ in range(2):
+        scheduler.schedule(isolated_db, isolated_cluster, deployment_in(isolated_cluster, cpu=2, priority=1))
+
+    commits = []
+    event.listen(isolated_db, "after_commit", lambda session: commits.append(session))
+    scheduler.schedule(isolated_db, isolated_cluster, deployment_in(isolated_cluster, cpu=4, priority=5))
+
+    assert len(commits) == 1
+
+
+def test_failed_decision_is_rolled_back(isolated_db: Session, isolated_cluster: ClusterModel, monkeypatch):
+    scheduler = AdvancedScheduler()
+    low_priority = scheduler.schedule(isolated_db, isolated_cluster, deployment_in(isolated_cluster, cpu=4, priority=1))
+
+    def failing_allocation(*args, **kwargs):
+        raise RuntimeError("allocation failed")
+
+    # Fail after the victim was released but before the new deployment got its resources
+    monkeypatch.setattr(priority_preemption_scheduler, "_allocate_resources", failing_allocation)
+    with pytest.raises(RuntimeError):
+        scheduler.schedule(isolated_db, isolated_cluster, deployment_in(isolated_cluster, cpu=4, priority=5))
+
+    isolated_db.expire_all()
+    assert isolated_db.query(DeploymentModel).count() == 1
+    assert isolated_db.get(DeploymentModel, low_priority.id).status == DeploymentStatus.RUNNING
+    assert isolated_cluster.cpu_available == 0
+
+    # The in-memory state is reloaded from the database instead of keeping the half-applied decision
+    state = scheduler.cluster_states.get(isolated_db, isolated_cluster.id)
+    assert set(state.running) == {low_priority.id}
+    assert state.cpu_available == 0
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from app.schedulers.backfill_scheduler import BackfillScheduler
+from app.schedulers.priority_preemption_scheduler import AdvancedScheduler
+from benchmarks.simulation import ClusterSpec, Simulator, TraceJob, load_trace, save_trace, synthetic_trace
+
+
+def test_simulation_completes_every_deployment_deterministically():
+    trace = synthetic_trace(150, random.Random(3), mean_interarrival=2)
+    clusters = [ClusterSpec(16, 64, 2), ClusterSpec(32, 128, 4)]
+
+    first = Simulator(AdvancedScheduler(), clusters).run(trace)
+    second = Simulator(AdvancedScheduler(), clusters).run(trace)
+
+    assert (first.rejected, first.unfinished) == (0, 0)
+    assert first.decisions == 300
+    assert len(first.waits) == 150
+    assert all(0 < utilization <= 1 for utilization in first.utilization)
+    assert sum(stats.deployments for stats in first.tenants.values()) == 150
+    # Only the wall clock time of the decisions differs between replays
+    assert (first.waits, first.preemptions, first.makespan) == (second.waits, second.preemptions, second.makespan)
+
+
+def test_simulation_counts_preemptions_and_restarts():
+    trace = [
+        TraceJob(arrival=0, duration=10, priority=1, cpu=4, ram=1, gpu=0, tenant="low", cluster=0),
+        TraceJob(arrival=5, duration=10, priority=5, cpu=4, ram=1, gpu=0, tenant="high", cluster=0),
+        TraceJob(arrival=6, duration=1, priority=1, cpu=8, ram=1, gpu=0, tenant="low", cluster=0),
+    ]
+
+    report = Simulator(AdvancedScheduler(), [ClusterSpec(4, 16, 0)]).run(trace)
+
+    # The low priority deployment is preempted at 5 and starts over at 15; the oversized one never runs
+    assert report.preemptions == 1
+    assert report.waits == [0, 0]
+    assert report.makespan == 25
+    assert (report.rejected, report.unfinished) == (0, 1)
+    # The CPUs were busy all along, including the 5 time units lost to the preemption
+    assert report.utilization[0] == pytest.approx(1)
+
+
+def test_placed_deployments_too_large_for_every_cluster_are_rejected():
+    trace = [TraceJob(arrival=0, duration=1, priority=1, cpu=64, ram=1, gpu=0)]
+
+    report = Simulator(BackfillScheduler(), [ClusterSpec(4, 16, 0)]).run(trace)
+
+    assert (report.rejected, report.decisions, report.waits) == (1, 1, [])
+
+
+@pytest.mark.parametrize("file_name", ["trace.csv", "trace.jsonl"])
+def test_trace_round_trip(tmp_path, file_name: str):
+    trace = synthetic_trace(20, random.Random(1), clusters=3) + synthetic_trace(5, random.Random(2))
+    path = str(tmp_path / file_name)
+
+    save_trace(path, trace)
+
+    assert load_trace(path) == trace